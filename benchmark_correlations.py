@@ -0,0 +1,185 @@
+"""
+  What: Benchmark the correlation sheets on a synthetic estate.
+  Why:  Compares the loop-based builders in newrelic_data_exporter with the
+        SQLite inventory joins, and checks that both engines produce exactly
+        the same rows. Also
+        times issuesFilter parsing (workflow_filters) cold and cached, and
+        checks the extracted policy IDs against the ones the estate was
+        generated with (mixed EXACTLY_MATCHES / CONTAINS / IN / EQUAL
+        predicates plus DOES_NOT_EXACTLY_MATCH exclusions and exclusion-only
+        DOES_NOT_EQUAL filters).
+
+Usage:
+  python benchmark_correlations.py                      # 10k policies, 50k conditions
+  python benchmark_correlations.py --policies 2000 --conditions 10000 --repeat 3
+No API key or network access is needed; nothing is fetched from New Relic.
+"""
+import argparse
+import random
+import time
+
+import inventory_db
+import newrelic_data_exporter as exporter
+import workflow_filters
+
+
+def synthetic_estate(n_accounts, n_policies, n_conditions, n_workflows, n_channels, n_legacy, seed=7):
+    rnd = random.Random(seed)
+    accounts = [str(1000000 + i) for i in range(n_accounts)]
+    policies = [
+        {'accountId': accounts[i % n_accounts], 'id': str(500000 + i), 'name': f'policy-{i}',
+         'incidentPreference': rnd.choice(['PER_POLICY', 'PER_CONDITION', 'PER_CONDITION_AND_TARGET'])}
+        for i in range(n_policies)
+    ]
+    conditions = []
+    for i in range(n_conditions):
+        p = rnd.choice(policies)
+        conditions.append({'accountId': p['accountId'], 'id': str(900000 + i), 'name': f'condition-{i}',
+                           'policyId': int(p['id']), 'type': rnd.choice(['STATIC', 'BASELINE'])})
+    channels = [
+        {'accountId': accounts[i % n_accounts], 'id': f'chan-{i}', 'name': f'channel-{i}',
+         'type': rnd.choice(['EMAIL', 'SLACK', 'WEBHOOK', 'PAGERDUTY_SERVICE_INTEGRATION'])}
+        for i in range(n_channels)
+    ]
+    by_account = {}
+    for p in policies:
+        by_account.setdefault(p['accountId'], []).append(p)
+    channels_by_account = {}
+    for ch in channels:
+        channels_by_account.setdefault(ch['accountId'], []).append(ch)
+    workflows = []
+    expected_policy_ids = {}
+    for i in range(n_workflows):
+        acct = accounts[i % n_accounts]
+        pids = [p['id'] for p in rnd.sample(by_account[acct], rnd.randint(0, 3))]
+        dests = [{'channelId': ch['id'], 'name': ch['name'], 'type': ch['type'], 'notificationTriggers': ['ACTIVATED']}
+                 for ch in rnd.sample(channels_by_account[acct], rnd.randint(0, 3))]
+        predicates = []
+        if pids:
+            # Spread the IDs over the operators NerdGraph emits, plus an exclusion of an unrelated ID
+            op = rnd.choice(['EXACTLY_MATCHES', 'CONTAINS', 'IN', 'EQUAL'])
+            values = pids if op != 'CONTAINS' else [','.join(pids)]
+            predicates.append({'attribute': 'labels.policyIds', 'operator': op, 'values': values})
+            predicates.append({'attribute': 'labels.policyIds', 'operator': 'DOES_NOT_EXACTLY_MATCH',
+                               'values': [str(400000 + i)]})
+        elif i % 5 == 0:
+            # Exclusion-only filter: routes every policy but one, flagged as Excludes Only
+            predicates.append({'attribute': 'labels.policyIds', 'operator': 'DOES_NOT_EQUAL',
+                               'values': [str(400000 + i)]})
+        predicates.append({'attribute': 'priority', 'operator': 'EQUAL', 'values': ['CRITICAL']})
+        workflows.append({'accountId': acct, 'id': f'wf-{i}', 'name': f'workflow-{i}', 'workflowEnabled': bool(i % 4),
+                          'destinationsEnabled': True, 'destinationConfigurations': dests,
+                          'issuesFilter': {'name': 'filter', 'type': 'FILTER', 'predicates': predicates}})
+        expected_policy_ids[(acct, f'wf-{i}')] = set(pids)
+    legacy = []
+    for i in range(n_legacy):
+        acct = accounts[i % n_accounts]
+        assoc = [{'id': p['id'], 'name': p['name']} for p in rnd.sample(by_account[acct], rnd.randint(0, 4))]
+        legacy.append({'accountId': acct, 'id': 700000 + i, 'name': f'legacy-{i}', 'type': 'EMAIL',
+                       'associatedPolicies': {'policies': assoc}})
+    return (accounts, policies, conditions, workflows, channels, legacy), expected_policy_ids
+
+
+COLLECTIONS = ('policies', 'alert_conditions', 'workflows', 'notification_channels_ai', 'notification_channels_legacy')
+
+
+def load_store(accounts, *collections):
+    """
+    Seed the exporter's per-run EntityStore so its loaders never hit the network.
+    Returns the estate re-read through the store, i.e. in account order as the exporter sees it.
+    """
+    exporter.STORE.clear()
+    for collection, items in zip(COLLECTIONS, collections):
+        grouped = {a: [] for a in accounts}
+        for item in items:
+            grouped[item['accountId']].append(item)
+        for account_id, rows in grouped.items():
+            exporter.STORE.put(collection, account_id, rows)
+    return (accounts,) + tuple(exporter.collect_per_account(c, accounts) for c in COLLECTIONS)
+
+
+def run_python(accounts, policies, conditions, workflows, channels, legacy):
+    return (
+        exporter.correlate_workflows_to_policies(accounts),
+        exporter.correlate_legacy_channels_to_policies(accounts),
+        list(exporter.iter_policy_condition_workflow_map(accounts, policies, conditions, workflows, channels)),
+    )
+
+
+def run_sqlite(accounts, policies, conditions, workflows, channels, legacy):
+    inventory = inventory_db.InventoryDB(':memory:')
+    inventory.clear_accounts(accounts)
+    inventory.upsert_policies(policies)
+    inventory.upsert_conditions(conditions)
+    inventory.upsert_channels(channels)
+    inventory.upsert_legacy_channels(legacy)
+    inventory.upsert_workflows(workflows, exporter.WORKFLOW_INDEX.record)
+    result = (
+        inventory.workflow_policy_map(accounts),
+        inventory.legacy_channel_policy_map(accounts),
+        list(inventory.policy_condition_workflow_map(accounts)),
+    )
+    inventory.close()
+    return result
+
+
+ENGINES = {
+    'python': run_python,
+    'sqlite': run_sqlite,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark correlation engines on a synthetic estate.")
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--policies', type=int, default=10000)
+    parser.add_argument('--conditions', type=int, default=50000)
+    parser.add_argument('--workflows', type=int, default=5000)
+    parser.add_argument('--channels', type=int, default=1000)
+    parser.add_argument('--legacy-channels', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per engine; the best time is reported')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    estate, expected_policy_ids = synthetic_estate(args.accounts, args.policies, args.conditions, args.workflows,
+                                                   args.channels, args.legacy_channels, args.seed)
+    estate = load_store(*estate)
+    print(f"Estate: {args.accounts} accounts, {args.policies} policies, {args.conditions} conditions, "
+          f"{args.workflows} workflows, {args.channels} channels, {args.legacy_channels} legacy channels")
+
+    reference = None
+    baseline = None
+    for name, run in ENGINES.items():
+        best = None
+        for _ in range(max(1, args.repeat)):
+            exporter.WORKFLOW_INDEX.clear()  # every engine pays for parsing issuesFilters
+            started = time.perf_counter()
+            result = run(*estate)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        if reference is None:
+            reference, baseline = result, best
+            same = 'reference'
+        else:
+            same = 'identical' if result == reference else 'MISMATCH'
+        sizes = '/'.join(str(len(sheet)) for sheet in result)
+        print(f" {name:<8} {best:8.3f}s  x{baseline / best:5.2f}  rows {sizes}  {same}")
+
+    bench_policy_ids(estate[3], expected_policy_ids)
+
+
+def bench_policy_ids(workflows, expected):
+    """Time issuesFilter parsing cold and cached, and check it against the IDs the estate was built with."""
+    index = workflow_filters.WorkflowIndex()
+    started = time.perf_counter()
+    index.add_all(workflows)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    found = {(wf['accountId'], wf['id']): index.policy_ids(wf) for wf in workflows}
+    cached = time.perf_counter() - started
+    same = 'identical' if found == expected else 'MISMATCH'
+    print(f" policy IDs: parse {cold:.3f}s, cached {cached:.3f}s for {len(workflows)} workflows  {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+  What: Benchmark the synthetic script search on generated scripts.
+  Why:  Compares the old per-target substring loop from search_synthetic_code
+        with the matcher in script_matcher, on each of its backends, as
+        the number of targets grows, and checks that every method finds the
+        same (target, monitor) pairs.
+
+Usage:
+  python benchmark_script_search.py                          # 2000 scripts, 13/100/1000 targets
+  python benchmark_script_search.py --scripts 500 --targets 13,5000 --repeat 3
+No API key or network access is needed; nothing is fetched from New Relic.
+"""
+import argparse
+import random
+import time
+
+import script_matcher
+from script_matcher import MultiPatternMatcher
+
+WORDS = ['const', 'await', '$browser', 'get', 'findElement', 'By.css', 'click', 'sendKeys', 'then',
+         'function', 'return', 'assert', 'equal', 'login', 'password', 'button', 'submit', '#main', '.nav']
+TLDS = ['com', 'net', 'org', 'co.uk', 'io']
+
+
+def synthetic_targets(n, seed=7):
+    rnd = random.Random(seed)
+    targets = []
+    while len(targets) < n:
+        host = ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rnd.randint(4, 12)))
+        targets.append(f'{host}.{rnd.choice(TLDS)}')
+        if rnd.random() < 0.2:
+            targets.append(f'msd.{targets[-1]}')  # overlapping targets, like msd.insightglobal.com
+    return list(dict.fromkeys(targets[:n]))
+
+
+def synthetic_scripts(n, targets, lines=200, seed=7):
+    rnd = random.Random(seed)
+    scripts = []
+    for _ in range(n):
+        body = []
+        for _ in range(lines):
+            line = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 10)))
+            if rnd.random() < 0.02:
+                target = rnd.choice(targets)
+                line += f" $browser.get('https://{target.upper() if rnd.random() < 0.3 else target}/path');"
+            body.append(line)
+        scripts.append('\n'.join(body))
+    return scripts
+
+
+def search_substring(scripts, targets, case_sensitive=False):
+    """The original loop: one `in` test per target per script."""
+    targets_norm = targets if case_sensitive else [t.lower() for t in targets]
+    found = set()
+    for i, script in enumerate(scripts):
+        hay = script if case_sensitive else script.lower()
+        for original, needle in zip(targets, targets_norm):
+            if needle in hay:
+                found.add((original, i))
+    return found
+
+
+def search_matcher(scripts, targets, backend):
+    matcher = MultiPatternMatcher(targets, backend=backend)
+    found = set()
+    for i, script in enumerate(scripts):
+        for pattern in matcher.hits(script):
+            found.add((pattern, i))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark substring vs Aho-Corasick script search.")
+    parser.add_argument('--scripts', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=200, help='Lines per generated script')
+    parser.add_argument('--targets', type=str, default='13,100,1000', help='Comma-separated target counts')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per method; the best time is reported')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    counts = [int(x) for x in args.targets.split(',') if x.strip()]
+    all_targets = synthetic_targets(max(counts), args.seed)
+    scripts = synthetic_scripts(args.scripts, all_targets, args.lines, args.seed)
+    chars = sum(len(s) for s in scripts)
+    print(f"Scripts: {len(scripts)} ({chars / 1e6:.1f}M chars)")
+
+    methods = {'substring': lambda s, t: search_substring(s, t)}
+    methods['find'] = lambda s, t: search_matcher(s, t, 'find')
+    methods['aho-python'] = lambda s, t: search_matcher(s, t, 'python')
+    if script_matcher.ahocorasick is not None:
+        methods['aho-c'] = lambda s, t: search_matcher(s, t, 'pyahocorasick')
+    else:
+        print(" (pyahocorasick not installed; the C automaton is not timed)")
+
+    for n in counts:
+        targets = all_targets[:n]
+        print(f"Targets: {len(targets)}")
+        reference = None
+        baseline = None
+        for name, run in methods.items():
+            best = None
+            for _ in range(max(1, args.repeat)):
+                started = time.perf_counter()
+                result = run(scripts, targets)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            if reference is None:
+                reference, baseline = result, best
+                same = 'reference'
+            else:
+                same = 'identical' if result == reference else 'MISMATCH'
+            print(f" {name:<11} {best:8.3f}s  x{baseline / best:6.2f}  hits {len(result)}  {same}")
+
+
+if __name__ == '__main__':
+    main()
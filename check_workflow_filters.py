@@ -0,0 +1,64 @@
+"""
+  What: Self-check of the issuesFilter operator rules in workflow_filters.
+  Why:  The policy IDs a workflow routes feed every workflow correlation
+        sheet; a wrong operator rule silently drops or invents rows. This
+        runs one case per operator, plus a predicate without an operator,
+        range operators, exclusion-only filters and mixed filters, and exits
+        non-zero when any case disagrees.
+
+Usage:
+  python check_workflow_filters.py
+No API key or network access is needed.
+"""
+import sys
+
+import workflow_filters
+
+
+def workflow(*predicates):
+    return {'accountId': 1, 'id': 'wf', 'updatedAt': 0,
+            'issuesFilter': {'predicates': [
+                dict({'attribute': 'labels.policyIds', 'values': ['101', '102']}, **p) for p in predicates
+            ]}}
+
+
+def cases():
+    """(name, workflow, policy_ids, excluded_ids, excludes_only)"""
+    for op in sorted(workflow_filters.INCLUDE_OPERATORS):
+        yield f'include {op}', workflow({'operator': op}), {'101', '102'}, set(), False
+    for op in sorted(workflow_filters.EXCLUDE_OPERATORS):
+        yield f'exclude-only {op}', workflow({'operator': op}), set(), {'101', '102'}, True
+        yield (f'include minus {op}', workflow({'operator': 'IN'}, {'operator': op, 'values': ['102']}),
+               {'101'}, {'102'}, False)
+    yield 'missing operator', workflow({}), {'101', '102'}, set(), False
+    yield 'empty operator', workflow({'operator': ''}), {'101', '102'}, set(), False
+    yield 'lower-case operator', workflow({'operator': 'equal'}), {'101', '102'}, set(), False
+    for op in ('GREATER_THAN', 'LESS_THAN_OR_EQUAL'):
+        yield f'range {op}', workflow({'operator': op}), set(), set(), False
+    yield ('exclude-only with missing values', workflow({'operator': 'DOES_NOT_EQUAL', 'values': None}),
+           set(), set(), True)
+    yield ('non-policy attribute', workflow({'attribute': 'priority', 'operator': 'EQUAL', 'values': ['1']}),
+           set(), set(), False)
+    yield 'zero-padded IDs', workflow({'operator': 'IN', 'values': ['007', '0101']}), {'7', '101'}, set(), False
+    yield ('CONTAINS over a joined list', workflow({'operator': 'CONTAINS', 'values': ['101,102;103']}),
+           {'101', '102', '103'}, set(), False)
+
+
+def main():
+    failed = 0
+    total = 0
+    for name, wf, policy_ids, excluded_ids, excludes_only in cases():
+        total += 1
+        record = workflow_filters.WorkflowRecord.from_workflow(wf)
+        got = (set(record.policy_ids), set(record.excluded_ids), record.excludes_only)
+        want = (policy_ids, excluded_ids, excludes_only)
+        if got != want:
+            failed += 1
+            print(f"FAIL {name}: got policy_ids={sorted(got[0])} excluded={sorted(got[1])} "
+                  f"excludes_only={got[2]}, want {sorted(want[0])} {sorted(want[1])} {want[2]}")
+    print(f"{total - failed}/{total} workflow filter cases passed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
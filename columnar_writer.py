@@ -0,0 +1,264 @@
+"""
+  What: Typed Parquet / Arrow IPC output for the exporter's collections.
+  Why:  Downstream analytics re-parsed a pile of wide CSVs every morning and
+        got every value back as a string. Columnar files carry one declared
+        schema per collection: ints, booleans and timestamps keep their types,
+        and nested fields (alert terms, workflow destinations and filters, tags)
+        are stored as struct/list columns instead of formatted strings.
+
+pyarrow is optional: it is only imported when --format parquet|arrow is used.
+"""
+from datetime import date, datetime, timezone
+from itertools import islice
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+FORMATS = ('parquet', 'arrow')
+EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+# Records converted per Arrow record batch, so only one chunk is ever duplicated in memory
+BATCH_ROWS = 10000
+
+# Type specs: 'string' | 'int64' | 'float64' | 'bool' | 'timestamp' | 'date',
+# {field: spec} for a struct and [spec] for a list.
+TERM = {
+    'threshold': 'float64',
+    'thresholdDuration': 'int64',
+    'thresholdOccurrences': 'string',
+    'operator': 'string',
+    'priority': 'string',
+}
+
+SCHEMAS = {
+    'apm_agents': {
+        'name': 'string', 'guid': 'string', 'type': 'string',
+        'reporting': 'bool', 'language': 'string',
+        'runningAgentVersions': {'maxVersion': 'string', 'minVersion': 'string'},
+    },
+    'dashboards': {
+        'name': 'string', 'guid': 'string', 'type': 'string', 'accountId': 'int64',
+        'entityType': 'string', 'lastReportingChangeAt': 'timestamp',
+        'owner': {'email': 'string'},
+        'permissions': 'string', 'permalink': 'string', 'reporting': 'bool',
+    },
+    'infras_agents': {
+        'name': 'string', 'guid': 'string', 'type': 'string', 'accountId': 'int64',
+        'entityType': 'string', 'lastReportingChangeAt': 'timestamp',
+        'permalink': 'string', 'reporting': 'bool',
+    },
+    'synthetics': {
+        'name': 'string', 'guid': 'string', 'type': 'string', 'accountId': 'int64',
+        'entityType': 'string', 'lastReportingChangeAt': 'timestamp',
+        'monitorId': 'string',
+        'monitorSummary': {'status': 'string', 'locationsRunning': 'int64', 'successRate': 'float64'},
+        'monitorType': 'string', 'monitoredUrl': 'string', 'permalink': 'string',
+        'period': 'int64', 'reporting': 'bool',
+        'tags': [{'key': 'string', 'values': ['string']}],
+    },
+    'users': {
+        'email': 'string', 'name': 'string',
+    },
+    'alert_policies': {
+        'accountId': 'int64', 'id': 'string', 'name': 'string', 'incidentPreference': 'string',
+    },
+    'alert_conditions': {
+        'accountId': 'int64', 'id': 'string', 'name': 'string',
+        'policyId': 'string', 'policyName': 'string',
+        'type': 'string', 'enabled': 'bool',
+        'nrqlQuery': 'string', 'terms': [TERM],
+        'baselineDirection': 'string',
+        'runbookUrl': 'string', 'updatedAt': 'date',
+        'updatedBy': {'name': 'string'},
+    },
+    'notifications': {
+        'accountId': 'int64', 'id': 'string', 'name': 'string', 'type': 'string',
+        'product': 'string', 'destinationId': 'string',
+    },
+    'workflows': {
+        'accountId': 'int64', 'id': 'string', 'name': 'string',
+        'workflowEnabled': 'bool', 'destinationsEnabled': 'bool',
+        'lastRun': 'timestamp', 'updatedAt': 'timestamp',
+        'destinationConfigurations': [{
+            'channelId': 'string', 'name': 'string', 'type': 'string',
+            'notificationTriggers': ['string'],
+        }],
+        'issuesFilter': {
+            'name': 'string', 'type': 'string',
+            'predicates': [{'attribute': 'string', 'operator': 'string', 'values': ['string']}],
+        },
+    },
+    'workflow_policy_map': {
+        'Account ID': 'int64', 'Workflow ID': 'string', 'Workflow Name': 'string',
+        'Channel ID': 'string', 'Channel Name': 'string', 'Channel Type': 'string',
+        'Policy ID': 'string', 'Policy Name': 'string',
+        'Excludes Only': 'bool', 'Excluded Policy IDs': 'string',
+    },
+    'legacy_channel_policy_map': {
+        'Account ID': 'int64', 'Channel ID': 'string', 'Channel Name': 'string',
+        'Channel Type': 'string', 'Policy ID': 'string', 'Policy Name': 'string',
+    },
+    'policy_condition_workflow_map': {
+        'Account ID': 'int64', 'Policy ID': 'string', 'Policy Name': 'string',
+        'Incident Preference': 'string',
+        'Condition ID': 'string', 'Condition Name': 'string', 'Condition Type': 'string',
+        'Workflow ID': 'string', 'Workflow Name': 'string', 'Workflow Enabled': 'bool',
+        'Channel ID': 'string', 'Channel Name': 'string', 'Channel Type': 'string',
+    },
+}
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Parquet/Arrow output needs pyarrow. Install it with: pip install pyarrow")
+
+
+def arrow_type(spec):
+    if isinstance(spec, dict):
+        return pa.struct([(name, arrow_type(sub)) for name, sub in spec.items()])
+    if isinstance(spec, list):
+        return pa.list_(arrow_type(spec[0]))
+    return {
+        'string': pa.string(),
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'bool': pa.bool_(),
+        'timestamp': pa.timestamp('ms', tz='UTC'),
+        'date': pa.date32(),
+    }[spec]
+
+
+def arrow_schema(collection):
+    return pa.schema([(name, arrow_type(spec)) for name, spec in SCHEMAS[collection].items()])
+
+
+def _to_datetime(value):
+    # NerdGraph mixes epoch milliseconds and ISO-8601 strings for timestamps
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000.0, tz=timezone.utc)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+
+
+def _to_date(value):
+    if isinstance(value, (int, float)):
+        return _to_datetime(value).date()
+    return date.fromisoformat(str(value)[:10])
+
+
+def coerce(value, spec):
+    """Coerce a JSON value to the Python type its spec maps to; unparseable scalars become null."""
+    if value is None:
+        return None
+    if isinstance(spec, dict):
+        if not isinstance(value, dict):
+            return None
+        return {name: coerce(value.get(name), sub) for name, sub in spec.items()}
+    if isinstance(spec, list):
+        if isinstance(value, dict):
+            value = [value]
+        elif not isinstance(value, (list, tuple)):
+            return None
+        return [coerce(v, spec[0]) for v in value]
+    try:
+        if spec == 'string':
+            return value if isinstance(value, str) else str(value)
+        if spec == 'int64':
+            return int(value)
+        if spec == 'float64':
+            return float(value)
+        if spec == 'bool':
+            return value if isinstance(value, bool) else str(value).lower() == 'true'
+        if spec == 'timestamp':
+            return _to_datetime(value)
+        if spec == 'date':
+            return _to_date(value)
+    except (TypeError, ValueError):
+        return None
+    return value
+
+
+def _conditions_record(record):
+    # The exporter keeps nrql as {query}; the columnar schema stores the flat nrqlQuery
+    if 'nrqlQuery' not in record and isinstance(record.get('nrql'), dict):
+        record = dict(record, nrqlQuery=record['nrql'].get('query'))
+    return record
+
+
+PREPARE = {
+    'alert_conditions': _conditions_record,
+}
+
+
+class ColumnarWriter:
+    """
+    Usage:
+        with ColumnarWriter('parquet', 'alert_conditions', 'out.parquet') as out:
+            out.write_records(rows)   # any iterable of dicts, consumed in BATCH_ROWS chunks
+
+    With `columns`, records are tuples/lists in that column order instead of dicts.
+    """
+
+    def __init__(self, fmt, collection, path, columns=None):
+        require_pyarrow()
+        self.collection = collection
+        self.spec = SCHEMAS[collection]
+        self.prepare = PREPARE.get(collection)
+        self.columns = columns
+        self.schema = arrow_schema(collection)
+        self.rows = 0
+        if fmt == 'parquet':
+            self.writer = pq.ParquetWriter(path, self.schema)
+        elif fmt == 'arrow':
+            self.writer = pa.ipc.new_file(path, self.schema)
+        else:
+            raise ValueError(f"Unknown columnar format: {fmt}")
+
+    def _row(self, record):
+        if self.columns is not None:
+            record = dict(zip(self.columns, record))
+        if self.prepare:
+            record = self.prepare(record)
+        return {name: coerce(record.get(name), spec) for name, spec in self.spec.items()}
+
+    def write_records(self, records):
+        records = iter(records)
+        while True:
+            chunk = [self._row(r) for r in islice(records, BATCH_ROWS)]
+            if not chunk:
+                break
+            self.writer.write_table(pa.Table.from_pylist(chunk, schema=self.schema))
+            self.rows += len(chunk)
+        return self.rows
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_collection(fmt, collection, records, path, columns=None):
+    """
+    Write one collection to `path`; collections without a declared schema are
+    inferred by Arrow. `columns` names the fields of tuple records.
+    """
+    require_pyarrow()
+    if collection not in SCHEMAS:
+        if columns is not None:
+            records = (dict(zip(columns, r)) for r in records)
+        table = pa.Table.from_pylist(list(records))
+        if fmt == 'parquet':
+            pq.write_table(table, path)
+        else:
+            with pa.ipc.new_file(path, table.schema) as writer:
+                writer.write_table(table)
+        return table.num_rows
+    with ColumnarWriter(fmt, collection, path, columns) as out:
+        return out.write_records(records)
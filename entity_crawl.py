@@ -0,0 +1,83 @@
+"""
+  What: One entitySearch crawl for APM apps, dashboards, hosts and monitors.
+  Why:  The exporters used to run four separate full entitySearch sweeps that
+        only differed by `type`. A single multi-type search with every inline
+        fragment walks one cursor chain instead of four and gives a
+        consistent point-in-time inventory; results are routed by type to the
+        existing per-type CSV writers.
+"""
+from nerdgraph_client import get_client
+
+# entitySearch type -> exporter collection name
+ENTITY_TYPES = {
+    'APPLICATION': 'apm_agents',
+    'DASHBOARD': 'dashboards',
+    'HOST': 'infras_agents',
+    'MONITOR': 'synthetics',
+}
+
+ENTITY_SEARCH_QUERY = """
+query($query: String!, $cursor: String) {
+  actor { entitySearch(query: $query) {
+    results(cursor: $cursor) {
+      entities {
+        name guid type
+        ... on ApmApplicationEntityOutline {
+          reporting
+          language
+          runningAgentVersions { maxVersion minVersion }
+        }
+        ... on DashboardEntityOutline {
+          accountId entityType lastReportingChangeAt
+          owner { email }
+          permissions permalink reporting
+        }
+        ... on InfrastructureHostEntityOutline {
+          accountId entityType lastReportingChangeAt permalink reporting
+        }
+        ... on SyntheticMonitorEntityOutline {
+          accountId entityType lastReportingChangeAt
+          monitorId monitorSummary { status locationsRunning successRate }
+          monitorType monitoredUrl permalink period reporting
+          tags { key values }
+        }
+      }
+      nextCursor
+    }
+  }}
+}
+"""
+
+
+def search_expression(types):
+    quoted = ', '.join(f"'{t}'" for t in types)
+    return f"type IN ({quoted})"
+
+
+def iter_entity_pages(types=tuple(ENTITY_TYPES), client=None):
+    """Yield each page of entities (a list) from one multi-type entitySearch cursor chain."""
+    client = client or get_client()
+    variables = {'query': search_expression(types), 'cursor': None}
+    while True:
+        data = client.query(ENTITY_SEARCH_QUERY, variables=dict(variables))
+        results = data['data']['actor']['entitySearch']['results']
+        yield results['entities']
+        variables['cursor'] = results.get('nextCursor')
+        if not variables['cursor']:
+            break
+
+
+def iter_entities(types=tuple(ENTITY_TYPES), client=None):
+    """Yield entities one at a time as pages arrive, so callers can stream them to disk."""
+    for page in iter_entity_pages(types, client):
+        yield from page
+
+
+def crawl_entities(types=tuple(ENTITY_TYPES), client=None):
+    """Run the single crawl and return {type: [entities]} in crawl order for each requested type."""
+    by_type = {t: [] for t in types}
+    for entity in iter_entities(types, client):
+        bucket = by_type.get(entity.get('type'))
+        if bucket is not None:
+            bucket.append(entity)
+    return by_type
@@ -1,10 +1,28 @@
-import requests
+"""
+  What: Export alert policies with their conditions and notification channels to CSV.
+  Why:  Every policy used to cost seven sequential REST v2 requests (six
+        condition types plus channels), i.e. 14,000 serial calls for a
+        2,000-policy account, and only the first page of each answer was read.
+        The per-policy calls now fan out over a bounded thread pool sharing one
+        paced, pooled client; every REST v2 answer is followed through its
+        `Link: rel="next"` pages; NRQL conditions come from a single
+        account-wide nrqlConditionsSearch instead of one REST call per policy.
+
+Usage:
+  python fetch_alert_policies.py                    # 8 requests in flight
+  python fetch_alert_policies.py --workers 16
+  python fetch_alert_policies.py --nrql-source rest # per-policy REST calls for NRQL conditions too
+"""
+import argparse
 import json
 import os
 import csv
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 
+from nerdgraph_client import DEFAULT_POOL_SIZE, NerdGraphClient
+
 # Load environment variables
 load_dotenv(override=True)
 
@@ -27,27 +45,53 @@ TIMESTAMP = datetime.now().strftime("%Y%m%d-%H%M%S")
 OUTPUT_FILE = f"{TIMESTAMP}-alert-policies-detailed.csv"
 
 
+# Condition endpoints, in the order their conditions are listed per policy
+CONDITION_ENDPOINTS = [
+    "alerts_conditions",
+    "alerts_nrql_conditions",
+    "alerts_plugins_conditions",
+    "alerts_external_service_conditions",
+    "alerts_synthetics_conditions",
+    "alerts_infrastructure_conditions",
+]
+NRQL_ENDPOINT = "alerts_nrql_conditions"
+
+DEFAULT_WORKERS = 8
+
+# Shared pooled client (paced and retried by request_scheduler); replaced in main()
+client = NerdGraphClient(api_key=API_KEY, url=GRAPHQL_URL)
+
+
 def graphql_query(query):
-    response = requests.post(GRAPHQL_URL, headers=HEADERS_GRAPHQL, json={'query': query})
+    response = client.request('POST', GRAPHQL_URL, headers=HEADERS_GRAPHQL, json={'query': query})
     response.raise_for_status()
     return response.json()
 
 
-def rest_get(endpoint):
+def rest_get_pages(endpoint):
+    """GET a REST v2 endpoint and every page after it (linked via the `Link: rel="next"` header)."""
     url = f"{REST_URL}/{endpoint}"
-    response = requests.get(url, headers=HEADERS_REST)
+    pages = []
+    while url:
+        response = client.request('GET', url, headers=HEADERS_REST)
 
-    if response.status_code != 200:
-        print(f"❌ Error {response.status_code} for endpoint: {url}")
-        print("Response text:", response.text)
-        response.raise_for_status()
+        if response.status_code != 200:
+            print(f"❌ Error {response.status_code} for endpoint: {url}")
+            print("Response text:", response.text)
+            response.raise_for_status()
 
-    try:
-        return response.json()
-    except json.JSONDecodeError:
-        print(f"❌ Failed to decode JSON from endpoint: {url}")
-        print("Raw response:", response.text)
-        raise
+        try:
+            pages.append(response.json())
+        except json.JSONDecodeError:
+            print(f"❌ Failed to decode JSON from endpoint: {url}")
+            print("Raw response:", response.text)
+            raise
+        url = response.links.get('next', {}).get('url')
+    return pages
+
+
+def _cursor_arg(cursor):
+    return f'(cursor: "{cursor}")' if cursor else ''
 
 
 def fetch_alert_policies():
@@ -60,7 +104,7 @@ def fetch_alert_policies():
           actor {{
             account(id: {ACCOUNT_ID}) {{
               alerts {{
-                policiesSearch{f'(cursor: \\"{cursor}\\")' if cursor else ''} {{
+                policiesSearch{_cursor_arg(cursor)} {{
                   policies {{
                     id
                     name
@@ -83,34 +127,77 @@ def fetch_alert_policies():
     return policies
 
 
+def fetch_endpoint_conditions(policy_id, endpoint):
+    """Conditions of one type for one policy, across every page."""
+    conditions = []
+    try:
+        for data in rest_get_pages(f"{endpoint}/policies/{policy_id}.json"):
+            for key in data:
+                if isinstance(data[key], list):
+                    conditions.extend(data[key])
+    except Exception as e:
+        print(f"Error fetching conditions for policy {policy_id}: {e}")
+    return conditions
+
+
 def fetch_conditions(policy_id):
     all_conditions = []
+    for endpoint in CONDITION_ENDPOINTS:
+        all_conditions.extend(fetch_endpoint_conditions(policy_id, endpoint))
+    return all_conditions
 
-    endpoints = [
-        f"alerts_conditions/policies/{policy_id}.json",
-        f"alerts_nrql_conditions/policies/{policy_id}.json",
-        f"alerts_plugins_conditions/policies/{policy_id}.json",
-        f"alerts_external_service_conditions/policies/{policy_id}.json",
-        f"alerts_synthetics_conditions/policies/{policy_id}.json",
-        f"alerts_infrastructure_conditions/policies/{policy_id}.json"
-    ]
 
-    for endpoint in endpoints:
-        try:
-            data = rest_get(endpoint)
-            for key in data:
-                if isinstance(data[key], list):
-                    all_conditions.extend(data[key])
-        except Exception as e:
-            print(f"Error fetching conditions for policy {policy_id}: {e}")
+def fetch_nrql_conditions_by_policy():
+    """
+    Every NRQL condition in the account from one paginated nrqlConditionsSearch,
+    grouped as {policy id: [condition, ...]}. Conditions are shaped like the REST
+    alerts_nrql_conditions ones ("type" lower-cased: static, baseline, ...) and
+    kept in condition id order, as REST lists them.
+    """
+    by_policy = {}
+    cursor = None
+    while True:
+        query = f"""
+        {{
+          actor {{
+            account(id: {ACCOUNT_ID}) {{
+              alerts {{
+                nrqlConditionsSearch{_cursor_arg(cursor)} {{
+                  nrqlConditions {{
+                    id
+                    name
+                    type
+                    policyId
+                  }}
+                  nextCursor
+                }}
+              }}
+            }}
+          }}
+        }}
+        """
+        data = graphql_query(query)
+        if data.get('errors') and not data.get('data'):
+            raise RuntimeError(f"nrqlConditionsSearch failed: {data['errors']}")
+        result = data['data']['actor']['account']['alerts']['nrqlConditionsSearch']
+        for c in result['nrqlConditions']:
+            by_policy.setdefault(str(c['policyId']), []).append(
+                {'id': int(c['id']), 'type': (c.get('type') or 'unknown').lower(), 'name': c.get('name')})
+        cursor = result['nextCursor']
+        if not cursor:
+            break
 
-    return all_conditions
+    for conditions in by_policy.values():
+        conditions.sort(key=lambda c: c['id'])
+    return by_policy
 
 
 def fetch_policy_channel_links(policy_id):
     try:
-        data = rest_get(f"alerts_policy_channels.json?policy_id={policy_id}")
-        return data.get("channels", [])
+        channels = []
+        for data in rest_get_pages(f"alerts_policy_channels.json?policy_id={policy_id}"):
+            channels.extend(data.get("channels", []))
+        return channels
     except Exception as e:
         print(f"Error fetching channels for policy {policy_id}: {e}")
         return []
@@ -144,16 +231,51 @@ def flatten_channels(channels):
     return "; ".join([f"{c.get('type')} - {c.get('name')}" for c in channels])
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export alert policies with their conditions and channels.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='REST v2 requests in flight (default: %(default)s); pacing still follows NR_RATE_REST')
+    parser.add_argument('--nrql-source', choices=['nerdgraph', 'rest'], default='nerdgraph',
+                        help='nerdgraph: one account-wide nrqlConditionsSearch (default); '
+                             'rest: one alerts_nrql_conditions call per policy')
+    return parser.parse_args()
+
+
 def main():
+    global client
+    args = parse_args()
+    workers = max(1, args.workers)
+    client = NerdGraphClient(api_key=API_KEY, url=GRAPHQL_URL, pool_size=max(workers, DEFAULT_POOL_SIZE))
+
     print("Fetching alert policies...")
     policies = fetch_alert_policies()
 
-    print("Fetching conditions and channels per policy...")
+    nrql_by_policy = None
+    if args.nrql_source == 'nerdgraph':
+        print("Fetching NRQL conditions (account-wide)...")
+        try:
+            nrql_by_policy = fetch_nrql_conditions_by_policy()
+        except Exception as e:
+            print(f"nrqlConditionsSearch failed ({e}); falling back to per-policy REST calls")
+
+    endpoints = [e for e in CONDITION_ENDPOINTS if not (nrql_by_policy is not None and e == NRQL_ENDPOINT)]
+    pids = [policy['id'] for policy in policies]
+    tasks = [(pid, endpoint) for pid in pids for endpoint in endpoints]
+    print(f"Fetching conditions and channels per policy ({len(tasks) + len(pids)} requests, {workers} in flight)...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        fetched = dict(zip(tasks, pool.map(lambda t: fetch_endpoint_conditions(*t), tasks)))
+        channels_of = dict(zip(pids, pool.map(fetch_policy_channel_links, pids)))
+
     output_rows = []
     for policy in policies:
         pid = policy['id']
-        conditions = fetch_conditions(pid)
-        channels = fetch_policy_channel_links(pid)
+        conditions = []
+        for endpoint in CONDITION_ENDPOINTS:
+            if (pid, endpoint) in fetched:
+                conditions.extend(fetched[(pid, endpoint)])
+            else:
+                conditions.extend(nrql_by_policy.get(str(pid), []))
+        channels = channels_of[pid]
 
         row = {
             'id': pid,
@@ -165,6 +287,7 @@ def main():
         output_rows.append(row)
 
     write_to_csv(OUTPUT_FILE, output_rows)
+    client.print_connection_stats()
     print(f"\n✅ Done! Output saved to: {OUTPUT_FILE}\n")
 
 
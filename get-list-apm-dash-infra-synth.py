@@ -5,27 +5,19 @@
      Why: Explore (POC) using code to query New Relic's GraphQL API.
     What: This script will list all infrastructure agents deployed in your New Relic account.
 """
-import requests
 import json
 import os
 import csv
 import pprint as pp
 from datetime import datetime
 from dotenv import load_dotenv
+from nerdgraph_client import get_client
+from entity_crawl import crawl_entities
 
 load_dotenv()
 
 API_KEY = os.getenv('NR_API_KEY')
 
-# Define the URL
-URL = "https://api.newrelic.com/graphql"
-
-# Define the headers
-HEADERS = {
-    "Content-Type": "application/json",
-    "API-Key": API_KEY
-}
-
 OUTPUT_FILE = "list-apm-agent.csv"
 
 
@@ -70,8 +62,7 @@ def fetch_apm_agents(cursor=None):
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_dashboard_data(cursor=None):
@@ -102,8 +93,7 @@ def fetch_dashboard_data(cursor=None):
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_infra_agents(cursor=None):
@@ -132,8 +122,7 @@ def fetch_infra_agents(cursor=None):
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_policies(cursor=None):
@@ -160,8 +149,7 @@ def fetch_policies(cursor=None):
     if cursor:
         query = query.replace('policiesSearch', f'policiesSearch(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_synthetic_monitors(cursor):
@@ -195,8 +183,7 @@ def fetch_synthetic_monitors(cursor):
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_user_accounts(cursor=None):
@@ -219,23 +206,27 @@ def fetch_user_accounts(cursor=None):
     if cursor:
         query = query.replace('userSearch', f'userSearch(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
-def get_all_apm_agents():
-    output_file = 'list-apm-agent.csv'
-    apm_agents = []
+def collect_entities(fetch_page):
+    results = []
     cursor = None
-    
+
     while True:
-        data = fetch_apm_agents(cursor)
-        entities = data['data']['actor']['entitySearch']['results']['entities']
-        apm_agents.extend(entities)
-        
+        data = fetch_page(cursor)
+        results.extend(data['data']['actor']['entitySearch']['results']['entities'])
+
         cursor = data['data']['actor']['entitySearch']['results']['nextCursor']
         if not cursor:
             break
+
+    return results
+
+
+def get_all_apm_agents(entities=None):
+    output_file = 'list-apm-agent.csv'
+    apm_agents = entities if entities is not None else collect_entities(fetch_apm_agents)
     
     # return apm_agents
     
@@ -285,19 +276,9 @@ def get_all_apm_agents():
     print(f'\n\n\tPlease see the output file named "{output_file}"\n\n')
 
 
-def get_all_dashboard_data():
+def get_all_dashboard_data(entities=None):
     output_file = 'list-dashboards.csv'
-    dashboards = []
-    cursor = None
-    
-    while True:
-        data = fetch_dashboard_data(cursor)
-        entities = data['data']['actor']['entitySearch']['results']['entities']
-        dashboards.extend(entities)
-        
-        cursor = data['data']['actor']['entitySearch']['results']['nextCursor']
-        if not cursor:
-            break
+    dashboards = entities if entities is not None else collect_entities(fetch_dashboard_data)
     
     # return dashboards
 
@@ -324,19 +305,9 @@ def get_all_dashboard_data():
     print(f'\n\n\tPlease see the output file named "{output_file}"\n\n')
 
 
-def get_all_infra_agents():
+def get_all_infra_agents(entities=None):
     output_file = 'list-infra-agents.csv'
-    infra_agents = []
-    cursor = None
-    
-    while True:
-        data = fetch_infra_agents(cursor)
-        entities = data['data']['actor']['entitySearch']['results']['entities']
-        infra_agents.extend(entities)
-        
-        cursor = data['data']['actor']['entitySearch']['results']['nextCursor']
-        if not cursor:
-            break
+    infra_agents = entities if entities is not None else collect_entities(fetch_infra_agents)
     
     # return infra_agents
 
@@ -389,19 +360,9 @@ def get_all_policies():
     print(f'\n\n\tPlease see the output file named "{output_file}"\n\n')
 
 
-def get_all_synthetic_monitors():
+def get_all_synthetic_monitors(entities=None):
     output_file = 'list-synthetic-monitors.csv'
-    synthetic_monitors = []
-    cursor = None
-    
-    while True:
-        data = fetch_synthetic_monitors(cursor)
-        entities = data['data']['actor']['entitySearch']['results']['entities']
-        synthetic_monitors.extend(entities)
-        
-        cursor = data['data']['actor']['entitySearch']['results']['nextCursor']
-        if not cursor:
-            break
+    synthetic_monitors = entities if entities is not None else collect_entities(fetch_synthetic_monitors)
     
     # return synthetic_monitors
 
@@ -454,11 +415,13 @@ def get_all_users():
 
 
 def main():
-    get_all_apm_agents()
-    get_all_dashboard_data()
-    get_all_infra_agents()
+    # one entitySearch crawl for all four entity types, routed to each writer
+    entities = crawl_entities(['APPLICATION', 'DASHBOARD', 'HOST', 'MONITOR'])
+    get_all_apm_agents(entities['APPLICATION'])
+    get_all_dashboard_data(entities['DASHBOARD'])
+    get_all_infra_agents(entities['HOST'])
     get_all_policies()
-    get_all_synthetic_monitors()
+    get_all_synthetic_monitors(entities['MONITOR'])
     get_all_users()
     
     # apm_agents         = get_all_apm_agents()
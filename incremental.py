@@ -0,0 +1,113 @@
+"""
+  What: Local snapshots + watermarks for incremental (delta) exports.
+  Why:  Nightly runs used to re-export everything into a fresh TIMESTAMP-named
+        CSV. In incremental mode each collection is merged into a maintained
+        snapshot and only the rows that were added, changed or removed since
+        the previous run are written out as a delta.
+
+Layout under the snapshot directory:
+  watermarks.json      {collection: {account: latest updatedAt/lastReportingChangeAt seen}}
+  <collection>.json    {account: {record key: {"hash": ..., "record": {...}}}}
+"""
+import hashlib
+import json
+import os
+
+DEFAULT_DIR = '.nr-snapshots'
+
+# Account key used for account-agnostic collections (entitySearch, users)
+ALL_ACCOUNTS = 'all'
+
+
+def record_hash(record):
+    raw = json.dumps(record, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _later(value, mark):
+    # epoch-ms ints and ISO-8601 strings both order correctly; fall back to text for mixed types
+    try:
+        return value > mark
+    except TypeError:
+        return str(value) > str(mark)
+
+
+def record_key(record, key_fields):
+    return '|'.join(str(record.get(f)) for f in key_fields)
+
+
+class SnapshotStore:
+
+    def __init__(self, root=DEFAULT_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.watermarks = self._load('watermarks.json')
+        self.snapshots = {}
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _load(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _dump(self, name, data):
+        # Write then rename so an interrupted run never leaves a truncated snapshot
+        path = self._path(name)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp, path)
+
+    def snapshot(self, collection):
+        if collection not in self.snapshots:
+            self.snapshots[collection] = self._load(f'{collection}.json')
+        return self.snapshots[collection]
+
+    def watermark(self, collection, account=ALL_ACCOUNTS):
+        return self.watermarks.get(collection, {}).get(str(account))
+
+    def merge(self, collection, account, records, key_fields=('id',), watermark_field=None):
+        """
+        Merge a full fetch of one (collection, account) into the snapshot.
+        Returns the delta as a list of records tagged with _change =
+        added | updated | removed, and advances the watermark.
+        """
+        account = str(account)
+        current = self.snapshot(collection).setdefault(account, {})
+        seen = set()
+        delta = []
+        mark = self.watermark(collection, account)
+
+        for rec in records:
+            key = record_key(rec, key_fields)
+            seen.add(key)
+            digest = record_hash(rec)
+            previous = current.get(key)
+            if previous is None or previous['hash'] != digest:
+                delta.append(dict(rec, _change='added' if previous is None else 'updated'))
+                current[key] = {'hash': digest, 'record': rec}
+            value = rec.get(watermark_field) if watermark_field else None
+            if value is not None and (mark is None or _later(value, mark)):
+                mark = value
+
+        for key in [k for k in current if k not in seen]:
+            delta.append(dict(current.pop(key)['record'], _change='removed'))
+
+        if mark is not None:
+            self.watermarks.setdefault(collection, {})[account] = mark
+        return delta
+
+    def records(self, collection):
+        """All snapshot records of a collection, in account then key order."""
+        snap = self.snapshot(collection)
+        return [snap[acct][key]['record'] for acct in sorted(snap) for key in sorted(snap[acct])]
+
+    def save(self):
+        for collection, data in self.snapshots.items():
+            self._dump(f'{collection}.json', data)
+        self._dump('watermarks.json', self.watermarks)
+
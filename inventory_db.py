@@ -0,0 +1,271 @@
+"""
+  What: Optional local SQLite inventory of the exported collections.
+  Why:  The correlation sheets were built by joining policies, conditions,
+        workflows and channels in Python with ad hoc dict lookups, all held in
+        memory. Loading the collections into indexed tables lets the same
+        sheets come out of SQL joins that stay fast at hundreds of thousands of
+        rows, and leaves a queryable inventory on disk after the run.
+
+Rows are keyed by (accountId, id). Each run first clears the requested
+accounts, then upserts what it fetched, so entities deleted upstream do not
+linger. Every correlation query is restricted to the requested accounts.
+"""
+import json
+import sqlite3
+
+DEFAULT_PATH = '.nr-inventory.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS policies (
+    accountId TEXT, id TEXT, name, incidentPreference, seq INTEGER,
+    PRIMARY KEY (accountId, id));
+CREATE TABLE IF NOT EXISTS conditions (
+    accountId TEXT, id, name, policyId TEXT, type, enabled, nrqlQuery, runbookUrl, updatedAt, seq INTEGER,
+    PRIMARY KEY (accountId, id));
+CREATE INDEX IF NOT EXISTS conditions_policy ON conditions (accountId, policyId);
+CREATE TABLE IF NOT EXISTS channels (
+    accountId TEXT, id TEXT, name, type, product, destinationId, seq INTEGER,
+    PRIMARY KEY (accountId, id));
+CREATE TABLE IF NOT EXISTS legacy_channels (
+    accountId TEXT, id, name, type, seq INTEGER,
+    PRIMARY KEY (accountId, id));
+CREATE TABLE IF NOT EXISTS legacy_channel_policies (
+    accountId TEXT, channelId, position INTEGER, policyId, policyName,
+    PRIMARY KEY (accountId, channelId, position));
+CREATE INDEX IF NOT EXISTS legacy_channel_policies_policy ON legacy_channel_policies (accountId, policyId);
+CREATE TABLE IF NOT EXISTS workflows (
+    accountId TEXT, id, name, workflowEnabled, destinationsEnabled, lastRun, updatedAt, seq INTEGER,
+    PRIMARY KEY (accountId, id));
+CREATE TABLE IF NOT EXISTS workflow_destinations (
+    accountId TEXT, workflowId, position INTEGER, channelId TEXT, name, type, notificationTriggers,
+    PRIMARY KEY (accountId, workflowId, position));
+CREATE INDEX IF NOT EXISTS workflow_destinations_channel ON workflow_destinations (accountId, channelId);
+CREATE TABLE IF NOT EXISTS workflow_policies (
+    accountId TEXT, workflowId, policyId TEXT,
+    PRIMARY KEY (accountId, workflowId, policyId));
+CREATE INDEX IF NOT EXISTS workflow_policies_policy ON workflow_policies (accountId, policyId);
+CREATE TABLE IF NOT EXISTS workflow_filters (
+    accountId TEXT, workflowId, excludesOnly, excludedPolicyIds,
+    PRIMARY KEY (accountId, workflowId));
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY, name, seq INTEGER);
+CREATE TABLE IF NOT EXISTS entities (
+    guid TEXT PRIMARY KEY, type TEXT, name, accountId, reporting, body TEXT, seq INTEGER);
+CREATE INDEX IF NOT EXISTS entities_type ON entities (type, accountId);
+"""
+
+# Tables holding per-account rows (cleared for the requested accounts on each run)
+ACCOUNT_TABLES = (
+    'policies', 'conditions', 'channels', 'legacy_channels', 'legacy_channel_policies',
+    'workflows', 'workflow_destinations', 'workflow_policies', 'workflow_filters',
+)
+
+WORKFLOW_POLICY_MAP_SQL = """
+SELECT w.accountId, w.id, w.name, d.position, d.channelId, ch.name, ch.type, wp.policyId, p.name,
+       wf.excludesOnly, wf.excludedPolicyIds
+FROM workflows w
+LEFT JOIN workflow_filters wf ON wf.accountId = w.accountId AND wf.workflowId = w.id
+LEFT JOIN workflow_destinations d ON d.accountId = w.accountId AND d.workflowId = w.id
+LEFT JOIN channels ch ON ch.accountId = w.accountId AND ch.id = d.channelId
+LEFT JOIN workflow_policies wp ON wp.accountId = w.accountId AND wp.workflowId = w.id
+LEFT JOIN policies p ON p.accountId = w.accountId AND p.id = wp.policyId
+WHERE w.accountId IN ({accounts})
+ORDER BY w.seq, d.position, CAST(wp.policyId AS INTEGER)
+"""
+
+LEGACY_CHANNEL_POLICY_MAP_SQL = """
+SELECT lc.accountId, lc.id, lc.name, lc.type, lp.policyId, lp.policyName
+FROM legacy_channels lc
+LEFT JOIN legacy_channel_policies lp ON lp.accountId = lc.accountId AND lp.channelId = lc.id
+WHERE lc.accountId IN ({accounts})
+ORDER BY lc.seq, lp.position
+"""
+
+POLICY_CONDITION_WORKFLOW_MAP_SQL = """
+SELECT p.accountId, p.id, p.name, p.incidentPreference,
+       c.id, c.name, c.type,
+       w.id, w.name, w.workflowEnabled,
+       NULLIF(d.channelId, ''), ch.name, ch.type
+FROM policies p
+LEFT JOIN conditions c ON c.accountId = p.accountId AND c.policyId = p.id
+LEFT JOIN workflow_policies wp ON wp.accountId = p.accountId AND wp.policyId = p.id
+LEFT JOIN workflows w ON w.accountId = wp.accountId AND w.id = wp.workflowId
+LEFT JOIN workflow_destinations d ON d.accountId = w.accountId AND d.workflowId = w.id
+LEFT JOIN channels ch ON ch.accountId = d.accountId AND ch.id = NULLIF(d.channelId, '')
+WHERE p.accountId IN ({accounts})
+ORDER BY p.seq, c.seq, w.seq, d.position
+"""
+
+PCW_COLUMNS = [
+    'Account ID', 'Policy ID', 'Policy Name', 'Incident Preference',
+    'Condition ID', 'Condition Name', 'Condition Type',
+    'Workflow ID', 'Workflow Name', 'Workflow Enabled',
+    'Channel ID', 'Channel Name', 'Channel Type',
+]
+
+
+def _text(value):
+    return str(value) if value is not None else None
+
+
+def _bool(value):
+    # SQLite hands booleans back as 0/1
+    return bool(value) if value is not None else None
+
+
+class InventoryDB:
+    """
+    Usage:
+        inv = InventoryDB('.nr-inventory.sqlite')
+        inv.clear_accounts(accounts)
+        inv.upsert_policies(policies); inv.upsert_conditions(conditions); ...
+        rows = inv.workflow_policy_map(accounts)
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self.seq = 0
+
+    def _next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def _upsert(self, table, columns, rows):
+        placeholders = ', '.join('?' for _ in columns)
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows
+            )
+
+    def clear_accounts(self, accounts):
+        accounts = [str(a) for a in accounts]
+        marks = ', '.join('?' for _ in accounts)
+        with self.conn:
+            for table in ACCOUNT_TABLES:
+                self.conn.execute(f"DELETE FROM {table} WHERE accountId IN ({marks})", accounts)
+
+    def upsert_policies(self, policies):
+        self._upsert('policies', ('accountId', 'id', 'name', 'incidentPreference', 'seq'), (
+            (_text(p.get('accountId')), _text(p.get('id')), p.get('name'), p.get('incidentPreference'),
+             self._next_seq())
+            for p in policies
+        ))
+
+    def upsert_conditions(self, conditions):
+        self._upsert('conditions', (
+            'accountId', 'id', 'name', 'policyId', 'type', 'enabled', 'nrqlQuery', 'runbookUrl', 'updatedAt', 'seq'
+        ), (
+            (_text(c.get('accountId')), c.get('id'), c.get('name'), _text(c.get('policyId')), c.get('type'),
+             c.get('enabled'), c.get('nrqlQuery') or (c.get('nrql') or {}).get('query'),
+             c.get('runbookUrl'), c.get('updatedAt'), self._next_seq())
+            for c in conditions
+        ))
+
+    def upsert_channels(self, channels):
+        self._upsert('channels', ('accountId', 'id', 'name', 'type', 'product', 'destinationId', 'seq'), (
+            (_text(ch.get('accountId')), _text(ch.get('id')), ch.get('name'), ch.get('type'),
+             ch.get('product'), ch.get('destinationId'), self._next_seq())
+            for ch in channels
+        ))
+
+    def upsert_legacy_channels(self, channels):
+        links = []
+        rows = []
+        for ch in channels:
+            acct = _text(ch.get('accountId'))
+            rows.append((acct, ch.get('id'), ch.get('name'), ch.get('type'), self._next_seq()))
+            assoc = (ch.get('associatedPolicies') or {}).get('policies') or []
+            for position, pol in enumerate(assoc):
+                links.append((acct, ch.get('id'), position, pol.get('id'), pol.get('name')))
+        self._upsert('legacy_channels', ('accountId', 'id', 'name', 'type', 'seq'), rows)
+        self._upsert('legacy_channel_policies', ('accountId', 'channelId', 'position', 'policyId', 'policyName'), links)
+
+    def upsert_workflows(self, workflows, record_of):
+        """record_of(workflow) -> its parsed issuesFilter (a workflow_filters.WorkflowRecord)."""
+        rows, dests, links, filters = [], [], [], []
+        for wf in workflows:
+            acct = _text(wf.get('accountId'))
+            rows.append((acct, wf.get('id'), wf.get('name'), wf.get('workflowEnabled'),
+                         wf.get('destinationsEnabled'), wf.get('lastRun'), wf.get('updatedAt'), self._next_seq()))
+            for position, d in enumerate(wf.get('destinationConfigurations') or []):
+                triggers = d.get('notificationTriggers')
+                dests.append((acct, wf.get('id'), position, _text(d.get('channelId')), d.get('name'), d.get('type'),
+                              json.dumps(triggers) if triggers is not None else None))
+            record = record_of(wf)
+            for pid in record.policy_ids:
+                links.append((acct, wf.get('id'), pid))
+            excluded = sorted(record.excluded_ids, key=int)
+            filters.append((acct, wf.get('id'), record.excludes_only, ','.join(excluded) if excluded else None))
+        self._upsert('workflows', (
+            'accountId', 'id', 'name', 'workflowEnabled', 'destinationsEnabled', 'lastRun', 'updatedAt', 'seq'
+        ), rows)
+        self._upsert('workflow_destinations', (
+            'accountId', 'workflowId', 'position', 'channelId', 'name', 'type', 'notificationTriggers'
+        ), dests)
+        self._upsert('workflow_policies', ('accountId', 'workflowId', 'policyId'), links)
+        self._upsert('workflow_filters', ('accountId', 'workflowId', 'excludesOnly', 'excludedPolicyIds'), filters)
+
+    def upsert_users(self, users):
+        self._upsert('users', ('email', 'name', 'seq'), (
+            (u.get('email'), u.get('name'), self._next_seq()) for u in users
+        ))
+
+    def upsert_entities(self, entities):
+        self._upsert('entities', ('guid', 'type', 'name', 'accountId', 'reporting', 'body', 'seq'), (
+            (e.get('guid'), e.get('type'), e.get('name'), e.get('accountId'), e.get('reporting'),
+             json.dumps(e, default=str), self._next_seq())
+            for e in entities if e.get('guid')
+        ))
+
+    def _select(self, sql, accounts):
+        accounts = [str(a) for a in accounts]
+        return self.conn.execute(sql.format(accounts=', '.join('?' for _ in accounts)), accounts)
+
+    # -----------------------------
+    # Correlation sheets (same rows and order as the in-memory builders)
+    # -----------------------------
+
+    def workflow_policy_map(self, accounts):
+        rows = []
+        pending = None  # workflow without destinations: its policies collapse into one row
+        for (acct, wf_id, wf_name, position, cid, ch_name, ch_type, pid, pname,
+             excludes_only, excluded) in self._select(WORKFLOW_POLICY_MAP_SQL, accounts):
+            filter_columns = {'Excludes Only': _bool(excludes_only), 'Excluded Policy IDs': excluded}
+            if position is None:
+                if pending is None or pending['key'] != (acct, wf_id):
+                    pending = {'key': (acct, wf_id), 'policies': {}, 'row': {
+                        'Account ID': acct, 'Workflow ID': wf_id, 'Workflow Name': wf_name,
+                        'Channel ID': None, 'Channel Name': None, 'Channel Type': None,
+                        'Policy ID': None, 'Policy Name': None, **filter_columns,
+                    }}
+                    rows.append(pending['row'])
+                if pid is not None:
+                    pending['policies'][pid] = pname or ''
+                    pids = sorted(pending['policies'])
+                    pending['row']['Policy ID'] = ','.join(pids)
+                    pending['row']['Policy Name'] = ','.join(pending['policies'][p] for p in pids)
+                continue
+            rows.append({
+                'Account ID': acct, 'Workflow ID': wf_id, 'Workflow Name': wf_name,
+                'Channel ID': cid, 'Channel Name': ch_name, 'Channel Type': ch_type,
+                'Policy ID': pid, 'Policy Name': pname, **filter_columns,
+            })
+        return rows
+
+    def legacy_channel_policy_map(self, accounts):
+        return [
+            {'Account ID': acct, 'Channel ID': cid, 'Channel Name': name, 'Channel Type': ctype,
+             'Policy ID': pid, 'Policy Name': pname}
+            for acct, cid, name, ctype, pid, pname in self._select(LEGACY_CHANNEL_POLICY_MAP_SQL, accounts)
+        ]
+
+    def policy_condition_workflow_map(self, accounts):
+        """Yield tuple rows in PCW_COLUMNS order straight off the cursor."""
+        enabled = PCW_COLUMNS.index('Workflow Enabled')
+        for values in self._select(POLICY_CONDITION_WORKFLOW_MAP_SQL, accounts):
+            yield values[:enabled] + (_bool(values[enabled]),) + values[enabled + 1:]
+
+    def close(self):
+        self.conn.close()
@@ -4,87 +4,172 @@
  Updated: 2024-07-01
      Why: Explore (POC) using code to query New Relic's GraphQL API.
     What: This script will list all infrastructure agents deployed in your New Relic account.
+
+Modes:
+  hosts (default)  one row per host: SystemSample is aggregated server-side with
+                   `latest()` per `FACET entityGuid`. When a facet page comes back
+                   full (LIMIT MAX facets), its entityId range is halved and each
+                   half is queried again, so fleets above the facet cap are covered.
+  raw              every raw sample (exported in time windows by nrql_export,
+                   so nothing is lost to the row cap), deduplicated in Python.
+Both modes write nr-infra-agents-list.csv through the csv module.
+
+Usage:
+  python list-infra-agents.py
+  python list-infra-agents.py --account-id 1234567 --since "3 days ago"
+  python list-infra-agents.py --mode raw
+  python list-infra-agents.py --async      # poll async NRQL instead of the 120s synchronous timeout
 """
-import requests
-import json
+import argparse
+import csv
 import os
-import pprint as pp
+from collections import Counter
 from dotenv import load_dotenv
 
+import nrql_async
+import nrql_export
+from nerdgraph_client import NerdGraphClient
+
 load_dotenv()
 
 API_KEY = os.getenv('NR_API_KEY')
+ACCOUNT_ID = os.getenv('ACCOUNT_ID', '837777')
 
 # Define the URL
 url = "https://api.newrelic.com/graphql"
 
-# Define the headers
-headers = {
-    "Content-Type": "application/json",
-    "API-Key": API_KEY
-}
-
-query = """
-{
-  actor {
-    account(id: 837777) {
-      nrql(query: "SELECT agentName,agentVersion,entityGuid,entityId,entityKey,entityName,fullHostname,hostStatus,hostname,instanceType,linuxDistribution,operatingSystem,regionName,subscriptionId,tags.environment FROM SystemSample WHERE agentName = 'Infrastructure' SINCE 1 day ago LIMIT MAX") {
-        results
-      }
-    }
-  }
-}
-"""
-
-#  {'agentName','agentVersion','entityGuid','entityId','entityKey','entityName','fullHostname','hostStatus','hostname','instanceType','linuxDistribution','operatingSystem','regionName','subscriptionId', 'tags.environment'}
-
-# Send the request
-response = requests.post(url, headers=headers, data=json.dumps({"query": query}))
-
-# Parse the response
-data = response.json()
-
-results = []
-
-# Extract the entities
-entities = data['data']['actor']['account']['nrql']['results']
-
-
-# Filter the entities that have a version greater than 1.52.3
-filtered_entities = [entity for entity in entities if entity["agentVersion"] != "1.52.3"]
-
-# row_num = 1
-# entity_set = set()
-# for entity in filtered_entities: #set_entities:
-#     results.append([entity['hostname'], entity['agentVersion']])
-#     row_num += 1
-# thing = results.sort()
-
-# print(len(filtered_entities))
-count = 0
-frozenset_set = set(frozenset(d.items()) for d in entities)
-unique_entities = [dict(fs) for fs in frozenset_set]
-with open('nr-infra-agents-list.csv', 'w') as f:
-    # final_list = []
-    dup_entities = []
-    for entity in unique_entities:
-        dup_entities.append(entity)
-    # using pipe-delimiting as some of the values have comma in them
-    # must implement CSV module that will automatically handle commas in values
-    f.write(f"count|agentName|agentVersion|fullHostname|hostname|hostStatus|instanceType|linuxDistribution|operatingSystem\n")
-    for entity in unique_entities:
-        e_count = 0
-        for d_entity in dup_entities:
-            if d_entity == entity:
-                e_count += 1
-              
-        count += 1
-        pp.pprint(entity)
-        # final_list.append(entity)
-        f.write(f"{count}|{entity['agentName']}|{entity['agentVersion']}|{entity['fullHostname']}|{entity['hostname']}|{entity['hostStatus']}|{entity['instanceType']}|{entity['linuxDistribution']}|{entity['operatingSystem']}\n")
-
-
-# debug
-print(type(entities))
-# print(data['data']['actor']['account']['nrql']['results'])
-# print(entities)
+OUTPUT_FILE = 'nr-infra-agents-list.csv'
+
+# Most facets one NRQL query returns with LIMIT MAX
+NRQL_LIMIT = 5000
+
+ATTRIBUTES = ['agentName', 'agentVersion', 'entityGuid', 'entityId', 'entityKey', 'entityName', 'fullHostname',
+              'hostStatus', 'hostname', 'instanceType', 'linuxDistribution', 'operatingSystem', 'regionName',
+              'subscriptionId', 'tags.environment']
+
+CSV_COLUMNS = ['count', 'agentName', 'agentVersion', 'fullHostname', 'hostname', 'hostStatus', 'instanceType',
+               'linuxDistribution', 'operatingSystem']
+
+WHERE = "agentName = 'Infrastructure'"
+
+client = NerdGraphClient(api_key=API_KEY, url=url)
+
+# Set by --async: queries are submitted asynchronously and polled instead of timing out at 120s
+async_runner = None
+
+
+def run_nrql(account_id, nrql):
+    if async_runner is not None:
+        return async_runner.run(account_id, nrql)
+    return nrql_export.run_nrql(account_id, nrql, client=client)
+
+
+# -----------------------------
+# hosts mode: one row per entityGuid
+# -----------------------------
+
+def host_query(since_ms, where):
+    selects = ', '.join(f"latest(`{a}`) AS '{a}'" for a in ATTRIBUTES if a != 'entityGuid')
+    return (f"SELECT {selects}, count(*) AS 'samples' FROM SystemSample WHERE {where} "
+            f"SINCE {since_ms} FACET entityGuid LIMIT MAX")
+
+
+def entity_id_range(account_id, since_ms):
+    rows = run_nrql(account_id, f"SELECT min(entityId) AS 'low', max(entityId) AS 'high' "
+                                f"FROM SystemSample WHERE {WHERE} SINCE {since_ms}")
+    row = rows[0] if rows else {}
+    if row.get('low') is None or row.get('high') is None:
+        return None
+    return int(row['low']), int(row['high'])
+
+
+def fetch_hosts(account_id, since):
+    """
+    [host dict] with one entry per entityGuid. Starts with the whole entityId
+    range; any range whose facet page is full is split in two and re-queried.
+    """
+    # Same meaning of --since as raw mode: dates, epoch values and 'N units ago' all become epoch ms
+    since_ms = nrql_export.parse_time(since)
+    bounds = entity_id_range(account_id, since_ms)
+    if bounds is None:
+        return []
+    hosts = {}
+    pending = [(bounds[0], bounds[1] + 1)]  # half-open [low, high)
+    while pending:
+        low, high = pending.pop()
+        rows = run_nrql(account_id, host_query(since_ms, f"{WHERE} AND entityId >= {low} AND entityId < {high}"))
+        if len(rows) >= NRQL_LIMIT and high - low > 1:
+            middle = (low + high) // 2
+            pending += [(middle, high), (low, middle)]
+            print(f"  entityId range [{low}, {high}) hit the {NRQL_LIMIT} facet cap; splitting")
+            continue
+        if len(rows) >= NRQL_LIMIT:
+            print(f"  warning: entityId {low} alone has {len(rows)}+ hosts; some may be missing")
+        for row in rows:
+            guid = row.get('entityGuid') or row.get('facet')
+            hosts[guid] = dict(row, entityGuid=guid)
+    return list(hosts.values())
+
+
+def write_hosts(hosts, filename=OUTPUT_FILE):
+    # Several entityGuids reporting under one hostname usually means a re-installed or cloned agent
+    guids_per_hostname = Counter(h.get('hostname') for h in hosts)
+    columns = CSV_COLUMNS + ['entityGuid', 'samples', 'hostname_guids']
+    hosts = sorted(hosts, key=lambda h: (str(h.get('hostname')), str(h.get('entityGuid'))))
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        w = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        w.writeheader()
+        for count, host in enumerate(hosts, 1):
+            w.writerow(dict(host, count=count, hostname_guids=guids_per_hostname[host.get('hostname')]))
+    duplicated = sum(1 for n in guids_per_hostname.values() if n > 1)
+    print(f"{len(hosts)} host(s), {duplicated} hostname(s) reported by more than one entityGuid")
+
+
+# -----------------------------
+# raw mode: raw samples, deduplicated locally
+# -----------------------------
+
+def fetch_raw(account_id, since, workers=nrql_export.DEFAULT_WORKERS):
+    exporter = nrql_export.NrqlExporter(account_id, workers=workers, runner=lambda nrql: run_nrql(account_id, nrql))
+    nrql = f"SELECT {','.join(ATTRIBUTES)} FROM SystemSample WHERE {WHERE}"
+    return exporter.rows(nrql, nrql_export.parse_time(since), nrql_export.parse_time('now'))
+
+
+def write_raw(entities, filename=OUTPUT_FILE):
+    # One pass: identical samples collapse onto one key and are counted
+    copies = Counter(tuple(sorted(e.items(), key=lambda kv: kv[0])) for e in entities)
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        w = csv.DictWriter(f, fieldnames=CSV_COLUMNS + ['duplicates'], extrasaction='ignore')
+        w.writeheader()
+        for count, (items, n) in enumerate(copies.items(), 1):
+            w.writerow(dict(items, count=count, duplicates=n))
+    print(f"{len(entities)} sample(s), {len(copies)} unique")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="List the infrastructure agents reporting to an account.")
+    parser.add_argument('--mode', choices=['hosts', 'raw'], default='hosts',
+                        help='hosts: one aggregated row per host (default); raw: deduplicated raw samples')
+    parser.add_argument('--account-id', default=ACCOUNT_ID)
+    parser.add_argument('--since', default='1 day ago', help="'N units ago', an ISO date or epoch seconds/ms (default: %(default)s)")
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Run NRQL asynchronously and poll for results (for fleets whose queries time out)')
+    return parser.parse_args()
+
+
+def main():
+    global async_runner
+    args = parse_args()
+    if args.use_async:
+        async_runner = nrql_async.AsyncNrqlRunner(client=client)
+    print(f"Listing infrastructure agents for account {args.account_id} since {args.since} ({args.mode})...")
+    if args.mode == 'hosts':
+        write_hosts(fetch_hosts(args.account_id, args.since), args.output)
+    else:
+        write_raw(fetch_raw(args.account_id, args.since), args.output)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+  What: Shared, pooled HTTP client for New Relic's NerdGraph (and REST) APIs.
+  Why:  Exporters page through thousands of collections per run. Posting each
+        page with a bare requests.post() opens a fresh TLS connection every
+        time; going through one keep-alive Session lets pages reuse sockets.
+        Every request is paced and retried by request_scheduler.
+"""
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+import request_scheduler
+
+load_dotenv()
+
+URL = "https://api.newrelic.com/graphql"
+
+DEFAULT_POOL_SIZE = int(os.getenv('NR_POOL_SIZE', '10'))
+DEFAULT_TIMEOUT = float(os.getenv('NR_REQUEST_TIMEOUT', '60'))
+
+
+def default_api_key():
+    return os.getenv('NR_API_KEY') or os.getenv('NEW_RELIC_USER_KEY') or os.getenv('NEW_RELIC_API_KEY')
+
+
+class NerdGraphError(RuntimeError):
+    """NerdGraph answered with errors and no data."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        messages = '; '.join(str(e.get('message', e)) for e in errors) if isinstance(errors, list) else str(errors)
+        super().__init__(f"NerdGraph error: {messages}")
+
+
+class NerdGraphClient:
+    """
+    Thin wrapper around a pooled requests.Session.
+
+    pool_size bounds how many keep-alive connections are kept per host; it
+    should be at least the number of threads sharing the client.
+    timeout is the default per-request timeout (seconds) and can be
+    overridden on each call.
+    scheduler defaults to the process-wide request_scheduler, so clients
+    sharing an API key also share its rate limits.
+    cache is an optional response_cache.ResponseCache consulted by query().
+    """
+
+    def __init__(self, api_key=None, url=URL, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 scheduler=None, cache=None):
+        self.api_key = api_key or default_api_key()
+        self.scheduler = scheduler or request_scheduler.get_scheduler()
+        self.cache = cache
+        self.url = url
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({"Content-Type": "application/json", "API-Key": self.api_key})
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """Send any HTTP request (REST v2, Synthetics v3, ...) over the pooled session."""
+        return self.scheduler.send(
+            self.api_key, url,
+            lambda: self.session.request(method, url, timeout=timeout or self.timeout, **kwargs),
+        )
+
+    def post(self, query, variables=None, timeout=None):
+        """POST a GraphQL document to NerdGraph and return the raw Response."""
+        payload = {'query': query}
+        if variables is not None:
+            payload['variables'] = variables
+        return self.request('POST', self.url, timeout=timeout, json=payload)
+
+    def query(self, query, variables=None, timeout=None):
+        """
+        POST a GraphQL document to NerdGraph and return the decoded JSON body.
+        Raises requests.HTTPError once retries are exhausted, and NerdGraphError
+        when the body carries errors but no data.
+        Error-free responses are served from / stored in the cache when one is set.
+        """
+        if self.cache is not None:
+            body = self.cache.get(self.api_key, query, variables)
+            if body is not None:
+                return body
+        response = self.post(query, variables=variables, timeout=timeout)
+        response.raise_for_status()
+        body = response.json()
+        if body.get('errors') and not body.get('data'):
+            raise NerdGraphError(body['errors'])
+        if self.cache is not None and not body.get('errors'):
+            self.cache.put(self.api_key, query, variables, body)
+        return body
+
+    def connection_stats(self):
+        """
+        Return {'requests', 'opened', 'reused'} across every host pool the
+        session has talked to. reused = requests served on an existing socket.
+        """
+        opened = 0
+        served = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                opened += pool.num_connections
+                served += pool.num_requests
+        return {'requests': served, 'opened': opened, 'reused': max(served - opened, 0)}
+
+    def print_connection_stats(self):
+        stats = self.connection_stats()
+        print(f"NerdGraph client: {stats['requests']} requests, "
+              f"{stats['opened']} connections opened, {stats['reused']} reused, "
+              f"{self.scheduler.retries} retried ({self.scheduler.throttled} throttled)")
+        if self.cache is not None:
+            print(f"Response cache: {self.cache.hits} hits, {self.cache.misses} misses ({self.cache.path})")
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+# -----------------------------
+# Process-wide default client
+# -----------------------------
+
+_client = None
+
+
+def get_client():
+    """Return the shared client, creating it with env defaults on first use."""
+    global _client
+    if _client is None:
+        _client = NerdGraphClient()
+    return _client
+
+
+def configure(api_key=None, pool_size=None, timeout=None, cache=None):
+    """Replace the shared client (e.g. after CLI flags are parsed)."""
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = NerdGraphClient(
+        api_key=api_key,
+        pool_size=pool_size or DEFAULT_POOL_SIZE,
+        timeout=timeout or DEFAULT_TIMEOUT,
+        cache=cache,
+    )
+    return _client
@@ -1,16 +1,14 @@
-import requests
 import csv
 import os
 from datetime import datetime
 from dotenv import load_dotenv
+from nerdgraph_client import get_client
 
 load_dotenv()
 
 API_KEY = os.getenv('NR_API_KEY')
 ACCOUNT_ID = os.getenv('ACCOUNT_ID')
 
-URL = "https://api.newrelic.com/graphql"
-HEADERS = {"Content-Type": "application/json", "API-Key": API_KEY}
 TIMESTAMP = datetime.now().strftime("%Y%m%d-%H%M%S")
 
 
@@ -44,7 +42,7 @@ def run_graphql_query(query, filename, cursor=None):
             query = query.replace('nrqlConditionsSearch', f'nrqlConditionsSearch(cursor: "{cursor}")')
         else:
             query = query.replace('results', f'results(cursor: "{cursor}")')
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
+    response = get_client().post(query)
     response.raise_for_status()
     return response.json()
 
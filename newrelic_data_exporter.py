@@ -1,23 +1,37 @@
 import argparse
 import csv
+import itertools
 import json
 import os
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-import pandas as pd
 import requests
 from dotenv import load_dotenv
 
+import columnar_writer
+import entity_crawl
+import incremental
+import inventory_db
+import nerdgraph_client
+import request_scheduler
+import response_cache
+import workflow_filters
+from nerdgraph_client import NerdGraphError, get_client
+from workbook_writer import StreamingWorkbook
+
 load_dotenv()
 
 API_KEY = os.getenv('NR_API_KEY') or os.getenv('NEW_RELIC_USER_KEY') or os.getenv('NEW_RELIC_API_KEY')
 # Back-compat: script historically used ACCOUNT_ID env var for single-account operations
 ENV_ACCOUNT_ID = os.getenv('ACCOUNT_ID')
 
-URL = "https://api.newrelic.com/graphql"
-HEADERS = {"Content-Type": "application/json", "API-Key": API_KEY}
 TIMESTAMP = datetime.now().strftime("%Y%m%d-%H%M%S")
+# Number of accounts whose cursor chains run in parallel (set from --concurrency)
+CONCURRENCY = 1
+# Accounts packed into one aliased first-page request (set from --batch-size)
+BATCH_SIZE = 1
 
 # -----------------------------
 # Utility helpers
@@ -35,7 +49,21 @@ def convert_epoch_to_formatted_date(epoch):
 
 
 def write_csv(filename, rows, field_order=None):
-    if not rows:
+    """
+    rows may be any iterable (e.g. a generator). With field_order the rows are
+    written as they are consumed; without it they are materialised to compute
+    the union of keys.
+    """
+    if field_order:
+        # Peek so an empty stream still reports "No data" without creating a file
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is not None:
+            rows = itertools.chain([first], rows)
+    else:
+        rows = list(rows)
+        first = rows[0] if rows else None
+    if first is None:
         print(f"No data to write for {filename}.")
         return
     # Collect union of keys if no explicit header order provided
@@ -56,7 +84,7 @@ def fetch_apm_agents(cursor=None):
     {
       actor { entitySearch(queryBuilder: {type: APPLICATION}) {
         results { entities {
-          name
+          name guid
           ... on ApmApplicationEntityOutline {
             reporting
             language
@@ -70,7 +98,7 @@ def fetch_apm_agents(cursor=None):
     """
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
-    return requests.post(URL, headers=HEADERS, json={'query': query}).json()
+    return get_client().query(query)
 
 
 def fetch_dashboard_data(cursor=None):
@@ -79,7 +107,7 @@ def fetch_dashboard_data(cursor=None):
       actor { entitySearch(queryBuilder: {type: DASHBOARD}) {
         results { entities {
           ... on DashboardEntityOutline {
-            name accountId entityType lastReportingChangeAt
+            name guid accountId entityType lastReportingChangeAt
             owner { email }
             permissions permalink reporting
           }
@@ -91,7 +119,7 @@ def fetch_dashboard_data(cursor=None):
     """
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
-    return requests.post(URL, headers=HEADERS, json={'query': query}).json()
+    return get_client().query(query)
 
 
 def fetch_infra_agents(cursor=None):
@@ -100,7 +128,7 @@ def fetch_infra_agents(cursor=None):
       actor { entitySearch(queryBuilder: {type: HOST}) {
         results { entities {
           ... on InfrastructureHostEntityOutline {
-            name accountId entityType lastReportingChangeAt permalink reporting
+            name guid accountId entityType lastReportingChangeAt permalink reporting
           }
         }
         nextCursor
@@ -110,7 +138,7 @@ def fetch_infra_agents(cursor=None):
     """
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
-    return requests.post(URL, headers=HEADERS, json={'query': query}).json()
+    return get_client().query(query)
 
 
 def fetch_synthetic_monitors(cursor=None):
@@ -132,7 +160,7 @@ def fetch_synthetic_monitors(cursor=None):
     """
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
-    return requests.post(URL, headers=HEADERS, json={'query': query}).json()
+    return get_client().query(query)
 
 
 def fetch_user_accounts(cursor=None):
@@ -146,39 +174,55 @@ def fetch_user_accounts(cursor=None):
     """
     if cursor:
         query = query.replace('userSearch', f'userSearch(cursor: "{cursor}")')
-    return requests.post(URL, headers=HEADERS, json={'query': query}).json()
+    return get_client().query(query)
 
 
 # -----------------------------
-# Policies & NRQL Conditions (per-account)
+# Per-account selections
+# Each returns the selection placed under `account(id: X) { ... }`, so the same
+# text serves single-account pages and aliased multi-account batches.
 # -----------------------------
 
-def fetch_policies(account_id, cursor=None):
-    query = f"""
+def _cursor_arg(cursor):
+    return f'(cursor: "{cursor}")' if cursor else ''
+
+
+def account_query(account_id, selection):
+    return f"""
     {{
       actor {{
         account(id: {account_id}) {{
+          {selection}
+        }}
+      }}
+    }}
+    """
+
+
+# -----------------------------
+# Policies & NRQL Conditions (per-account)
+# -----------------------------
+
+def policies_selection(cursor=None):
+    return f"""
           alerts {{
-            policiesSearch{f'(cursor: "{cursor}")' if cursor else ''} {{
+            policiesSearch{_cursor_arg(cursor)} {{
               nextCursor
               policies {{ id name incidentPreference }}
             }}
           }}
-        }}
-      }}
-    }}
     """
-    return requests.post(URL, headers=HEADERS, json={'query': query}).json()
 
 
-def fetch_alert_conditions(account_id, cursor=None):
+def fetch_policies(account_id, cursor=None):
+    return get_client().query(account_query(account_id, policies_selection(cursor)))
+
+
+def alert_conditions_selection(cursor=None):
     # Expanded to include enabled, nrql{query}, and terms via inline fragments for each NRQL condition subtype
-    query = f"""
-    {{
-      actor {{
-        account(id: {account_id}) {{
+    return f"""
           alerts {{
-            nrqlConditionsSearch{f'(cursor: "{cursor}")' if cursor else ''} {{
+            nrqlConditionsSearch{_cursor_arg(cursor)} {{
               nextCursor
               nrqlConditions {{
                 id
@@ -226,46 +270,40 @@ def fetch_alert_conditions(account_id, cursor=None):
               }}
             }}
           }}
-        }}
-      }}
-    }}
     """
-    return requests.post(URL, headers=HEADERS, json={'query': query}).json()
+
+
+def fetch_alert_conditions(account_id, cursor=None):
+    return get_client().query(account_query(account_id, alert_conditions_selection(cursor)))
 
 
 # -----------------------------
 # AI Notifications Channels (new platform, used by Workflows)
 # -----------------------------
 
-def fetch_notification_channels_ai(account_id, cursor=None):
-    query = f"""
-    {{
-      actor {{
-        account(id: {account_id}) {{
+def notification_channels_ai_selection(cursor=None):
+    return f"""
           aiNotifications {{
-            channels{f'(cursor: "{cursor}")' if cursor else ''} {{
+            channels{_cursor_arg(cursor)} {{
               nextCursor
               entities {{ id name type destinationId product }}
             }}
           }}
-        }}
-      }}
-    }}
     """
-    return requests.post(URL, headers=HEADERS, json={'query': query}).json()
+
+
+def fetch_notification_channels_ai(account_id, cursor=None):
+    return get_client().query(account_query(account_id, notification_channels_ai_selection(cursor)))
 
 
 # -----------------------------
 # Legacy Alerts Notification Channels (deprecated platform)
 # -----------------------------
 
-def fetch_notification_channels_legacy(account_id, cursor=None):
-    query = f"""
-    {{
-      actor {{
-        account(id: {account_id}) {{
+def notification_channels_legacy_selection(cursor=None):
+    return f"""
           alerts {{
-            notificationChannels{f'(cursor: "{cursor}")' if cursor else ''} {{
+            notificationChannels{_cursor_arg(cursor)} {{
               nextCursor
               channels {{
                 id name type
@@ -273,22 +311,19 @@ def fetch_notification_channels_legacy(account_id, cursor=None):
               }}
             }}
           }}
-        }}
-      }}
-    }}
     """
-    return requests.post(URL, headers=HEADERS, json={'query': query}).json()
+
+
+def fetch_notification_channels_legacy(account_id, cursor=None):
+    return get_client().query(account_query(account_id, notification_channels_legacy_selection(cursor)))
 
 
 # -----------------------------
 # Workflows (full objects including issuesFilter and destinationConfigurations)
 # -----------------------------
 
-def fetch_workflows_page(account_id, cursor=None):
-    query = f"""
-    {{
-      actor {{
-        account(id: {account_id}) {{
+def workflows_selection(cursor=None):
+    return f"""
           aiWorkflows {{
             workflows(filters: {{}}{f', cursor: "{cursor}"' if cursor else ''}) {{
               nextCursor
@@ -302,31 +337,207 @@ def fetch_workflows_page(account_id, cursor=None):
               }}
             }}
           }}
-        }}
-      }}
-    }}
     """
-    return requests.post(URL, headers=HEADERS, json={'query': query}).json()
+
+
+def fetch_workflows_page(account_id, cursor=None):
+    return get_client().query(account_query(account_id, workflows_selection(cursor)))
+
+
+# collection -> (selection builder, path below account{}, items key)
+ACCOUNT_COLLECTIONS = {
+    'policies': (policies_selection, ('alerts', 'policiesSearch'), 'policies'),
+    'alert_conditions': (alert_conditions_selection, ('alerts', 'nrqlConditionsSearch'), 'nrqlConditions'),
+    'notification_channels_ai': (notification_channels_ai_selection, ('aiNotifications', 'channels'), 'entities'),
+    'notification_channels_legacy': (notification_channels_legacy_selection, ('alerts', 'notificationChannels'), 'channels'),
+    'workflows': (workflows_selection, ('aiWorkflows', 'workflows'), 'entities'),
+}
 
 
 # -----------------------------
 # High-level collectors that iterate accounts and pages
 # -----------------------------
 
+def _section(account_data, section_path):
+    section = account_data
+    for key in section_path:
+        section = section[key]
+    return section
+
+
+def _tag_account(items, account_id):
+    for item in items:
+        item['accountId'] = str(account_id)
+    return items
+
+
+def fetch_account_pages(account_id, collection, cursor=None):
+    """Follow one account's cursor chain (from `cursor`, or the start) and return its items tagged with accountId."""
+    selection, section_path, items_key = ACCOUNT_COLLECTIONS[collection]
+    items = []
+    while True:
+        data = get_client().query(account_query(account_id, selection(cursor)))
+        section = _section(data['data']['actor']['account'], section_path)
+        items.extend(_tag_account(section[items_key], account_id))
+        cursor = section.get('nextCursor')
+        if not cursor:
+            break
+    return items
+
+
+def fetch_first_pages_batch(collection, account_ids):
+    """
+    Fetch the first page of several accounts in one document using aliases:
+      actor { a0: account(id: X) {...} a1: account(id: Y) {...} }
+    Returns {account_id: (items, nextCursor)}. Accounts whose alias comes back
+    null (e.g. no access) are left out so the caller can retry them singly;
+    so is the whole batch when the aliased document itself fails (e.g. too
+    complex for NerdGraph at a large --batch-size).
+    """
+    selection, section_path, items_key = ACCOUNT_COLLECTIONS[collection]
+    body = selection(None)
+    aliases = "\n".join(f"a{i}: account(id: {a}) {{ {body} }}" for i, a in enumerate(account_ids))
+    try:
+        data = get_client().query(f"{{ actor {{ {aliases} }} }}")
+    except (NerdGraphError, requests.HTTPError) as e:
+        print(f"Batched {collection} request for {len(account_ids)} account(s) failed, fetching them singly: {e}")
+        return {}
+    actor = (data.get('data') or {}).get('actor') or {}
+    pages = {}
+    for i, account_id in enumerate(account_ids):
+        account_data = actor.get(f'a{i}')
+        if not account_data:
+            continue
+        section = _section(account_data, section_path)
+        pages[account_id] = (_tag_account(section[items_key], account_id), section.get('nextCursor'))
+    return pages
+
+
+class EntityStore:
+    """
+    Per-run memo of per-account collections keyed by (collection, accountId).
+    The first caller fetches from NerdGraph; every later caller (CSV writers,
+    correlations, map builders) gets the cached items instead of re-crawling.
+    Items are handed out as shallow copies so callers can add derived
+    columns without leaking them into each other.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._loading = {}  # key -> lock held while that key's loader runs
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.hits = 0
+
+    def has(self, collection, account_id):
+        with self._lock:
+            return (collection, str(account_id)) in self._data
+
+    def put(self, collection, account_id, items):
+        with self._lock:
+            self._data[(collection, str(account_id))] = items
+            self.fetches += 1
+
+    def get(self, collection, account_id, loader):
+        key = (collection, str(account_id))
+        with self._lock:
+            cached = self._data.get(key)
+            if cached is not None:
+                self.hits += 1
+                return [dict(item) for item in cached]
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        # One loader per key: concurrent callers wait for the first load instead of repeating it
+        with key_lock:
+            with self._lock:
+                cached = self._data.get(key)
+                if cached is not None:
+                    self.hits += 1
+            if cached is None:
+                cached = loader()
+                self.put(collection, account_id, cached)
+        return [dict(item) for item in cached]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._loading.clear()
+
+
+STORE = EntityStore()
+
+
+def _run_all(fn, args):
+    """Map fn over args, in a thread pool when CONCURRENCY > 1; results keep input order."""
+    if CONCURRENCY > 1 and len(args) > 1:
+        with ThreadPoolExecutor(max_workers=min(CONCURRENCY, len(args))) as pool:
+            return list(pool.map(fn, args))
+    return [fn(a) for a in args]
+
+
+def _prefetch_batched(collection, accounts):
+    """
+    Fill STORE for accounts not crawled yet: first pages go out BATCH_SIZE
+    accounts per aliased request, then only accounts with a nextCursor
+    follow their own cursor chain.
+    """
+    missing = [a for a in accounts if not STORE.has(collection, a)]
+    if BATCH_SIZE <= 1 or len(missing) <= 1:
+        return
+    batches = [missing[i:i + BATCH_SIZE] for i in range(0, len(missing), BATCH_SIZE)]
+    first_pages = {}
+    for pages in _run_all(lambda batch: fetch_first_pages_batch(collection, batch), batches):
+        first_pages.update(pages)
+
+    def finish(account_id):
+        items, cursor = first_pages[account_id]
+        if cursor:
+            items = items + fetch_account_pages(account_id, collection, cursor)
+        return items
+
+    done = [a for a in missing if a in first_pages]
+    for account_id, items in zip(done, _run_all(finish, done)):
+        STORE.put(collection, account_id, items)
+
+
+def collect_per_account(collection, accounts):
+    """
+    Run every account's cursor chain and concatenate the items in account order.
+    Chains already fetched this run are served from STORE.
+    With BATCH_SIZE > 1 first pages are fetched several accounts per request.
+    With CONCURRENCY > 1 the chains run in a thread pool; pool.map keeps the
+    input order, so output is identical to a serial run.
+    """
+    _prefetch_batched(collection, accounts)
+
+    def run(account_id):
+        return STORE.get(collection, account_id, lambda: fetch_account_pages(account_id, collection))
+
+    per_account = _run_all(run, accounts)
+    return [item for items in per_account for item in items]
+
+
+def load_policies(accounts):
+    return collect_per_account('policies', accounts)
+
+
+def load_alert_conditions(accounts):
+    return collect_per_account('alert_conditions', accounts)
+
+
+def load_notification_channels_ai(accounts):
+    return collect_per_account('notification_channels_ai', accounts)
+
+
+def load_notification_channels_legacy(accounts):
+    return collect_per_account('notification_channels_legacy', accounts)
+
+
+def load_workflows(accounts):
+    return collect_per_account('workflows', accounts)
+
+
 def get_all_policies(accounts):
-    results = []
-    for account_id in accounts:
-        cursor = None
-        while True:
-            data = fetch_policies(account_id, cursor)
-            section = data['data']['actor']['account']['alerts']['policiesSearch']
-            policies = section['policies']
-            for p in policies:
-                p['accountId'] = str(account_id)
-            results.extend(policies)
-            cursor = section.get('nextCursor')
-            if not cursor:
-                break
+    results = load_policies(accounts)
     # CSV
     write_csv(f'{TIMESTAMP}-policies.csv', results, field_order=['accountId','id','name','incidentPreference'])
     print(f'\n\n\tPlease see the output file named "{TIMESTAMP}-policies.csv"\n\n')
@@ -358,35 +569,21 @@ def _format_terms(terms):
 
 
 def get_all_alert_conditions(accounts, policies=None):
-    results = []
-    for account_id in accounts:
-        cursor = None
-        while True:
-            data = fetch_alert_conditions(account_id, cursor)
-            section = data['data']['actor']['account']['alerts']['nrqlConditionsSearch']
-            conds = section['nrqlConditions']
-
-            for c in conds:
-                c['accountId'] = str(account_id)
-
-                # NEW: nrqlQuery, threshold summary, enabled flag
-                nrql = (c.get('nrql') or {})
-                c['nrqlQuery'] = nrql.get('query')
-
-                c['threshold'] = _format_terms(c.get('terms'))
-                c['enabled'] = c.get('enabled')
-
-                # Format updatedAt (ms epoch) -> "YYYY-MM-DD"
-                if c.get('updatedAt') is not None:
-                    try:
-                        c['updatedAt'] = convert_epoch_to_formatted_date(c['updatedAt'])
-                    except Exception:
-                        pass
-
-            results.extend(conds)
-            cursor = section.get('nextCursor')
-            if not cursor:
-                break
+    results = load_alert_conditions(accounts)
+    for c in results:
+        # NEW: nrqlQuery, threshold summary, enabled flag
+        nrql = (c.get('nrql') or {})
+        c['nrqlQuery'] = nrql.get('query')
+
+        c['threshold'] = _format_terms(c.get('terms'))
+        c['enabled'] = c.get('enabled')
+
+        # Format updatedAt (ms epoch) -> "YYYY-MM-DD"
+        if c.get('updatedAt') is not None:
+            try:
+                c['updatedAt'] = convert_epoch_to_formatted_date(c['updatedAt'])
+            except Exception:
+                pass
 
     # Enrich with policy name if provided
     if policies:
@@ -413,19 +610,7 @@ def get_all_alert_conditions(accounts, policies=None):
 
 
 def get_all_notification_channels_ai(accounts):
-    results = []
-    for account_id in accounts:
-        cursor = None
-        while True:
-            data = fetch_notification_channels_ai(account_id, cursor)
-            section = data['data']['actor']['account']['aiNotifications']['channels']
-            entities = section['entities']
-            for ch in entities:
-                ch['accountId'] = str(account_id)
-            results.extend(entities)
-            cursor = section.get('nextCursor')
-            if not cursor:
-                break
+    results = load_notification_channels_ai(accounts)
     field_order = ['accountId','id','name','type','product','destinationId']
     write_csv(f'{TIMESTAMP}-notification-channels.csv', results, field_order=field_order)
     print(f'\n\n\tPlease see the output file named "{TIMESTAMP}-notification-channels.csv"\n\n')
@@ -433,38 +618,13 @@ def get_all_notification_channels_ai(accounts):
 
 
 def get_all_notification_channels_legacy(accounts):
-    results = []
-    for account_id in accounts:
-        cursor = None
-        while True:
-            data = fetch_notification_channels_legacy(account_id, cursor)
-            section = data['data']['actor']['account']['alerts']['notificationChannels']
-            channels = section['channels']
-            for ch in channels:
-                ch['accountId'] = str(account_id)
-            results.extend(channels)
-            cursor = section.get('nextCursor')
-            if not cursor:
-                break
+    results = load_notification_channels_legacy(accounts)
     # No CSV here by default (to avoid confusion with the AI list), but included in Excel.
     return results
 
 
 def get_all_workflows_full(accounts):
-    all_wf = []
-    for account_id in accounts:
-        cursor = None
-        while True:
-            data = fetch_workflows_page(account_id, cursor)
-            wf_section = data['data']['actor']['account']['aiWorkflows']['workflows']
-            entities = wf_section['entities']
-            for wf in entities:
-                wf['accountId'] = str(account_id)
-            all_wf.extend(entities)
-            cursor = wf_section.get('nextCursor')
-            if not cursor:
-                break
-    return all_wf
+    return load_workflows(accounts)
 
 
 def get_all_workflows_flat_csv(accounts):
@@ -516,19 +676,21 @@ def get_all_workflows_flat_csv(accounts):
 # Correlation builders
 # -----------------------------
 
+WORKFLOW_INDEX = workflow_filters.WorkflowIndex()
+
+
 def _extract_policy_ids_from_workflow(workflow):
-    """Extract numeric policy IDs from issuesFilter.predicates values when attribute includes 'policyId'."""
-    ids = set()
-    predicates = (workflow.get('issuesFilter') or {}).get('predicates') or []
-    if isinstance(predicates, dict):
-        predicates = [predicates]
-    for pred in predicates:
-        attr = (pred.get('attribute') or '').lower()
-        if 'policyid' in attr:  # matches labels.policyIds, labels.policyId, etc.
-            for v in (pred.get('values') or []):
-                for tok in re.findall(r'\d+', str(v)):
-                    ids.add(str(int(tok)))
-    return ids
+    """Policy IDs a workflow's issuesFilter routes (see workflow_filters); parsed once per workflow per run."""
+    return WORKFLOW_INDEX.policy_ids(workflow)
+
+
+def _workflow_filter_columns(record):
+    """Exclusion columns of the workflow sheet: exclusion-only filters route every policy but the excluded ones."""
+    excluded = sorted(record.excluded_ids, key=int)
+    return {
+        'Excludes Only': record.excludes_only,
+        'Excluded Policy IDs': ','.join(excluded) if excluded else None,
+    }
 
 
 def correlate_workflows_to_policies(accounts):
@@ -536,10 +698,10 @@ def correlate_workflows_to_policies(accounts):
     Correlate Workflows -> (AI Notifications) Channels -> Policies.
     Emits one row per (workflow × destination × policy) when policy filters exist; otherwise policy cols are empty.
     """
-    # Gather data
-    _, workflows_full = get_all_workflows_flat_csv(accounts)
-    channels = get_all_notification_channels_ai(accounts)
-    policies = get_all_policies(accounts)
+    # Gather data (served from STORE when main() already fetched it)
+    workflows_full = load_workflows(accounts)
+    channels = load_notification_channels_ai(accounts)
+    policies = load_policies(accounts)
 
     # Lookups scoped by account (policy IDs are only unique within an account)
     ch_lookup = {(str(ch.get('accountId')), str(ch.get('id'))): ch for ch in channels}
@@ -549,7 +711,9 @@ def correlate_workflows_to_policies(accounts):
     for wf in workflows_full:
         acct = str(wf.get('accountId'))
         dests = wf.get('destinationConfigurations') or []
-        policy_ids = _extract_policy_ids_from_workflow(wf)
+        record = WORKFLOW_INDEX.record(wf)
+        policy_ids = record.policy_ids
+        filter_columns = _workflow_filter_columns(record)
         if not dests:
             rows.append({
                 'Account ID': acct,
@@ -560,6 +724,7 @@ def correlate_workflows_to_policies(accounts):
                 'Channel Type': None,
                 'Policy ID': ','.join(sorted(policy_ids)) if policy_ids else None,
                 'Policy Name': ','.join(pol_lookup.get((acct, pid), '') for pid in sorted(policy_ids)) if policy_ids else None,
+                **filter_columns,
             })
             continue
         for d in dests:
@@ -576,6 +741,7 @@ def correlate_workflows_to_policies(accounts):
                         'Channel Type': ch.get('type'),
                         'Policy ID': pid,
                         'Policy Name': pol_lookup.get((acct, pid)),
+                        **filter_columns,
                     })
             else:
                 rows.append({
@@ -587,13 +753,14 @@ def correlate_workflows_to_policies(accounts):
                     'Channel Type': ch.get('type'),
                     'Policy ID': None,
                     'Policy Name': None,
+                    **filter_columns,
                 })
     return rows
 
 
 def correlate_legacy_channels_to_policies(accounts):
     """Correlate legacy Alerts notificationChannels to associatedPolicies (deprecated model)."""
-    channels = get_all_notification_channels_legacy(accounts)
+    channels = load_notification_channels_legacy(accounts)
     rows = []
     for ch in channels:
         acct = ch.get('accountId')
@@ -622,9 +789,35 @@ def correlate_legacy_channels_to_policies(accounts):
 
 # -----------------------------
 # Policy–Condition–Workflow–Channel map
+# The full expansion (policies × conditions × workflows × destinations) is the
+# largest thing the exporter produces, so it is generated lazily as plain
+# tuples in PCW_COLUMNS order. Tuples share the policy/condition/workflow
+# values instead of copying them into a 13-key dict per row.
 # -----------------------------
 
-def build_policy_condition_workflow_map(
+PCW_COLUMNS = inventory_db.PCW_COLUMNS
+
+_NO_CONDITION = (None, None, None)
+_NO_WORKFLOW = (None,) * 6
+_NO_CHANNEL = (None, None, None)
+
+
+class RowStream:
+    """
+    Re-iterable stream of tuple rows: every iteration calls factory() for a
+    fresh generator, so the CSV, columnar and Excel writers can each consume
+    the rows in turn without the whole list ever being held.
+    """
+
+    def __init__(self, columns, factory):
+        self.columns = columns
+        self.factory = factory
+
+    def __iter__(self):
+        return iter(self.factory())
+
+
+def iter_policy_condition_workflow_map(
     accounts,
     policies=None,
     conditions=None,
@@ -632,240 +825,327 @@ def build_policy_condition_workflow_map(
     ai_channels=None
 ):
     """
-    Build a comprehensive mapping:
+    Yield the mapping one tuple (see PCW_COLUMNS) at a time:
     Policy (id, name, incidentPreference)
       -> Condition(s) (id, name, type)
       -> Workflow(s) that reference the Policy (via issuesFilter labels.policyIds)
           -> Destination Channel(s) used by the Workflow (AI Notifications)
-
-    Returns a list of rows suitable for Excel export.
     """
 
-    # Fetch if not supplied
+    # Fetch if not supplied (served from STORE when already crawled this run)
     if policies is None:
-        policies = get_all_policies(accounts)
+        policies = load_policies(accounts)
     if conditions is None:
-        conditions = get_all_alert_conditions(accounts, policies=None)
+        conditions = load_alert_conditions(accounts)
     if workflows_full is None:
-        workflows_full = get_all_workflows_full(accounts)
+        workflows_full = load_workflows(accounts)
     if ai_channels is None:
-        ai_channels = get_all_notification_channels_ai(accounts)
+        ai_channels = load_notification_channels_ai(accounts)
 
     # Lookups
     conds_by_policy = {}
     for c in conditions:
         key = (str(c.get('accountId')), str(c.get('policyId')))
-        conds_by_policy.setdefault(key, []).append(c)
+        conds_by_policy.setdefault(key, []).append((c.get('id'), c.get('name'), c.get('type')))
 
-    wfs_by_policy = {}
+    ch_by_key = {(str(ch.get('accountId')), str(ch.get('id'))): ch for ch in ai_channels}
+
+    # Workflow + channel columns are the same for every policy/condition a
+    # workflow is paired with, so each workflow's tails are built once
+    tails_by_policy = {}
     for wf in workflows_full:
         acct = str(wf.get('accountId'))
+        wf_cols = (wf.get('id'), wf.get('name'), wf.get('workflowEnabled'))
+        tails = []
+        for d in wf.get('destinationConfigurations') or [None]:
+            if d is None:
+                tails.append(wf_cols + _NO_CHANNEL)
+                continue
+            cid = str(d.get('channelId')) if d.get('channelId') else None
+            ch = ch_by_key.get((acct, cid), {}) if cid else {}
+            tails.append(wf_cols + (cid, ch.get('name'), ch.get('type')))
         for pid in _extract_policy_ids_from_workflow(wf):
-            wfs_by_policy.setdefault((acct, pid), []).append(wf)
-
-    ch_by_key = {(str(ch.get('accountId')), str(ch.get('id'))): ch for ch in ai_channels}
+            tails_by_policy.setdefault((acct, pid), []).extend(tails)
 
-    rows = []
+    no_workflow = [_NO_WORKFLOW]
     for p in policies:
         acct = str(p.get('accountId'))
-        pid  = str(p.get('id'))
-        pname = p.get('name')
-        ipref = p.get('incidentPreference')
+        pid = str(p.get('id'))
+        head = (acct, pid, p.get('name'), p.get('incidentPreference'))
+        tails = tails_by_policy.get((acct, pid), no_workflow)
+        for cond in conds_by_policy.get((acct, pid), [_NO_CONDITION]):
+            prefix = head + cond
+            for tail in tails:
+                yield prefix + tail
 
-        conds = conds_by_policy.get((acct, pid), [None])
-        wfs   = wfs_by_policy.get((acct, pid), [None])
 
-        for c in conds:
-            c_id = c.get('id') if c else None
-            c_name = c.get('name') if c else None
-            c_type = c.get('type') if c else None
+def build_policy_condition_workflow_map(
+    accounts,
+    policies=None,
+    conditions=None,
+    workflows_full=None,
+    ai_channels=None
+):
+    """
+    Materialised form of iter_policy_condition_workflow_map: a list of dicts
+    keyed by PCW_COLUMNS. Prefer the iterator for large accounts.
+    """
+    rows = iter_policy_condition_workflow_map(accounts, policies, conditions, workflows_full, ai_channels)
+    return [dict(zip(PCW_COLUMNS, row)) for row in rows]
 
-            for wf in wfs:
-                if wf is None:
-                    rows.append({
-                        'Account ID': acct,
-                        'Policy ID': pid,
-                        'Policy Name': pname,
-                        'Incident Preference': ipref,
-                        'Condition ID': c_id,
-                        'Condition Name': c_name,
-                        'Condition Type': c_type,
-                        'Workflow ID': None,
-                        'Workflow Name': None,
-                        'Workflow Enabled': None,
-                        'Channel ID': None,
-                        'Channel Name': None,
-                        'Channel Type': None,
-                    })
-                    continue
-
-                dests = wf.get('destinationConfigurations') or [None]
-                for d in dests:
-                    if d is None:
-                        rows.append({
-                            'Account ID': acct,
-                            'Policy ID': pid,
-                            'Policy Name': pname,
-                            'Incident Preference': ipref,
-                            'Condition ID': c_id,
-                            'Condition Name': c_name,
-                            'Condition Type': c_type,
-                            'Workflow ID': wf.get('id'),
-                            'Workflow Name': wf.get('name'),
-                            'Workflow Enabled': wf.get('workflowEnabled'),
-                            'Channel ID': None,
-                            'Channel Name': None,
-                            'Channel Type': None,
-                        })
-                        continue
-
-                    cid = str(d.get('channelId')) if d.get('channelId') else None
-                    ch  = ch_by_key.get((acct, cid), {}) if cid else {}
-                    rows.append({
-                        'Account ID': acct,
-                        'Policy ID': pid,
-                        'Policy Name': pname,
-                        'Incident Preference': ipref,
-                        'Condition ID': c_id,
-                        'Condition Name': c_name,
-                        'Condition Type': c_type,
-                        'Workflow ID': wf.get('id'),
-                        'Workflow Name': wf.get('name'),
-                        'Workflow Enabled': wf.get('workflowEnabled'),
-                        'Channel ID': cid,
-                        'Channel Name': ch.get('name'),
-                        'Channel Type': ch.get('type'),
-                    })
-    return rows
+
+def write_policy_condition_workflow_map_csv(rows):
+    """Stream the map's tuple rows to CSV; returns the row count."""
+    output_file = f'{TIMESTAMP}-policy-condition-workflow-map.csv'
+    count = 0
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(PCW_COLUMNS)
+        for row in rows:
+            w.writerow(row)
+            count += 1
+    ROW_COUNTS['policy_condition_workflow_map'] = count
+    print(f'\n\n\tPlease see the output file named "{output_file}"\n\n')
+    return count
 
 
 # -----------------------------
 # High-level entity collectors (CSV parity)
+# Records stream page by page straight into their CSV through a declared
+# schema, so memory stays flat however large the account is. Rows are only
+# kept in memory when a caller asks for them (Excel / incremental output).
 # -----------------------------
 
-def get_all_apm_agents():
-    output_file = f'{TIMESTAMP}-apm-agent.csv'
-    results = []
+def iter_entities(fetch_page):
+    """Yield entities one page at a time from a single-type entitySearch cursor chain."""
     cursor = None
     while True:
-        data = fetch_apm_agents(cursor)
-        entities = data['data']['actor']['entitySearch']['results']['entities']
-        results.extend(entities)
-        cursor = data['data']['actor']['entitySearch']['results'].get('nextCursor')
+        data = fetch_page(cursor)
+        section = data['data']['actor']['entitySearch']['results']
+        yield from section['entities']
+        cursor = section.get('nextCursor')
         if not cursor:
             break
-    # Write CSV
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        w = csv.writer(f)
-        w.writerow(["name","reporting","language","max_version","min_version"])
-        for agent in results:
-            reporting = agent.get('reporting', 'Unknown')
-            language = agent.get('language', 'Unknown')
-            rav = agent.get('runningAgentVersions') or {}
-            w.writerow([
-                agent.get('name'),
-                reporting,
-                language,
-                rav.get('maxVersion') or 'None',
-                rav.get('minVersion') or 'None',
-            ])
-    return results
 
 
-def get_all_dashboard_data():
-    output_file = f'{TIMESTAMP}-dashboards.csv'
-    results = []
+def iter_users():
     cursor = None
     while True:
-        data = fetch_dashboard_data(cursor)
-        entities = data['data']['actor']['entitySearch']['results']['entities']
-        results.extend(entities)
-        cursor = data['data']['actor']['entitySearch']['results'].get('nextCursor')
+        data = fetch_user_accounts(cursor)
+        section = data['data']['actor']['users']['userSearch']
+        yield from section['users']
+        cursor = section.get('nextCursor')
         if not cursor:
             break
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        w = csv.writer(f)
-        w.writerow(["name","accountId","entityType","lastReportingChangeAt","owner","permissions","reporting","permalink"])
-        for d in results:
-            try:
-                w.writerow([
-                    d.get('name'), d.get('accountId'), d.get('entityType'),
-                    convert_epoch_to_formatted_date(d.get('lastReportingChangeAt')) if d.get('lastReportingChangeAt') else None,
-                    d.get('owner'), d.get('permissions'), d.get('reporting'), d.get('permalink')
-                ])
-            except Exception:
-                pass
-    return results
 
 
-def get_all_infra_agents():
-    output_file = f'{TIMESTAMP}-infra-agents.csv'
-    results = []
-    cursor = None
-    while True:
-        data = fetch_infra_agents(cursor)
-        entities = data['data']['actor']['entitySearch']['results']['entities']
-        results.extend(entities)
-        cursor = data['data']['actor']['entitySearch']['results'].get('nextCursor')
-        if not cursor:
-            break
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        w = csv.writer(f)
-        w.writerow(["name","accountId","entityType","lastReportingChangeAt","reporting","permalink"])
-        for e in results:
-            try:
-                w.writerow([
-                    e.get('name'), e.get('accountId'), e.get('entityType'),
-                    convert_epoch_to_formatted_date(e.get('lastReportingChangeAt')) if e.get('lastReportingChangeAt') else None,
-                    e.get('reporting'), e.get('permalink')
-                ])
-            except Exception:
-                pass
-    return results
+def _formatted_date(epoch):
+    return convert_epoch_to_formatted_date(epoch) if epoch else None
 
 
-def get_all_synthetic_monitors():
-    output_file = f'{TIMESTAMP}-synthetic-monitors.csv'
-    results = []
-    cursor = None
-    while True:
-        data = fetch_synthetic_monitors(cursor)
-        entities = data['data']['actor']['entitySearch']['results']['entities']
-        results.extend(entities)
-        cursor = data['data']['actor']['entitySearch']['results'].get('nextCursor')
-        if not cursor:
-            break
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        w = csv.writer(f)
-        w.writerow(["name","accountId","entityType","lastReportingChangeAt","status","locationsRunning","successRate","monitorType","monitoredUrl","period","reporting"])
-        for m in results:
-            ms = m.get('monitorSummary') or {}
-            w.writerow([
-                m.get('name'), m.get('accountId'), m.get('entityType'),
-                convert_epoch_to_formatted_date(m.get('lastReportingChangeAt')) if m.get('lastReportingChangeAt') else None,
-                ms.get('status'), ms.get('locationsRunning'), ms.get('successRate'),
-                m.get('monitorType'), m.get('monitoredUrl'), m.get('period'), m.get('reporting')
-            ])
-    return results
+def apm_agent_row(agent):
+    rav = agent.get('runningAgentVersions') or {}
+    return [
+        agent.get('name'),
+        agent.get('reporting', 'Unknown'),
+        agent.get('language', 'Unknown'),
+        rav.get('maxVersion') or 'None',
+        rav.get('minVersion') or 'None',
+    ]
 
 
-def get_all_users():
-    output_file = f'{TIMESTAMP}-list-users.csv'
-    results = []
-    cursor = None
-    while True:
-        data = fetch_user_accounts(cursor)
-        users = data['data']['actor']['users']['userSearch']['users']
-        results.extend(users)
-        cursor = data['data']['actor']['users']['userSearch'].get('nextCursor')
-        if not cursor:
-            break
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        w = csv.writer(f)
-        w.writerow(["email","name"])
-        for u in results:
-            w.writerow([u.get('email'), u.get('name')])
-    return results
+def dashboard_row(d):
+    return [
+        d.get('name'), d.get('accountId'), d.get('entityType'),
+        _formatted_date(d.get('lastReportingChangeAt')),
+        d.get('owner'), d.get('permissions'), d.get('reporting'), d.get('permalink')
+    ]
+
+
+def infra_agent_row(e):
+    return [
+        e.get('name'), e.get('accountId'), e.get('entityType'),
+        _formatted_date(e.get('lastReportingChangeAt')),
+        e.get('reporting'), e.get('permalink')
+    ]
+
+
+def synthetic_monitor_row(m):
+    ms = m.get('monitorSummary') or {}
+    return [
+        m.get('name'), m.get('accountId'), m.get('entityType'),
+        _formatted_date(m.get('lastReportingChangeAt')),
+        ms.get('status'), ms.get('locationsRunning'), ms.get('successRate'),
+        m.get('monitorType'), m.get('monitoredUrl'), m.get('period'), m.get('reporting')
+    ]
+
+
+def user_row(u):
+    return [u.get('email'), u.get('name')]
+
+
+# collection -> (file suffix, header, row builder, skip rows the builder fails on?)
+ENTITY_CSV_SCHEMAS = {
+    'apm_agents': ('apm-agent.csv', ["name","reporting","language","max_version","min_version"], apm_agent_row, False),
+    'dashboards': ('dashboards.csv', ["name","accountId","entityType","lastReportingChangeAt","owner","permissions","reporting","permalink"], dashboard_row, True),
+    'infras_agents': ('infra-agents.csv', ["name","accountId","entityType","lastReportingChangeAt","reporting","permalink"], infra_agent_row, True),
+    'synthetics': ('synthetic-monitors.csv', ["name","accountId","entityType","lastReportingChangeAt","status","locationsRunning","successRate","monitorType","monitoredUrl","period","reporting"], synthetic_monitor_row, False),
+    'users': ('list-users.csv', ["email","name"], user_row, False),
+}
+
+# Rows written per streamed collection this run (used by the summary report)
+ROW_COUNTS = {}
+
+
+class CsvStream:
+    """Append records to a collection's CSV as they arrive; only the open file is held."""
+
+    def __init__(self, collection, keep=False):
+        suffix, header, self.row_fn, self.skip_errors = ENTITY_CSV_SCHEMAS[collection]
+        self.collection = collection
+        self.kept = [] if keep else None
+        self.count = 0
+        self.skipped = 0
+        self.file = open(f'{TIMESTAMP}-{suffix}', 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(header)
+
+    def write(self, record):
+        try:
+            self.writer.writerow(self.row_fn(record))
+        except Exception:
+            if not self.skip_errors:
+                raise
+            # Only the CSV skips it: the record is still returned for Excel and the correlations
+            self.skipped += 1
+        else:
+            self.count += 1
+        if self.kept is not None:
+            self.kept.append(record)
+
+    def close(self):
+        self.file.close()
+        ROW_COUNTS[self.collection] = self.count
+        if self.skipped:
+            print(f"{self.skipped} {self.collection} record(s) left out of the CSV (row could not be built)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_collection(collection, records, keep=True):
+    """Write records (any iterable/generator) to the collection's CSV; return them as a list when keep."""
+    with CsvStream(collection, keep=keep) as out:
+        for record in records:
+            out.write(record)
+    return out.kept
+
+
+def export_entities(types, keep=True):
+    """
+    Stream one combined entitySearch crawl (see entity_crawl) into each
+    type's CSV as pages arrive. Returns {type: rows} (rows is None when keep=False).
+    """
+    streams = {t: CsvStream(entity_crawl.ENTITY_TYPES[t], keep=keep) for t in types}
+    try:
+        for entity in entity_crawl.iter_entities(types):
+            stream = streams.get(entity.get('type'))
+            if stream is not None:
+                stream.write(entity)
+    finally:
+        for stream in streams.values():
+            stream.close()
+    return {t: stream.kept for t, stream in streams.items()}
+
+
+def get_all_apm_agents(entities=None, keep=True):
+    return stream_collection('apm_agents', entities if entities is not None else iter_entities(fetch_apm_agents), keep)
+
+
+def get_all_dashboard_data(entities=None, keep=True):
+    return stream_collection('dashboards', entities if entities is not None else iter_entities(fetch_dashboard_data), keep)
+
+
+def get_all_infra_agents(entities=None, keep=True):
+    return stream_collection('infras_agents', entities if entities is not None else iter_entities(fetch_infra_agents), keep)
+
+
+def get_all_synthetic_monitors(entities=None, keep=True):
+    return stream_collection('synthetics', entities if entities is not None else iter_entities(fetch_synthetic_monitors), keep)
+
+
+def get_all_users(keep=True):
+    return stream_collection('users', iter_users(), keep)
+
+
+# -----------------------------
+# Incremental (snapshot + delta) export
+# -----------------------------
+
+# results_map key -> (record key fields, watermark field, crawled per account?)
+INCREMENTAL_COLLECTIONS = {
+    'apm_agents': (('guid',), None, False),
+    'dashboards': (('guid',), 'lastReportingChangeAt', False),
+    'infras_agents': (('guid',), 'lastReportingChangeAt', False),
+    'synthetics': (('guid',), 'lastReportingChangeAt', False),
+    'users': (('email',), None, False),
+    'alert_policies': (('id',), None, True),
+    'alert_conditions': (('id',), 'updatedAt', True),
+    'notifications': (('id',), None, True),
+    'workflows': (('id',), 'updatedAt', True),
+}
+
+
+def export_incremental(results_map, accounts, snapshot_dir=incremental.DEFAULT_DIR):
+    """
+    Merge each collection into its maintained snapshot and write:
+      <collection>-snapshot.csv               full current state (stable file name)
+      <TIMESTAMP>-<collection>-delta.csv      rows added/updated/removed since the last run
+    Watermarks are kept per (collection, account).
+    """
+    snapshots = incremental.SnapshotStore(snapshot_dir)
+    print("Incremental export:")
+    for name, (key_fields, watermark_field, per_account) in INCREMENTAL_COLLECTIONS.items():
+        if name not in results_map:
+            continue
+        if per_account:
+            # Every requested account is merged, so an emptied account still reports removals
+            groups = {str(a): [] for a in accounts}
+            for row in results_map[name]:
+                groups.setdefault(str(row.get('accountId')), []).append(row)
+        else:
+            groups = {incremental.ALL_ACCOUNTS: results_map[name]}
+
+        delta = []
+        for account, rows in groups.items():
+            delta.extend(snapshots.merge(name, account, rows, key_fields, watermark_field))
+
+        write_csv(f'{name}-snapshot.csv', snapshots.records(name))
+        if delta:
+            write_csv(f'{TIMESTAMP}-{name}-delta.csv', delta)
+        print(f" {len(delta):>6} changed {name}")
+    snapshots.save()
+
+
+# -----------------------------
+# Local inventory database (optional)
+# -----------------------------
+
+def load_inventory(inventory, accounts, by_type, users, policies, conditions, ai_channels, workflows_full):
+    """Upsert this run's collections into the SQLite inventory (see inventory_db)."""
+    inventory.clear_accounts(accounts)
+    for entities in by_type.values():
+        inventory.upsert_entities(entities or [])
+    if users:
+        inventory.upsert_users(users)
+    inventory.upsert_policies(policies)
+    inventory.upsert_conditions(conditions)
+    inventory.upsert_channels(ai_channels)
+    inventory.upsert_legacy_channels(load_notification_channels_legacy(accounts))
+    inventory.upsert_workflows(workflows_full, WORKFLOW_INDEX.record)
 
 
 # -----------------------------
@@ -881,7 +1161,35 @@ def parse_args():
     parser.add_argument('--skip-dash', action='store_true', help='Skip Dashboards export')
     parser.add_argument('--skip-synth', action='store_true', help='Skip Synthetics export')
     parser.add_argument('--skip-users', action='store_true', help='Skip Users export')
+    parser.add_argument('--per-type-crawl', action='store_true',
+                        help='Sweep APM/dashboards/hosts/monitors with one entitySearch each instead of a single combined crawl')
     parser.add_argument('--no-excel', action='store_true', help='Skip Excel workbook output (still writes CSVs)')
+    parser.add_argument('--format', choices=('csv',) + columnar_writer.FORMATS, default='csv',
+                        help='Also write every collection as a typed Parquet or Arrow IPC file (needs pyarrow; default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Number of accounts to crawl in parallel (default: %(default)s, serial)')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Fetch the first page of up to N accounts per aliased GraphQL request (default: %(default)s)')
+    parser.add_argument('--pool-size', type=int, default=nerdgraph_client.DEFAULT_POOL_SIZE,
+                        help='Max keep-alive connections kept open to NerdGraph (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=nerdgraph_client.DEFAULT_TIMEOUT,
+                        help='Per-request timeout in seconds (default: %(default)s)')
+    parser.add_argument('--max-in-flight', type=int, default=request_scheduler.DEFAULT_MAX_IN_FLIGHT,
+                        help='Cap on concurrent NerdGraph requests (default: %(default)s)')
+    parser.add_argument('--cache-ttl', type=response_cache.ttl_spec, default=None,
+                        help='Enable the on-disk response cache. Seconds, optionally with per-collection '
+                             'overrides, e.g. "3600" or "3600,users=86400,workflows=600"')
+    parser.add_argument('--cache-db', type=str, default=response_cache.DEFAULT_PATH,
+                        help='SQLite file for the response cache (default: %(default)s)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Merge results into local snapshots and write only what changed since the last run')
+    parser.add_argument('--snapshot-dir', type=str, default=incremental.DEFAULT_DIR,
+                        help='Directory holding incremental snapshots and watermarks (default: %(default)s)')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Ignore cached responses for this run (fresh responses are still cached)')
+    parser.add_argument('--inventory-db', nargs='?', const=inventory_db.DEFAULT_PATH, default=None,
+                        help='Upsert every collection into a local SQLite inventory and build the correlation '
+                             f'sheets with SQL joins (default file: {inventory_db.DEFAULT_PATH})')
     return parser.parse_args()
 
 
@@ -898,16 +1206,52 @@ def main():
     require_api_key()
     args = parse_args()
     accounts = resolve_accounts(args)
+    if args.format in columnar_writer.FORMATS:
+        columnar_writer.require_pyarrow()
+    global CONCURRENCY, BATCH_SIZE
+    CONCURRENCY = max(1, args.concurrency)
+    BATCH_SIZE = max(1, args.batch_size)
+    request_scheduler.configure(max_in_flight=max(1, args.max_in_flight))
+    cache = None
+    if args.cache_ttl or args.refresh:
+        default_ttl, ttls = response_cache.parse_ttls(args.cache_ttl)
+        cache = response_cache.ResponseCache(args.cache_db, default_ttl=default_ttl, ttls=ttls, refresh=args.refresh)
+    # Every worker thread needs its own keep-alive connection
+    client = nerdgraph_client.configure(
+        api_key=API_KEY,
+        pool_size=max(args.pool_size, CONCURRENCY),
+        timeout=args.timeout,
+        cache=cache,
+    )
 
     # Gather & CSV
     results_map = {}
 
-    if not args.skip_apm:
-        results_map['apm_agents'] = get_all_apm_agents()
-    if not args.skip_dash:
-        results_map['dashboards'] = get_all_dashboard_data()
-    if not args.skip_infra:
-        results_map['infras_agents'] = get_all_infra_agents()
+    # Excel, columnar, inventory and incremental output need every row in memory;
+    # otherwise entity collections stream straight to CSV and are not retained.
+    keep = not args.no_excel or args.incremental or args.format != 'csv' or bool(args.inventory_db)
+
+    # One entitySearch crawl for every requested entity type, streamed by type
+    entity_types = [t for t, skip in (
+        ('APPLICATION', args.skip_apm),
+        ('DASHBOARD', args.skip_dash),
+        ('HOST', args.skip_infra),
+        ('MONITOR', args.skip_synth),
+    ) if not skip]
+    if args.per_type_crawl:
+        per_type = {
+            'APPLICATION': lambda: get_all_apm_agents(keep=keep),
+            'DASHBOARD': lambda: get_all_dashboard_data(keep=keep),
+            'HOST': lambda: get_all_infra_agents(keep=keep),
+            'MONITOR': lambda: get_all_synthetic_monitors(keep=keep),
+        }
+        by_type = {t: per_type[t]() for t in entity_types}
+    else:
+        by_type = export_entities(entity_types, keep=keep) if entity_types else {}
+    if keep:
+        for t in ('APPLICATION', 'DASHBOARD', 'HOST'):
+            if t in by_type:
+                results_map[entity_crawl.ENTITY_TYPES[t]] = by_type[t]
 
     # Policy/Condition exports are per-accounts
     policies = get_all_policies(accounts)
@@ -916,10 +1260,13 @@ def main():
     alert_conds = get_all_alert_conditions(accounts, policies=policies)
     results_map['alert_conditions'] = alert_conds
 
-    if not args.skip_synth:
-        results_map['synthetics'] = get_all_synthetic_monitors()
+    if keep and 'MONITOR' in by_type:
+        results_map['synthetics'] = by_type['MONITOR']
+    users = None
     if not args.skip_users:
-        results_map['users'] = get_all_users()
+        users = get_all_users(keep=keep)
+        if keep:
+            results_map['users'] = users
 
     # Channels (AI) and Workflows
     ai_channels = get_all_notification_channels_ai(accounts)
@@ -927,45 +1274,77 @@ def main():
 
     workflows_flat, workflows_full = get_all_workflows_flat_csv(accounts)
     results_map['workflows'] = workflows_full  # store full for Excel; CSV already written as flattened
+    # Parse every issuesFilter once; the correlations below reuse the cached policy IDs
+    WORKFLOW_INDEX.add_all(workflows_full)
+
+    inventory = None
+    if args.inventory_db:
+        # Correlations as indexed SQL joins over the local inventory
+        inventory = inventory_db.InventoryDB(args.inventory_db)
+        load_inventory(inventory, accounts, by_type, users, policies, alert_conds, ai_channels, workflows_full)
+        results_map['workflow_policy_map'] = inventory.workflow_policy_map(accounts)
+        results_map['legacy_channel_policy_map'] = inventory.legacy_channel_policy_map(accounts)
+        pcw_map = RowStream(PCW_COLUMNS, lambda: inventory.policy_condition_workflow_map(accounts))
+        print(f'\n\tInventory database updated: "{args.inventory_db}"\n')
+    else:
+        # Correlations
+        wf_policy_corr = correlate_workflows_to_policies(accounts)
+        results_map['workflow_policy_map'] = wf_policy_corr
+
+        legacy_corr = correlate_legacy_channels_to_policies(accounts)
+        results_map['legacy_channel_policy_map'] = legacy_corr
+
+        # Policy–Condition–Workflow–Channel map, regenerated lazily by each writer
+        pcw_map = RowStream(PCW_COLUMNS, lambda: iter_policy_condition_workflow_map(
+            accounts,
+            policies=policies,
+            conditions=alert_conds,
+            workflows_full=workflows_full,
+            ai_channels=ai_channels
+        ))
+    write_policy_condition_workflow_map_csv(pcw_map)
+    results_map['policy_condition_workflow_map'] = pcw_map
 
-    # Correlations
-    wf_policy_corr = correlate_workflows_to_policies(accounts)
-    results_map['workflow_policy_map'] = wf_policy_corr
+    if args.incremental:
+        export_incremental(results_map, accounts, args.snapshot_dir)
 
-    legacy_corr = correlate_legacy_channels_to_policies(accounts)
-    results_map['legacy_channel_policy_map'] = legacy_corr
-
-    # Policy–Condition–Workflow–Channel map
-    pcw_map = build_policy_condition_workflow_map(
-        accounts,
-        policies=policies,
-        conditions=alert_conds,
-        workflows_full=workflows_full,
-        ai_channels=ai_channels
-    )
-    results_map['policy_condition_workflow_map'] = pcw_map
+    # Typed columnar files (one per collection)
+    if args.format in columnar_writer.FORMATS:
+        ext = columnar_writer.EXTENSIONS[args.format]
+        for name, data in results_map.items():
+            columnar_writer.write_collection(args.format, name, data, f'{TIMESTAMP}-{name}.{ext}',
+                                             columns=getattr(data, 'columns', None))
+        print(f'\n\tPlease see the {args.format} files named "{TIMESTAMP}-<collection>.{ext}"\n')
 
     # Excel workbook (one sheet per key)
     if not args.no_excel:
         excel_file = f'{TIMESTAMP}-nr-data-output.xlsx'
-        with pd.ExcelWriter(excel_file, engine='openpyxl') as writer:
-            for sheet_name, data in results_map.items():
-                try:
-                    df = pd.json_normalize(data)
-                except Exception:
-                    df = pd.DataFrame(data)
-                # Cap sheet name length for Excel
-                safe_sheet = sheet_name[:31]
-                df.to_excel(writer, sheet_name=safe_sheet, index=False)
+        # Write-only workbook: rows are appended as they go, oversized sheets roll over to <name>_2
+        book = StreamingWorkbook(excel_file)
+        for sheet_name, data in results_map.items():
+            if isinstance(data, RowStream):
+                book.write_sheet(sheet_name, data, columns=data.columns, flatten=False)
+            else:
+                book.write_sheet(sheet_name, data)
+        book.save()
         print("Excel file with multiple sheets created successfully.")
 
     # Summary report
     print(f"As of {TIMESTAMP[:8]} there are:")
+    for k, count in ROW_COUNTS.items():
+        if k not in results_map:
+            print(f" {count:>6} {k}")
     for k, data in results_map.items():
         try:
             print(f" {len(data):>6} {k}")
         except TypeError:
-            pass
+            # Streamed collections are counted by their CSV writer
+            if k in ROW_COUNTS:
+                print(f" {ROW_COUNTS[k]:>6} {k}")
+    if inventory is not None:
+        inventory.close()
+    print(f"Entity store: {STORE.fetches} account collections fetched, {STORE.hits} reads served from memory")
+    client.print_connection_stats()
 
 
 if __name__ == '__main__':
@@ -2,7 +2,6 @@
   What: This script will list all resources in your New Relic account.
   Why:  User can used outut files for local data analysis.
 """
-import requests
 import json
 import os
 import csv
@@ -11,21 +10,13 @@ from datetime import datetime
 from dotenv import load_dotenv
 from fetch_synthetic_monitors import get_synthetic_data
 from fetch_apm_monitors import get_apm_application_data
+from nerdgraph_client import get_client
 
 load_dotenv(override=True)
 
 API_KEY = os.getenv('NR_API_KEY')
 ACCOUNT_ID = os.getenv('ACCOUNT_ID')
 
-# Define the URL
-URL = "https://api.newrelic.com/graphql"
-
-# Define the headers
-HEADERS = {
-    "Content-Type": "application/json",
-    "API-Key": API_KEY
-}
-
 OUTPUT_FILE = "list-apm-agent.csv"
 TIMESTAMP  = datetime.now().strftime("%Y%m%d-%H%M%S")
 
@@ -126,8 +117,7 @@ def fetch_apm_agents(cursor=None):
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_dashboard_data(cursor=None):
@@ -158,8 +148,7 @@ def fetch_dashboard_data(cursor=None):
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_infra_agents(cursor=None):
@@ -188,8 +177,7 @@ def fetch_infra_agents(cursor=None):
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_policies(cursor=None):
@@ -216,8 +204,7 @@ def fetch_policies(cursor=None):
     if cursor:
         query = query.replace('policiesSearch', f'policiesSearch(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_workflows(cursor=None):
@@ -251,8 +238,7 @@ def fetch_workflows(cursor=None):
     if cursor:
         query = query.replace('workflows', f'workflows(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_synthetics(cursor):
@@ -286,8 +272,7 @@ def fetch_synthetics(cursor):
     if cursor:
         query = query.replace('results', f'results(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_user_accounts(cursor=None):
@@ -311,8 +296,7 @@ def fetch_user_accounts(cursor=None):
     if cursor:
         query = query.replace('userSearch', f'userSearch(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_alert_conditions(cursor=None):
@@ -347,8 +331,7 @@ def fetch_alert_conditions(cursor=None):
     if cursor:
         query = query.replace('nrqlConditionsSearch', f'nrqlConditionsSearch(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_notification_channels(cursor=None):
@@ -379,8 +362,7 @@ def fetch_notification_channels(cursor=None):
     if cursor:
         query = query.replace('notificationChannels', f'notificationChannels(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def fetch_destinations(cursor=None):
@@ -410,8 +392,7 @@ def fetch_destinations(cursor=None):
     if cursor:
         query = query.replace('destinations', f'destinations(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def get_all_apm_agents():
@@ -667,10 +648,11 @@ def get_all_alert_conditions(policies=None):
             break
 
     if policies:
+        # One pass over policies, then an O(1) lookup per condition
+        policy_names = {policy['id']: policy['name'] for policy in policies}
         for row in results:
-            for policy in policies:
-                if row['policyId'] == policy['id']:
-                    row['policyName'] = policy['name']
+            if row['policyId'] in policy_names:
+                row['policyName'] = policy_names[row['policyId']]
         write_to_csv(output_file, results)
     else:
         # write output from above into CSV file 
@@ -805,8 +787,7 @@ def audit_existing_drop_rules():
     if cursor:
         query = query.replace('workflows', f'workflows(cursor: "{cursor}")')
     
-    response = requests.post(URL, headers=HEADERS, json={'query': query})
-    return response.json()
+    return get_client().query(query)
 
 
 def show_menu():
@@ -1,12 +1,26 @@
+"""
+Menu of New Relic actions, plus a batch runner for saved NRQL queries:
+  python nr_queries.py                                   # interactive menu
+  python nr_queries.py run queries.yaml                  # every query x every account in the library
+  python nr_queries.py run queries.json --accounts 1234567,7654321 --format parquet --output-dir out
+  python nr_queries.py run queries.yaml --pack 10 --workers 8 --round 900
+See nrql_batch.py for the library format.
+"""
+import argparse
 import requests
 import json
 import os
 import csv
+import sys
+import time
 import pprint as pp
 from datetime import datetime
 from dotenv import load_dotenv
 from fetch_synthetic_monitors import get_synthetic_data
 from fetch_apm_monitors import get_apm_application_data
+import columnar_writer
+import nrql_batch
+import response_cache
 
 load_dotenv(override=True)
 
@@ -25,8 +39,42 @@ HEADERS = {
 TIMESTAMP  = datetime.now().strftime("%Y%m%d-%H%M%S")
 OUTPUT_FILE = f"output_{TIMESTAMP}.csv"
 
+def run_saved_queries(library, accounts=None, fmt='csv', output_dir=None, pack=nrql_batch.DEFAULT_PACK,
+                      workers=nrql_batch.DEFAULT_WORKERS, round_s=nrql_batch.DEFAULT_ROUND, use_async=False,
+                      cache_db=response_cache.DEFAULT_PATH, cache_ttl=None, refresh=False):
+    # ACCOUNT_ID only fills in for queries the library gives no accounts
+    if fmt == 'parquet':
+        columnar_writer.require_pyarrow()
+    queries = nrql_batch.load_library(library, accounts=accounts,
+                                      default_accounts=[ACCOUNT_ID] if ACCOUNT_ID else None)
+    output_dir = output_dir or f"nrql_{TIMESTAMP}"
+    cache = None
+    if cache_db:
+        default_ttl, ttls = response_cache.parse_ttls(cache_ttl)
+        cache = response_cache.ResponseCache(cache_db, default_ttl=default_ttl, ttls=ttls, refresh=refresh)
+    runner = nrql_batch.NrqlBatchRunner(cache=cache, pack=pack, workers=workers, round_s=round_s,
+                                        use_async=use_async)
+    print(f"\n\tRunning {len(queries)} saved NRQL queries from {library}...")
+    started = time.perf_counter()
+    try:
+        tasks = runner.run(queries)
+    finally:
+        if cache is not None:
+            cache.close()
+    nrql_batch.print_report(tasks, time.perf_counter() - started, runner)
+    for path in nrql_batch.write_results(tasks, output_dir, fmt):
+        print(f"\tWrote {path}")
+    return tasks
+
+
 def action_one():
-    print(f"\n\tAction One selected. (Function not yet implemented)")
+    library = input("Saved NRQL library (JSON/YAML): ").strip()
+    accounts = input(f"Account IDs, comma-separated [library default{f' / {ACCOUNT_ID}' if ACCOUNT_ID else ''}]: ")
+    accounts = [a.strip() for a in accounts.split(',') if a.strip()] or None
+    try:
+        run_saved_queries(library, accounts=accounts)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"\n\t*** {e}")
 
 def action_two():
     print(f"\n\tAction Two selected. (Function not yet implemented)")
@@ -48,13 +96,48 @@ def delete_destination():
 
 def show_menu():
     print("\nPlease choose an action:")
-    print("1. Action One")
+    print("1. Run saved NRQL queries")
     print("2. Action Two")
     print("3. Action Three")
     print("4. delete destination")
     print("0. Exit")
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run a library of saved NRQL queries across accounts.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='Run every saved query on every account')
+    run.add_argument('library', help='JSON or YAML query library')
+    run.add_argument('--accounts', type=str, default=None,
+                     help='Comma-separated account IDs (overrides the library; default: library, then ACCOUNT_ID)')
+    run.add_argument('--format', choices=nrql_batch.FORMATS, default='csv', help='One file per query')
+    run.add_argument('--output-dir', type=str, default=None, help='Default: nrql_<timestamp>')
+    run.add_argument('--pack', type=int, default=nrql_batch.DEFAULT_PACK,
+                     help='Queries per GraphQL document (default: %(default)s)')
+    run.add_argument('--workers', type=int, default=nrql_batch.DEFAULT_WORKERS,
+                     help='GraphQL documents in flight (default: %(default)s)')
+    run.add_argument('--round', type=float, default=nrql_batch.DEFAULT_ROUND,
+                     help='Seconds time windows are rounded to for caching (default: %(default)s)')
+    run.add_argument('--async', dest='use_async', action='store_true',
+                     help='Run each query asynchronously with progress polling (no packing)')
+    run.add_argument('--cache-db', type=str, default=response_cache.DEFAULT_PATH,
+                     help='Result cache (default: %(default)s)')
+    run.add_argument('--no-cache', action='store_true', help='Neither read nor write the result cache')
+    run.add_argument('--cache-ttl', type=response_cache.ttl_spec, default=None,
+                     help='Cache TTL seconds, e.g. "3600" or "3600,nrql=900" (NRQL results default to 300)')
+    run.add_argument('--refresh', action='store_true', help='Re-run every query but still update the cache')
+    return parser.parse_args(argv)
+
+
 def main():
+    if len(sys.argv) > 1:
+        args = parse_args(sys.argv[1:])
+        accounts = [a.strip() for a in args.accounts.split(',') if a.strip()] if args.accounts else None
+        run_saved_queries(args.library, accounts=accounts, fmt=args.format, output_dir=args.output_dir,
+                          pack=args.pack, workers=args.workers, round_s=args.round, use_async=args.use_async,
+                          cache_db=None if args.no_cache else args.cache_db, cache_ttl=args.cache_ttl,
+                          refresh=args.refresh)
+        return
+
     while True:
         show_menu()
         choice = input("Enter your choice: ")
@@ -0,0 +1,142 @@
+"""
+  What: Asynchronous NRQL queries: submit, then poll their queryProgress.
+  Why:  The synchronous `nrql(query:)` field gives up after its timeout
+        (120s at most), which heavy queries over long ranges exceed. With
+        `async: true` NerdGraph answers after `timeout` seconds with either the
+        results or a queryProgress handle that is polled through
+        `nrqlQueryProgress(queryId:)` until the query completes. Each query
+        mostly sleeps between polls, so many can be kept in flight at once.
+
+Usage:
+    runner = AsyncNrqlRunner(poll_interval=5, deadline=1800, max_in_flight=20)
+    rows = runner.run(account_id, "SELECT count(*) FROM Transaction SINCE 3 months ago FACET appName")
+    all_rows = runner.run_many([(account_id, nrql) for nrql in queries])
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from nerdgraph_client import NerdGraphError, get_client
+
+DEFAULT_POLL_INTERVAL = 5.0   # seconds between polls (a larger retryAfter from NerdGraph wins)
+DEFAULT_DEADLINE = 1800.0     # seconds a run()/run_many() call may take overall
+DEFAULT_SUBMIT_TIMEOUT = 10   # seconds NerdGraph waits for results before handing back a queryProgress
+DEFAULT_MAX_IN_FLIGHT = 20
+
+_PROGRESS_FIELDS = """
+        queryProgress {
+          queryId
+          completed
+          retryAfter
+          retryDeadline
+          resultExpiration
+        }"""
+
+ASYNC_QUERY = """
+query($accountId: Int!, $nrql: Nrql!, $timeout: Seconds) {
+  actor {
+    account(id: $accountId) {
+      nrql(query: $nrql, async: true, timeout: $timeout) {
+        results%s
+      }
+    }
+  }
+}
+""" % _PROGRESS_FIELDS
+
+PROGRESS_QUERY = """
+query($accountId: Int!, $queryId: ID!) {
+  actor {
+    account(id: $accountId) {
+      nrqlQueryProgress(queryId: $queryId) {
+        results%s
+      }
+    }
+  }
+}
+""" % _PROGRESS_FIELDS
+
+
+class NrqlQueryTimeout(RuntimeError):
+    """The query did not complete before the deadline (or NerdGraph's retryDeadline)."""
+
+    def __init__(self, query_id, nrql):
+        self.query_id = query_id
+        self.nrql = nrql
+        super().__init__(f"NRQL query {query_id} did not complete in time: {nrql[:120]}")
+
+
+class AsyncNrqlRunner:
+    """
+    poll_interval is the pause between polls of one query; deadline bounds the
+    whole run()/run_many() call; max_in_flight caps how many queries are
+    submitted-and-polling at once (each waits on its own thread; every
+    request still goes through request_scheduler's pacing).
+    """
+
+    def __init__(self, client=None, poll_interval=DEFAULT_POLL_INTERVAL, deadline=DEFAULT_DEADLINE,
+                 submit_timeout=DEFAULT_SUBMIT_TIMEOUT, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.client = client or get_client()
+        self.poll_interval = poll_interval
+        self.deadline = deadline
+        self.submit_timeout = submit_timeout
+        self.max_in_flight = max(1, max_in_flight)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.polls = 0
+        self.completed = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _query(self, query, variables, field):
+        """
+        Like NerdGraphClient.query, but never through its response cache: a
+        cached submit or poll would hand back a stale, still-running queryProgress.
+        """
+        response = self.client.post(query, variables=variables)
+        response.raise_for_status()
+        body = response.json()
+        if body.get('errors') and not body.get('data'):
+            raise NerdGraphError(body['errors'])
+        return body['data']['actor']['account'][field]
+
+    def run(self, account_id, nrql, deadline_at=None):
+        """Results of one query, polling until it completes; raises NrqlQueryTimeout past the deadline."""
+        deadline_at = deadline_at or time.monotonic() + self.deadline
+        variables = {'accountId': int(account_id), 'nrql': nrql, 'timeout': self.submit_timeout}
+        result = self._query(ASYNC_QUERY, variables, 'nrql')
+        self._count('submitted')
+        while True:
+            progress = result.get('queryProgress') or {}
+            query_id = progress.get('queryId')
+            if progress.get('completed', True) or query_id is None:
+                self._count('completed')
+                return result.get('results') or []
+            wait = max(self.poll_interval, float(progress.get('retryAfter') or 0))
+            if progress.get('retryDeadline') is not None:
+                # NerdGraph stops answering for this queryId retryDeadline seconds from now
+                deadline_at = min(deadline_at, time.monotonic() + float(progress['retryDeadline']))
+            if time.monotonic() + wait > deadline_at:
+                raise NrqlQueryTimeout(query_id, nrql)
+            time.sleep(wait)
+            result = self._query(PROGRESS_QUERY, {'accountId': int(account_id), 'queryId': query_id},
+                                 'nrqlQueryProgress')
+            self._count('polls')
+
+    def run_many(self, queries):
+        """[(account_id, nrql), ...] -> [results, ...] in input order, up to max_in_flight at a time."""
+        queries = list(queries)
+        if not queries:
+            return []
+        deadline_at = time.monotonic() + self.deadline
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(queries))) as pool:
+            return list(pool.map(lambda q: self.run(q[0], q[1], deadline_at), queries))
+
+    def runner(self, account_id):
+        """runner(nrql) -> rows for one account, e.g. for nrql_export.NrqlExporter(runner=...)."""
+        return lambda nrql: self.run(account_id, nrql)
+
+    def stats(self):
+        return f"{self.submitted} async queries, {self.polls} progress polls, {self.completed} completed"
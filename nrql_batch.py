@@ -0,0 +1,306 @@
+"""
+  What: Concurrent batch runner for a library of saved NRQL queries.
+  Why:  nr_queries.py needs to run the same saved queries across many
+        accounts. One NerdGraph round trip per (query, account) is slow, so
+        the runner packs several of them into one GraphQL document (one
+        aliased `account(id:) { nrql(query:) }` field each), sends the
+        documents concurrently, and caches every result on disk by
+        (account, query, time window rounded to --round seconds), so re-runs
+        inside the same window make no calls at all.
+
+Library file (JSON, or YAML when PyYAML is installed):
+  defaults:
+    accounts: [1234567, 7654321]
+    since: 1 day ago          # "N units ago", an ISO date or epoch ms
+    until: now
+  queries:
+    - name: tx_by_app
+      nrql: SELECT count(*) FROM Transaction FACET appName
+    - name: errors_week
+      nrql: SELECT count(*) FROM TransactionError FACET error.class
+      since: 7 days ago
+A query that carries its own SINCE/UNTIL is sent as written; it is still
+cached per rounded window of "now".
+
+Output: one <name>.csv (or .parquet) per query in --output-dir, with an
+accountId column, plus a per-query latency report on stdout.
+"""
+import csv
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import yaml
+except ImportError:  # optional dependency
+    yaml = None
+
+import columnar_writer
+import nrql_async
+from nerdgraph_client import get_client
+from nrql_export import HTTP_TIMEOUT_MARGIN, NRQL_QUERY, NRQL_TIMEOUT, parse_time
+
+DEFAULT_ROUND = 300     # seconds; windows are floored to this, so re-runs inside it hit the cache
+DEFAULT_PACK = 5        # (query, account) pairs per GraphQL document
+DEFAULT_WORKERS = 4     # documents in flight
+FORMATS = ('csv', 'parquet')
+
+_TIME_CLAUSE = re.compile(r'\b(SINCE|UNTIL)\b', re.IGNORECASE)
+_QUOTED = re.compile(r"'(?:[^'\\]|\\.)*'|`[^`]*`")
+_NAME = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def require_yaml():
+    if yaml is None:
+        raise RuntimeError("YAML query libraries need PyYAML. Install it with: pip install pyyaml")
+
+
+class SavedQuery:
+    __slots__ = ('name', 'nrql', 'accounts', 'since', 'until')
+
+    def __init__(self, name, nrql, accounts, since='1 day ago', until='now'):
+        self.name = name
+        self.nrql = nrql.strip()
+        self.accounts = [int(a) for a in accounts]
+        self.since = since
+        self.until = until
+
+    def __repr__(self):
+        return f'SavedQuery({self.name!r}, accounts={self.accounts})'
+
+
+def load_library(path, accounts=None, default_accounts=None):
+    """
+    [SavedQuery] from a JSON/YAML library; accounts (e.g. from --accounts)
+    replaces the accounts the file names, default_accounts is used for
+    queries that name none.
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.lower().endswith(('.yaml', '.yml')):
+            require_yaml()
+            doc = yaml.safe_load(f)
+        else:
+            doc = json.load(f)
+    if isinstance(doc, list):
+        doc = {'queries': doc}
+    defaults = doc.get('defaults') or {}
+    queries = []
+    seen = set()
+    for i, entry in enumerate(doc.get('queries') or []):
+        if isinstance(entry, str):
+            entry = {'nrql': entry}
+        name = _NAME.sub('_', str(entry.get('name') or f'query_{i + 1}'))
+        if name in seen:
+            raise ValueError(f"Duplicate query name {name!r} in {path}")
+        seen.add(name)
+        query_accounts = accounts or entry.get('accounts') or defaults.get('accounts') or default_accounts
+        if not query_accounts:
+            raise ValueError(f"Query {name!r} has no accounts (set defaults.accounts or pass --accounts)")
+        queries.append(SavedQuery(name, entry['nrql'], query_accounts,
+                                  since=entry.get('since', defaults.get('since', '1 day ago')),
+                                  until=entry.get('until', defaults.get('until', 'now'))))
+    return queries
+
+
+def rounded_window(query, round_s, now_ms):
+    """(since_ms, until_ms) floored to round_s, so runs inside one bucket share cache entries."""
+    step = max(1, int(round_s * 1000))
+    since = parse_time(query.since, now_ms) // step * step
+    until = parse_time(query.until, now_ms) // step * step
+    return since, max(until, since + step)
+
+
+def windowed_nrql(query, window):
+    # A SINCE/UNTIL inside a string literal or backquoted name is not a time clause
+    if _TIME_CLAUSE.search(_QUOTED.sub("''", query.nrql)):
+        return query.nrql
+    return f"{query.nrql} SINCE {window[0]} UNTIL {window[1]}"
+
+
+class Task:
+    """One (query, account) run: the NRQL actually sent, its rows and how they were obtained."""
+
+    __slots__ = ('query', 'account_id', 'nrql', 'window', 'rows', 'source', 'latency', 'error')
+
+    def __init__(self, query, account_id, nrql, window):
+        self.query = query
+        self.account_id = account_id
+        self.nrql = nrql
+        self.window = window
+        self.rows = None
+        self.source = None    # 'cache' | 'network' | 'error'
+        self.latency = None   # seconds of the round trip that produced the rows
+        self.error = None
+
+    def cache_key(self):
+        # The rounded window is part of the key even when the NRQL carries its own SINCE
+        return {'accountId': self.account_id, 'nrql': self.nrql, 'window': list(self.window)}
+
+
+def packed_document(tasks):
+    """One GraphQL document with an aliased account/nrql field per task, and its variables."""
+    params, fields, variables = [], [], {}
+    for i, task in enumerate(tasks):
+        params.append(f'$a{i}: Int!, $q{i}: Nrql!')
+        fields.append(f'    q{i}: account(id: $a{i}) {{ nrql(query: $q{i}, timeout: $timeout) {{ results }} }}')
+        variables[f'a{i}'] = task.account_id
+        variables[f'q{i}'] = task.nrql
+    variables['timeout'] = NRQL_TIMEOUT
+    document = f"query({', '.join(params)}, $timeout: Seconds) {{\n  actor {{\n" + '\n'.join(fields) + "\n  }\n}"
+    return document, variables
+
+
+class NrqlBatchRunner:
+    """
+    Usage:
+        runner = NrqlBatchRunner(cache=response_cache.ResponseCache(), pack=5, workers=4)
+        tasks = runner.run(load_library('queries.yaml'))
+        write_results(tasks, 'out', 'csv')
+    With use_async=True every cache miss is run through nrql_async instead of
+    packed synchronous documents (for queries beyond the 120s limit).
+    """
+
+    def __init__(self, client=None, cache=None, pack=DEFAULT_PACK, workers=DEFAULT_WORKERS,
+                 round_s=DEFAULT_ROUND, use_async=False):
+        self.client = client or get_client()
+        self.cache = cache
+        self.pack = max(1, pack)
+        self.workers = max(1, workers)
+        self.round_s = round_s
+        self.use_async = use_async
+        self.documents = 0
+        self._lock = threading.Lock()
+
+    def plan(self, queries, now_ms=None):
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        tasks = []
+        for query in queries:
+            window = rounded_window(query, self.round_s, now_ms)
+            nrql = windowed_nrql(query, window)
+            tasks.extend(Task(query, account_id, nrql, window) for account_id in query.accounts)
+        return tasks
+
+    def _cached(self, task):
+        if self.cache is None:
+            return None
+        body = self.cache.get(self.client.api_key, NRQL_QUERY, task.cache_key())
+        return body['data']['actor']['account']['nrql']['results'] if body is not None else None
+
+    def _store(self, task):
+        if self.cache is not None:
+            body = {'data': {'actor': {'account': {'nrql': {'results': task.rows}}}}}
+            self.cache.put(self.client.api_key, NRQL_QUERY, task.cache_key(), body)
+
+    def _send(self, batch):
+        document, variables = packed_document(batch)
+        started = time.perf_counter()
+        try:
+            # Outlast the document's NRQL timeout so one slow alias does not fail (and re-send) the pack
+            response = self.client.post(document, variables=variables, timeout=NRQL_TIMEOUT + HTTP_TIMEOUT_MARGIN)
+            response.raise_for_status()
+            body = response.json()
+        except Exception as e:
+            for task in batch:
+                task.source, task.error = 'error', str(e)
+            return
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.documents += 1
+        actor = (body.get('data') or {}).get('actor') or {}
+        errors = body.get('errors') or []
+        for i, task in enumerate(batch):
+            task.latency = elapsed
+            result = (actor.get(f'q{i}') or {}).get('nrql')
+            if result is None:
+                # Only errors whose path names this alias belong to it; the others are another field's
+                mine = [e.get('message', str(e)) for e in errors if f'q{i}' in (e.get('path') or [])]
+                task.source, task.error = 'error', '; '.join(mine) if mine else f'no data for q{i}'
+                continue
+            task.rows, task.source = result.get('results') or [], 'network'
+            self._store(task)
+
+    def _send_async(self, task, runner):
+        started = time.perf_counter()
+        try:
+            task.rows = runner.run(task.account_id, task.nrql)
+        except Exception as e:
+            task.source, task.error = 'error', str(e)
+            return
+        task.latency, task.source = time.perf_counter() - started, 'network'
+        self._store(task)
+
+    def run(self, queries, now_ms=None):
+        tasks = self.plan(queries, now_ms)
+        self.documents = 0  # counts this run's documents only
+        misses = []
+        for task in tasks:
+            rows = self._cached(task)
+            if rows is None:
+                misses.append(task)
+            else:
+                task.rows, task.source, task.latency = rows, 'cache', 0.0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            if self.use_async:
+                runner = nrql_async.AsyncNrqlRunner(client=self.client, max_in_flight=self.workers)
+                list(pool.map(lambda t: self._send_async(t, runner), misses))
+            else:
+                batches = [misses[i:i + self.pack] for i in range(0, len(misses), self.pack)]
+                list(pool.map(self._send, batches))
+        return tasks
+
+
+# -----------------------------
+# Output
+# -----------------------------
+
+def _flat(value):
+    return json.dumps(value, default=str) if isinstance(value, (dict, list)) else value
+
+
+def query_rows(tasks):
+    """{query name: [row with accountId first, ...]} in library order; queries that only failed are left out."""
+    grouped = {}
+    for task in tasks:
+        if task.rows is None:
+            continue
+        rows = grouped.setdefault(task.query.name, [])
+        for row in task.rows or []:
+            rows.append(dict({'accountId': task.account_id}, **{k: _flat(v) for k, v in row.items()}))
+    return grouped
+
+
+def write_results(tasks, output_dir, fmt='csv'):
+    """One file per query; returns the paths written."""
+    if fmt == 'parquet':
+        columnar_writer.require_pyarrow()
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, rows in query_rows(tasks).items():
+        path = os.path.join(output_dir, f'{name}.{fmt}')
+        columns = list(dict.fromkeys(k for row in rows for k in row)) or ['accountId']
+        if fmt == 'parquet':
+            table = columnar_writer.pa.Table.from_pylist(rows) if rows else columnar_writer.pa.table({'accountId': []})
+            columnar_writer.pq.write_table(table, path)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                w = csv.DictWriter(f, fieldnames=columns)
+                w.writeheader()
+                w.writerows(rows)
+        paths.append(path)
+    return paths
+
+
+def print_report(tasks, elapsed, runner=None):
+    print(f"\n{'query':<28} {'account':>10} {'rows':>7} {'latency':>9}  source")
+    for task in tasks:
+        latency = f"{task.latency * 1000:7.0f}ms" if task.latency is not None else '        -'
+        rows = len(task.rows) if task.rows is not None else '-'
+        print(f"{task.query.name[:28]:<28} {task.account_id:>10} {rows:>7} {latency}  {task.source}"
+              + (f"  {task.error[:80]}" if task.error else ''))
+    cached = sum(1 for t in tasks if t.source == 'cache')
+    failed = sum(1 for t in tasks if t.source == 'error')
+    sent = f", {runner.documents} GraphQL documents" if runner is not None and not runner.use_async else ''
+    print(f"\n{len(tasks)} query runs in {elapsed:.1f}s: {cached} from cache, {failed} failed{sent}")
@@ -0,0 +1,315 @@
+"""
+  What: NRQL export engine for raw-event queries larger than one NRQL result.
+  Why:  A single `nrql(query:)` call with LIMIT MAX returns at most
+        NRQL_LIMIT rows and silently drops the rest, so month-long raw exports
+        came back truncated. The exporter splits the SINCE/UNTIL range into
+        time windows, queries them concurrently, halves any window whose
+        result hits the cap, drops rows that two windows both return at a
+        shared boundary, and streams every window to CSV or JSONL as it lands.
+
+Usage:
+  python nrql_export.py --account-id 1234567 \\
+      --nrql "SELECT * FROM SystemSample WHERE agentName = 'Infrastructure'" \\
+      --since "30 days ago" --output samples.jsonl
+  python nrql_export.py --account-id 1234567 --nrql "SELECT * FROM Transaction" \\
+      --since 2024-07-01 --until 2024-08-01 --windows 31 --workers 8 --output tx.csv
+  python nrql_export.py ... --async --poll-interval 10   # windows too slow for the 120s synchronous limit
+
+The query must select raw events (no FACET / TIMESERIES / aggregates) and
+must not carry its own SINCE, UNTIL or LIMIT clause.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+import nrql_async
+from nerdgraph_client import get_client
+
+load_dotenv()
+
+# Most rows one non-facet NRQL query returns with LIMIT MAX
+NRQL_LIMIT = 5000
+NRQL_TIMEOUT = 120  # seconds; the NerdGraph maximum for synchronous queries
+HTTP_TIMEOUT_MARGIN = 15  # seconds the HTTP request waits beyond the NRQL timeout
+DEFAULT_WINDOWS = 8
+DEFAULT_WORKERS = 4
+MIN_WINDOW_MS = 1000  # a window this short that still hits the cap is reported, not split
+
+NRQL_QUERY = """
+query($accountId: Int!, $nrql: Nrql!, $timeout: Seconds) {
+  actor {
+    account(id: $accountId) {
+      nrql(query: $nrql, timeout: $timeout) {
+        results
+      }
+    }
+  }
+}
+"""
+
+_CLAUSES = re.compile(r'\b(SINCE|UNTIL|LIMIT|FACET|TIMESERIES)\b', re.IGNORECASE)
+_QUOTED = re.compile(r"'(?:[^'\\]|\\.)*'|`[^`]*`")
+_RELATIVE = re.compile(r'^\s*(\d+)\s+(second|minute|hour|day|week)s?\s+ago\s*$', re.IGNORECASE)
+_UNIT_MS = {'second': 1000, 'minute': 60_000, 'hour': 3_600_000, 'day': 86_400_000, 'week': 604_800_000}
+
+
+def run_nrql(account_id, nrql, client=None, timeout=NRQL_TIMEOUT):
+    """Results list of one synchronous NRQL query."""
+    client = client or get_client()
+    # The HTTP read must outlast the NRQL timeout, or a slow window is cut off client-side and re-sent
+    data = client.query(NRQL_QUERY, variables={'accountId': int(account_id), 'nrql': nrql, 'timeout': timeout},
+                        timeout=timeout + HTTP_TIMEOUT_MARGIN)
+    return data['data']['actor']['account']['nrql']['results']
+
+
+def parse_time(value, now_ms=None):
+    """Epoch milliseconds from epoch ms/seconds, an ISO date(time) (UTC unless zoned), 'now' or 'N units ago'."""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    text = str(value).strip()
+    if text.lower() == 'now':
+        return now_ms
+    if text.isdigit():
+        number = int(text)
+        return number if number > 10 ** 11 else number * 1000
+    relative = _RELATIVE.match(text)
+    if relative:
+        return now_ms - int(relative.group(1)) * _UNIT_MS[relative.group(2).lower()]
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Unrecognised time {value!r} (epoch ms, ISO date, 'now' or 'N days ago')") from None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def split_range(since_ms, until_ms, windows):
+    """[start, end) windows of (nearly) equal width covering [since_ms, until_ms)."""
+    windows = max(1, min(windows, until_ms - since_ms))
+    edges = [since_ms + (until_ms - since_ms) * i // windows for i in range(windows + 1)]
+    return list(zip(edges, edges[1:]))
+
+
+# -----------------------------
+# Sinks
+# -----------------------------
+
+class JsonlSink:
+    """One JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self.rows = 0
+
+    def write(self, rows):
+        for row in rows:
+            self._file.write(json.dumps(row, default=str) + '\n')
+        self.rows += len(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class CsvSink:
+    """
+    CSV with the columns of the first non-empty window. Attributes that only
+    show up in later windows cannot be added to the header; they are counted
+    in dropped_columns and reported, use JSONL when the schema varies.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = None
+        self.columns = None
+        self.dropped_columns = set()
+        self.rows = 0
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self._writer is None:
+            self.columns = list(dict.fromkeys(k for row in rows for k in row))
+            self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+            self._writer.writeheader()
+        known = set(self.columns)
+        for row in rows:
+            self.dropped_columns.update(k for k in row if k not in known)
+            self._writer.writerow(row)
+        self.rows += len(rows)
+
+    def close(self):
+        self._file.close()
+        if self.dropped_columns:
+            print(f"  warning: columns missing from the CSV header: {', '.join(sorted(self.dropped_columns))}")
+
+
+class ListSink:
+    """Collects every row in memory (for callers that want a list back)."""
+
+    def __init__(self):
+        self.rows = []
+
+    def write(self, rows):
+        self.rows.extend(rows)
+
+    def close(self):
+        pass
+
+
+def open_sink(path):
+    return CsvSink(path) if path.lower().endswith('.csv') else JsonlSink(path)
+
+
+# -----------------------------
+# Exporter
+# -----------------------------
+
+class NrqlExporter:
+    """
+    Usage:
+        exporter = NrqlExporter(account_id, workers=4)
+        stats = exporter.export("SELECT * FROM SystemSample", since_ms, until_ms, JsonlSink('out.jsonl'))
+
+    Windows are half-open [start, end) epoch-ms ranges queried with
+    `SINCE start UNTIL end LIMIT MAX`; a window returning limit rows or more
+    is split in two and both halves are queried again. Rows whose timestamp
+    sits on a window edge are de-duplicated across windows. The sink receives
+    each window's rows from the calling thread, in completion order.
+    """
+
+    def __init__(self, account_id, client=None, workers=DEFAULT_WORKERS, limit=NRQL_LIMIT,
+                 min_window_ms=MIN_WINDOW_MS, runner=None):
+        self.account_id = account_id
+        self.client = client
+        self.workers = max(1, workers)
+        self.limit = limit
+        self.min_window_ms = min_window_ms
+        # runner(nrql) -> rows; defaults to a synchronous run_nrql on this account
+        self.runner = runner or (lambda nrql: run_nrql(self.account_id, nrql, client=self.client))
+        self._edge_rows = {}  # edge row JSON -> most copies one window has emitted
+
+    @staticmethod
+    def check_query(nrql):
+        clause = _CLAUSES.search(_QUOTED.sub("''", nrql))
+        if clause:
+            raise ValueError(f"Export queries select raw events and must not use {clause.group(1).upper()}")
+
+    def window_query(self, nrql, start, end):
+        return f"{nrql} SINCE {start} UNTIL {end} LIMIT MAX"
+
+    def _fetch(self, nrql, window):
+        start, end = window
+        return window, self.runner(self.window_query(nrql, start, end))
+
+    def _unique(self, rows, start, end):
+        """
+        rows minus copies a neighbouring window already returned at a shared
+        edge. Identical events inside one window are all kept: per edge row,
+        only as many copies are emitted as exceed what other windows emitted.
+        """
+        kept = []
+        copies = {}
+        for row in rows:
+            if row.get('timestamp') in (start, end):
+                key = json.dumps(row, sort_keys=True, default=str)
+                copies[key] = copies.get(key, 0) + 1
+                if copies[key] <= self._edge_rows.get(key, 0):
+                    continue
+            kept.append(row)
+        for key, count in copies.items():
+            self._edge_rows[key] = max(count, self._edge_rows.get(key, 0))
+        return kept
+
+    def export(self, nrql, since_ms, until_ms, sink, windows=DEFAULT_WINDOWS):
+        """Stream every row of nrql over [since_ms, until_ms) into sink; returns a stats dict."""
+        self.check_query(nrql)
+        stats = {'queries': 0, 'splits': 0, 'rows': 0, 'duplicates': 0, 'capped_windows': 0}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {pool.submit(self._fetch, nrql, w) for w in split_range(since_ms, until_ms, windows)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    (start, end), rows = future.result()
+                    stats['queries'] += 1
+                    if len(rows) >= self.limit and end - start > self.min_window_ms:
+                        stats['splits'] += 1
+                        middle = (start + end) // 2
+                        pending |= {pool.submit(self._fetch, nrql, (start, middle)),
+                                    pool.submit(self._fetch, nrql, (middle, end))}
+                        continue
+                    if len(rows) >= self.limit:
+                        stats['capped_windows'] += 1
+                        print(f"  warning: window [{start}, {end}) still returns {len(rows)} rows; "
+                              f"some of its rows are missing")
+                    unique = self._unique(rows, start, end)
+                    stats['duplicates'] += len(rows) - len(unique)
+                    stats['rows'] += len(unique)
+                    sink.write(unique)
+        return stats
+
+    def rows(self, nrql, since_ms, until_ms, windows=DEFAULT_WINDOWS):
+        """Every row as one list (small exports only)."""
+        sink = ListSink()
+        self.export(nrql, since_ms, until_ms, sink, windows)
+        return sink.rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export every row of a raw-event NRQL query to CSV or JSONL.")
+    parser.add_argument('--account-id', default=os.getenv('ACCOUNT_ID'), required=not os.getenv('ACCOUNT_ID'))
+    parser.add_argument('--nrql', required=True, help='SELECT ... FROM ... [WHERE ...] without SINCE/UNTIL/LIMIT')
+    parser.add_argument('--since', default='1 day ago', help="Start: epoch ms, ISO date(time) or 'N days ago'")
+    parser.add_argument('--until', default='now', help='End (exclusive); same formats as --since')
+    parser.add_argument('--windows', type=int, default=DEFAULT_WINDOWS,
+                        help='Initial number of time windows (default: %(default)s); full windows are halved')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Windows queried at once')
+    parser.add_argument('--output', default='nrql-export.jsonl', help='.csv for CSV, anything else for JSONL')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Run each window as an async NRQL query and poll it (for windows slower than 120s)')
+    parser.add_argument('--poll-interval', type=float, default=nrql_async.DEFAULT_POLL_INTERVAL,
+                        help='Seconds between progress polls with --async (default: %(default)s)')
+    parser.add_argument('--deadline', type=float, default=nrql_async.DEFAULT_DEADLINE,
+                        help='Seconds any one window may take with --async (default: %(default)s)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    now_ms = int(time.time() * 1000)
+    since_ms, until_ms = parse_time(args.since, now_ms), parse_time(args.until, now_ms)
+    if since_ms >= until_ms:
+        raise SystemExit("--since must be before --until")
+
+    runner = None
+    if args.use_async:
+        async_runner = nrql_async.AsyncNrqlRunner(poll_interval=args.poll_interval, deadline=args.deadline,
+                                                  max_in_flight=args.workers)
+        runner = async_runner.runner(args.account_id)
+    exporter = NrqlExporter(args.account_id, workers=args.workers, runner=runner)
+    sink = open_sink(args.output)
+    started = time.perf_counter()
+    try:
+        stats = exporter.export(args.nrql, since_ms, until_ms, sink, windows=args.windows)
+    finally:
+        sink.close()
+    print(f"Wrote {stats['rows']} rows to {args.output} in {time.perf_counter() - started:.1f}s "
+          f"({stats['queries']} queries, {stats['splits']} windows split, "
+          f"{stats['duplicates']} boundary duplicates dropped)")
+    if args.use_async:
+        print(f"  {async_runner.stats()}")
+    if stats['capped_windows']:
+        print(f"  {stats['capped_windows']} window(s) were still capped at {MIN_WINDOW_MS} ms; "
+              f"narrow the WHERE clause to export them completely")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+  What: Rate-limit-aware scheduler shared by every New Relic API call.
+  Why:  Exports used to either hammer the APIs until they returned 429s or
+        sleep a fixed delay between calls. The scheduler paces requests with
+        one adaptive token bucket per (API key, endpoint), caps the number of
+        requests in flight, and retries throttled/5xx responses with jittered
+        exponential backoff.
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+
+import requests
+
+# Endpoint families with independent rate limits
+GRAPHQL = 'graphql'
+SYNTHETICS = 'synthetics'
+REST_V2 = 'rest_v2'
+OTHER = 'other'
+
+# Requests per second each bucket may reach, and its burst size.
+# Buckets start at the max rate, halve on throttling and creep back up on success.
+DEFAULT_RATES = {
+    GRAPHQL: (float(os.getenv('NR_RATE_GRAPHQL', '20')), 25),
+    SYNTHETICS: (float(os.getenv('NR_RATE_SYNTHETICS', '5')), 10),
+    REST_V2: (float(os.getenv('NR_RATE_REST', '15')), 20),
+    OTHER: (float(os.getenv('NR_RATE_OTHER', '10')), 10),
+}
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv('NR_MAX_IN_FLIGHT', '25'))
+DEFAULT_MAX_RETRIES = int(os.getenv('NR_MAX_RETRIES', '6'))
+
+BACKOFF_BASE = 0.5   # seconds
+BACKOFF_CAP = 60.0   # seconds
+MIN_RATE = 0.2       # never throttle a bucket below one request per 5s
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def classify_endpoint(url):
+    if '/graphql' in url:
+        return GRAPHQL
+    if 'synthetics' in url:
+        return SYNTHETICS
+    if '/v2/' in url:
+        return REST_V2
+    return OTHER
+
+
+def key_fingerprint(api_key):
+    """Short, non-reversible id so buckets can be keyed per API key without keeping the key around."""
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:12]
+
+
+def is_graphql_rate_limited(response):
+    """NerdGraph reports throttling as HTTP 200 with a TOO_MANY_REQUESTS / rate limit error."""
+    if '"errors"' not in response.text:
+        return False
+    try:
+        errors = response.json().get('errors') or []
+    except ValueError:
+        return False
+    for err in errors:
+        error_class = ((err.get('extensions') or {}).get('errorClass') or '').upper()
+        message = (err.get('message') or '').lower()
+        if error_class == 'TOO_MANY_REQUESTS' or 'rate limit' in message or 'too many requests' in message:
+            return True
+    return False
+
+
+class TokenBucket:
+    """Thread-safe token bucket with AIMD rate adjustment."""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(MIN_RATE, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class RequestScheduler:
+    """
+    Gatekeeper for outbound API requests.
+
+    send() blocks until the (api key, endpoint) bucket has a token and an
+    in-flight slot is free, performs the request, and retries on 429, 5xx,
+    connection errors and NerdGraph rate-limit errors with full-jitter
+    exponential backoff (honouring Retry-After when present).
+    """
+
+    def __init__(self, rates=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT, max_retries=DEFAULT_MAX_RETRIES):
+        self.rates = dict(DEFAULT_RATES, **(rates or {}))
+        self.max_retries = max_retries
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.retries = 0
+        self.throttled = 0
+
+    def bucket(self, api_key, endpoint):
+        key = (key_fingerprint(api_key), endpoint)
+        with self.lock:
+            if key not in self.buckets:
+                rate, burst = self.rates.get(endpoint, self.rates[OTHER])
+                self.buckets[key] = TokenBucket(rate, burst)
+            return self.buckets[key]
+
+    def backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                # Honour the server's hint, but never sleep longer than our own backoff would
+                return min(BACKOFF_CAP, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+    def send(self, api_key, url, perform):
+        """Run perform() -> requests.Response under rate limiting and retry policy."""
+        endpoint = classify_endpoint(url)
+        bucket = self.bucket(api_key, endpoint)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            response = None
+            try:
+                with self.in_flight:
+                    response = perform()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                throttled = response.status_code == 429 or (
+                    endpoint == GRAPHQL and response.status_code == 200 and is_graphql_rate_limited(response)
+                )
+                if throttled:
+                    bucket.throttled()
+                    with self.lock:
+                        self.throttled += 1
+                elif response.status_code not in RETRY_STATUSES:
+                    bucket.succeeded()
+                    return response
+                if attempt >= self.max_retries:
+                    return response
+            with self.lock:
+                self.retries += 1
+            time.sleep(self.backoff(attempt, response))
+            attempt += 1
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler so every client using the same key shares its buckets."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+
+def configure(rates=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT, max_retries=DEFAULT_MAX_RETRIES):
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = RequestScheduler(rates=rates, max_in_flight=max_in_flight, max_retries=max_retries)
+        return _scheduler
@@ -0,0 +1,160 @@
+"""
+  What: Opt-in, SQLite-backed on-disk cache of NerdGraph responses.
+  Why:  Iterating on report/correlation logic meant re-running the whole
+        crawl every time. With the cache, re-runs inside the TTL are served
+        from disk and make no network calls.
+
+Keys are a hash of the API-key fingerprint, the whitespace-normalised query
+text (which carries the page cursor for the inline-cursor fetchers) and the
+JSON variables (which carry it for the others). Each entity collection has
+its own TTL.
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from request_scheduler import key_fingerprint
+
+DEFAULT_PATH = '.nr-cache.sqlite'
+DEFAULT_TTL = 3600  # seconds
+
+# First matching pattern names the collection a query belongs to
+COLLECTION_PATTERNS = [
+    (re.compile(r'policiesSearch'), 'policies'),
+    (re.compile(r'nrqlConditionsSearch'), 'alert_conditions'),
+    (re.compile(r'aiNotifications\s*{\s*channels'), 'notification_channels_ai'),
+    (re.compile(r'aiNotifications\s*{\s*destinations'), 'destinations'),
+    (re.compile(r'notificationChannels'), 'notification_channels_legacy'),
+    (re.compile(r'aiWorkflows'), 'workflows'),
+    (re.compile(r'userSearch'), 'users'),
+    (re.compile(r'nrql\s*\('), 'nrql'),
+    (re.compile(r'type:\s*APPLICATION'), 'apm_agents'),
+    (re.compile(r'type:\s*DASHBOARD'), 'dashboards'),
+    (re.compile(r'type:\s*HOST'), 'infra_agents'),
+    (re.compile(r'type:\s*MONITOR'), 'synthetics'),
+    (re.compile(r'entitySearch'), 'entities'),
+]
+
+# Per-collection TTLs (seconds); anything not listed uses the cache default
+DEFAULT_TTLS = {
+    'users': 24 * 3600,
+    'nrql': 300,
+}
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query):
+    return _WHITESPACE.sub(' ', query).strip()
+
+
+def collection_of(query):
+    for pattern, name in COLLECTION_PATTERNS:
+        if pattern.search(query):
+            return name
+    return 'other'
+
+
+def _seconds(value, part):
+    try:
+        seconds = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"cache TTL {part!r}: {value.strip()!r} is not a number of seconds")
+    if seconds < 0:
+        raise argparse.ArgumentTypeError(f"cache TTL {part!r}: seconds must not be negative")
+    return seconds
+
+
+def parse_ttls(spec):
+    """
+    Parse a --cache-ttl value: "3600" sets the default TTL,
+    "3600,users=86400,workflows=600" also overrides individual collections.
+    Returns (default_ttl, {collection: ttl}); raises argparse.ArgumentTypeError
+    naming the bad part for a non-numeric TTL or an unknown collection.
+    """
+    known = set(DEFAULT_TTLS) | {name for _, name in COLLECTION_PATTERNS} | {'other'}
+    default = DEFAULT_TTL
+    ttls = {}
+    for part in (spec or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '=' in part:
+            name, value = part.split('=', 1)
+            name = name.strip()
+            if name not in known:
+                raise argparse.ArgumentTypeError(
+                    f"cache TTL {part!r}: unknown collection {name!r} (one of: {', '.join(sorted(known))})")
+            ttls[name] = _seconds(value, part)
+        else:
+            default = _seconds(part, part)
+    return default, ttls
+
+
+def ttl_spec(value):
+    """argparse type for --cache-ttl: validates the value up front and keeps it as given."""
+    parse_ttls(value)
+    return value
+
+
+class ResponseCache:
+    """
+    refresh=True skips reads (forcing a re-crawl) but still stores the fresh
+    responses, so the next run is served from the cache again.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, default_ttl=DEFAULT_TTL, ttls=None, refresh=False):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, collection TEXT, created REAL, body TEXT)"
+        )
+        self.conn.commit()
+
+    def ttl_for(self, collection):
+        return self.ttls.get(collection, self.default_ttl)
+
+    def make_key(self, api_key, query, variables=None):
+        raw = json.dumps(
+            [key_fingerprint(api_key), normalize_query(query), variables or {}],
+            sort_keys=True, separators=(',', ':'),
+        )
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, api_key, query, variables=None):
+        if self.refresh:
+            return None
+        key = self.make_key(api_key, query, variables)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT collection, created, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or time.time() - row[1] > self.ttl_for(row[0]):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[2])
+
+    def put(self, api_key, query, variables, body):
+        key = self.make_key(api_key, query, variables)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, collection, created, body) VALUES (?, ?, ?, ?)",
+                (key, collection_of(query), time.time(), json.dumps(body)),
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,295 @@
+"""
+  What: Persistent inverted index over synthetic monitor scripts.
+  Why:  Every "which monitors reference domain X" question used to re-download
+        and re-scan every script. build_index tokenizes each script once into
+        SQLite: tokens, hostnames, URLs and selectors mapped to monitor GUIDs
+        and line numbers, plus a trigram full-text table of the script lines.
+        Substring, regex, hostname and token queries are then answered from
+        the index without touching the network.
+
+The index is incremental: each monitor's script hash is stored, and update()
+only re-tokenizes monitors whose script changed (prune() drops monitors that
+no longer exist). Hostnames are stored with their labels reversed
+(www.example.com -> com.example.www) so "example.com and its subdomains" is
+an index range scan.
+
+Regex queries run over the stored lines (no network), so they are slower than
+the indexed substring/host/token lookups.
+"""
+import re
+import sqlite3
+
+from script_store import content_hash
+
+DEFAULT_PATH = '.nr-script-index.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scripts (
+    guid TEXT PRIMARY KEY, name, hash TEXT);
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT, kind TEXT, guid TEXT, lines TEXT);
+CREATE INDEX IF NOT EXISTS terms_term ON terms (kind, term);
+CREATE INDEX IF NOT EXISTS terms_guid ON terms (guid);
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY, guid TEXT, line INTEGER, text);
+CREATE INDEX IF NOT EXISTS lines_guid ON lines (guid, line);
+"""
+
+# Trigram full-text index over lines.text (needs FTS5, SQLite 3.34+). It is
+# synced one monitor at a time with set-based statements: per-row triggers
+# made building the index about ten times slower.
+LINES_FTS = ("CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts"
+             " USING fts5(text, content='lines', content_rowid='id', tokenize='trigram')")
+
+TOKEN = 'token'
+HOST = 'host'
+URL = 'url'
+SELECTOR = 'selector'
+KINDS = (TOKEN, HOST, URL, SELECTOR)
+
+URL_PATTERN = re.compile(r'''https?://[^\s'"`<>()\\]+''', re.IGNORECASE)
+HOST_PATTERN = re.compile(r'(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}', re.IGNORECASE)
+EMAIL_HOST_PATTERN = re.compile(r'[\w.+-]+@((?:[a-z0-9-]+\.)+[a-z]{2,63})', re.IGNORECASE)
+QUOTED_PATTERN = re.compile(r'''(['"`])([^'"`\n]{3,255})\1''')
+SELECTOR_PATTERN = re.compile(
+    r'''(?:By\.(?:css|xpath|id|name|className|linkText|partialLinkText|tagName)|querySelector(?:All)?|\$\$?)'''
+    r'''\(\s*(['"`])(.*?)\1'''
+)
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_$][\w$-]*')
+
+
+def reverse_host(host):
+    return '.'.join(reversed(host.lower().strip('.').split('.')))
+
+
+def _host_of(url):
+    rest = url.split('://', 1)[-1]
+    host = re.split(r'[/?#]', rest, maxsplit=1)[0].rsplit('@', 1)[-1].split(':', 1)[0]
+    return host.lower() if HOST_PATTERN.fullmatch(host) else None
+
+
+def tokenize(text):
+    """Yield (term, kind, line) for every token, hostname, URL and selector in a script (lines are 1-based)."""
+    # Only '\n' ends a line, as in script_matcher; splitlines() also breaks on \r, \f, \u2028, ...
+    for number, line in enumerate(text.split('\n'), start=1):
+        seen = set()
+
+        def emit(term, kind):
+            if term and (term, kind) not in seen:
+                seen.add((term, kind))
+                return True
+            return False
+
+        for url in URL_PATTERN.findall(line):
+            url = url.rstrip('.,;')
+            if emit(url, URL):
+                yield url, URL, number
+            host = _host_of(url)
+            if host and emit(reverse_host(host), HOST):
+                yield reverse_host(host), HOST, number
+        for host in EMAIL_HOST_PATTERN.findall(line):
+            if emit(reverse_host(host), HOST):
+                yield reverse_host(host), HOST, number
+        for _, quoted in QUOTED_PATTERN.findall(line):
+            if HOST_PATTERN.fullmatch(quoted) and emit(reverse_host(quoted), HOST):
+                yield reverse_host(quoted), HOST, number
+        for _, selector in SELECTOR_PATTERN.findall(line):
+            if emit(selector, SELECTOR):
+                yield selector, SELECTOR, number
+        for token in TOKEN_PATTERN.findall(line):
+            token = token.lower()
+            if len(token) > 1 and emit(token, TOKEN):
+                yield token, TOKEN, number
+
+
+def postings(text):
+    """{(term, kind): [line, ...]} for one script, lines ascending."""
+    found = {}
+    for term, kind, number in tokenize(text):
+        found.setdefault((term, kind), []).append(number)
+    return found
+
+
+class Hit:
+    __slots__ = ('guid', 'name', 'line', 'text')
+
+    def __init__(self, guid, name, line, text):
+        self.guid = guid
+        self.name = name
+        self.line = line
+        self.text = text
+
+    def __repr__(self):
+        return f'Hit({self.guid!r}, {self.name!r}, line={self.line}, {self.text!r})'
+
+
+class ScriptIndex:
+    """
+    Usage:
+        index = ScriptIndex('.nr-script-index.sqlite')
+        index.update([(guid, name, script_text), ...]); index.prune(current_guids)
+        index.substring('insightglobal.com')   # [Hit(guid, name, line, text), ...]
+        index.regex(r'https://[^/]*\\.co\\.uk')
+        index.host('insightglobal.com')        # the host and its subdomains
+        index.term('findElement', kind='token')
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # A larger page cache keeps the term index B-trees in memory while a full build inserts millions of rows
+        self.conn.execute("PRAGMA cache_size = -65536")
+        self.conn.executescript(SCHEMA)
+        try:
+            self.conn.execute(LINES_FTS)
+            self.fts = True
+        except sqlite3.OperationalError:  # no FTS5 / trigram: substring queries scan the lines
+            self.fts = False
+        self.conn.create_function('regexp', 2, _regexp, deterministic=True)
+        self.conn.commit()
+
+    # -----------------------------
+    # Building
+    # -----------------------------
+
+    def hashes(self):
+        return dict(self.conn.execute("SELECT guid, hash FROM scripts"))
+
+    def _delete(self, guids):
+        for guid in guids:
+            if self.fts:
+                self.conn.execute("INSERT INTO lines_fts (lines_fts, rowid, text)"
+                                  " SELECT 'delete', id, text FROM lines WHERE guid = ?", (guid,))
+            self.conn.execute("DELETE FROM terms WHERE guid = ?", (guid,))
+            self.conn.execute("DELETE FROM lines WHERE guid = ?", (guid,))
+            self.conn.execute("DELETE FROM scripts WHERE guid = ?", (guid,))
+
+    def update(self, scripts):
+        """
+        Index (guid, name, text) triples; unchanged scripts (same hash) are skipped.
+        Returns the number of scripts (re)indexed.
+        """
+        known = self.hashes()
+        changed = 0
+        with self.conn:
+            for guid, name, text in scripts:
+                guid = str(guid)
+                text = text or ''
+                digest = content_hash(text)
+                if known.get(guid) == digest:
+                    self.conn.execute("UPDATE scripts SET name = ? WHERE guid = ?", (name, guid))
+                    continue
+                if guid in known:
+                    self._delete([guid])
+                self.conn.execute("INSERT INTO scripts (guid, name, hash) VALUES (?, ?, ?)", (guid, name, digest))
+                self.conn.executemany("INSERT INTO lines (guid, line, text) VALUES (?, ?, ?)", (
+                    (guid, number, line) for number, line in enumerate(text.split('\n'), start=1) if line.strip()
+                ))
+                if self.fts:
+                    self.conn.execute("INSERT INTO lines_fts (rowid, text) SELECT id, text FROM lines WHERE guid = ?",
+                                      (guid,))
+                # One row per (term, kind, monitor) with its line numbers, not one per line
+                self.conn.executemany("INSERT INTO terms (term, kind, guid, lines) VALUES (?, ?, ?, ?)", (
+                    (term, kind, guid, ','.join(map(str, numbers))) for (term, kind), numbers in postings(text).items()
+                ))
+                changed += 1
+        return changed
+
+    def prune(self, guids):
+        """Drop monitors not in guids (deleted upstream). Returns how many were dropped."""
+        keep = {str(g) for g in guids}
+        stale = [g for g in self.hashes() if g not in keep]
+        with self.conn:
+            self._delete(stale)
+        return len(stale)
+
+    # -----------------------------
+    # Queries
+    # -----------------------------
+
+    def _hits(self, rows):
+        return [Hit(guid, name, line, text) for guid, name, line, text in rows]
+
+    def substring(self, needle, case_sensitive=False):
+        """Lines containing needle (trigram index for needles of 3+ characters)."""
+        if self.fts and len(needle) >= 3:
+            phrase = '"' + needle.replace('"', '""') + '"'
+            rows = self.conn.execute(
+                "SELECT l.guid, s.name, l.line, l.text FROM lines_fts f JOIN lines l ON l.id = f.rowid"
+                " JOIN scripts s ON s.guid = l.guid"
+                " WHERE lines_fts MATCH ? ORDER BY s.name, l.guid, l.line", (phrase,))
+        else:
+            rows = self.conn.execute(
+                "SELECT l.guid, s.name, l.line, l.text FROM lines l JOIN scripts s ON s.guid = l.guid"
+                " WHERE instr(lower(l.text), ?) ORDER BY s.name, l.guid, l.line", (needle.lower(),))
+        if case_sensitive:
+            return self._hits(r for r in rows if needle in r[3])
+        low = needle.lower()
+        return self._hits(r for r in rows if low in r[3].lower())
+
+    def regex(self, pattern, case_sensitive=False):
+        """Lines matching a Python regular expression."""
+        flags = '' if case_sensitive else '(?i)'
+        re.compile(flags + pattern)  # surface a bad pattern as re.error before querying
+        return self._hits(self.conn.execute(
+            "SELECT l.guid, s.name, l.line, l.text FROM lines l JOIN scripts s ON s.guid = l.guid"
+            " WHERE regexp(?, l.text) ORDER BY s.name, l.guid, l.line", (flags + pattern,)))
+
+    def host(self, host, subdomains=True):
+        """Lines referencing a hostname (and, by default, any of its subdomains)."""
+        rev = reverse_host(host)
+        sql = ("SELECT t.guid, s.name, t.lines FROM terms t JOIN scripts s ON s.guid = t.guid"
+               " WHERE t.kind = ? AND (t.term = ?{})")
+        if subdomains:
+            # '/' sorts right after '.', so this range is every term starting with rev + '.'
+            rows = self.conn.execute(sql.format(" OR (t.term > ? AND t.term < ?)"), (HOST, rev, rev + '.', rev + '/'))
+        else:
+            rows = self.conn.execute(sql.format(''), (HOST, rev))
+        return self._posting_hits(rows)
+
+    def term(self, value, kind=TOKEN):
+        """Lines holding an exact token / URL / selector."""
+        if kind == HOST:
+            return self.host(value, subdomains=False)
+        value = value.lower() if kind == TOKEN else value
+        return self._posting_hits(self.conn.execute(
+            "SELECT t.guid, s.name, t.lines FROM terms t JOIN scripts s ON s.guid = t.guid"
+            " WHERE t.kind = ? AND t.term = ?", (kind, value)))
+
+    def _posting_hits(self, rows):
+        """(guid, name, 'l1,l2,...') postings -> Hits with their line text, in name/guid/line order."""
+        lines_by_script = {}
+        for guid, name, lines in rows:
+            lines_by_script.setdefault((name or '', guid), set()).update(int(n) for n in lines.split(','))
+        hits = []
+        for (name, guid), numbers in sorted(lines_by_script.items()):
+            numbers = sorted(numbers)
+            marks = ', '.join('?' for _ in numbers)
+            texts = dict(self.conn.execute(
+                f"SELECT line, text FROM lines WHERE guid = ? AND line IN ({marks})", [guid] + numbers))
+            hits.extend(Hit(guid, name, n, texts.get(n)) for n in numbers)
+        return hits
+
+    def stats(self):
+        scripts = self.conn.execute("SELECT COUNT(*) FROM scripts").fetchone()[0]
+        terms = self.conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+        return {'scripts': scripts, 'terms': terms}
+
+    def close(self):
+        self.conn.close()
+
+
+def _regexp(pattern, text):
+    if text is None:
+        return False
+    return _compiled(pattern).search(text) is not None
+
+
+_PATTERNS = {}
+
+
+def _compiled(pattern):
+    compiled = _PATTERNS.get(pattern)
+    if compiled is None:
+        compiled = _PATTERNS[pattern] = re.compile(pattern)
+    return compiled
@@ -0,0 +1,281 @@
+"""
+  What: Multi-pattern (Aho-Corasick) matcher for synthetic script search.
+  Why:  search_synthetic_code checked every target string against every
+        script with `needle in hay`, i.e. one full pass over the script per
+        target. An Aho-Corasick automaton finds every occurrence of every
+        target, overlaps included, in a single pass per script, and reports
+        where each match starts.
+
+Backends (same results, different speed):
+  pyahocorasick  C automaton, single pass; used whenever the optional
+                 package is installed (pip install pyahocorasick)
+  python         pure-Python automaton, single pass; used without
+                 pyahocorasick above FIND_MAX_PATTERNS targets
+  find           NOT single pass: one str.find sweep per target. Used without
+                 pyahocorasick for up to FIND_MAX_PATTERNS targets, which
+                 includes search_synthetic_code's default TARGET_STRINGS; at
+                 that size it beats the pure-Python automaton
+The backend in use is printed by search_synthetic_code. See
+benchmark_script_search.py for timings against the substring loop.
+
+PatternSetMatcher covers mixed literal / regular-expression pattern files
+(see load_patterns), each pattern with its own case sensitivity: literals
+share one automaton per case setting, regexes are scanned one by one.
+"""
+import re
+
+try:
+    import ahocorasick
+except ImportError:  # optional dependency
+    ahocorasick = None
+
+
+# Without pyahocorasick, target lists up to this size use the (per-target) str.find backend
+FIND_MAX_PATTERNS = 300
+
+
+class Match:
+    __slots__ = ('pattern', 'offset', 'line')
+
+    def __init__(self, pattern, offset, line):
+        self.pattern = pattern
+        self.offset = offset
+        self.line = line
+
+    def __repr__(self):
+        return f'Match({self.pattern!r}, offset={self.offset}, line={self.line})'
+
+
+class _Automaton:
+    """Pure-Python Aho-Corasick: trie of dict transitions plus failure links."""
+
+    def __init__(self, keys):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for index, key in enumerate(keys):
+            state = 0
+            for ch in key:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                state = nxt
+            self.out[state] += ((index, len(key)),)
+
+        # Breadth-first failure links; each state also reports its suffixes' outputs
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.out[nxt] += self.out[self.fail[nxt]]
+
+    def iter(self, text):
+        """Yield (key index, end offset) for every occurrence, in end-offset order."""
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for end, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for index, length in out[state]:
+                    yield index, end - length + 1
+
+
+class MultiPatternMatcher:
+    """
+    Usage:
+        matcher = MultiPatternMatcher(TARGET_STRINGS, case_sensitive=False)
+        matcher.find_all(script)  # [Match(pattern, offset, line), ...] in offset order
+        matcher.hits(script)      # {pattern: [Match, ...]} for the patterns found
+    Offsets are 0-based character offsets into the searched (lower-cased unless
+    case_sensitive) text, lines are 1-based.
+    """
+
+    def __init__(self, patterns, case_sensitive=False, backend=None):
+        self.patterns = list(dict.fromkeys(p for p in patterns if p))
+        self.case_sensitive = case_sensitive
+        keys = self.patterns if case_sensitive else [p.lower() for p in self.patterns]
+        if backend is None:
+            if ahocorasick is not None:
+                backend = 'pyahocorasick'
+            else:
+                backend = 'find' if len(keys) <= FIND_MAX_PATTERNS else 'python'
+        self.backend = backend
+        self._keys = keys
+        if backend == 'pyahocorasick':
+            self._automaton = ahocorasick.Automaton()
+            for index, key in enumerate(keys):
+                # Case folding can map two patterns onto one key; keep every pattern index
+                prior = self._automaton.get(key, ())
+                self._automaton.add_word(key, prior + ((index, len(key)),))
+            if keys:
+                self._automaton.make_automaton()
+        elif backend == 'python':
+            self._automaton = _Automaton(keys)
+
+    def _occurrences(self, hay):
+        if self.backend == 'pyahocorasick':
+            if not self.patterns:
+                return
+            for end, entries in self._automaton.iter(hay):
+                for index, length in entries:
+                    yield index, end - length + 1
+        elif self.backend == 'python':
+            yield from self._automaton.iter(hay)
+        else:
+            for index, key in enumerate(self._keys):
+                offset = hay.find(key)
+                while offset != -1:
+                    yield index, offset
+                    offset = hay.find(key, offset + 1)
+
+    def find_all(self, text):
+        if not text:
+            return []
+        hay = text if self.case_sensitive else text.lower()
+        found = sorted(self._occurrences(hay), key=lambda m: (m[1], m[0]))
+        # Matches are in offset order, so line numbers are counted forward once
+        matches = []
+        line, counted = 1, 0
+        for index, offset in found:
+            line += hay.count('\n', counted, offset)
+            counted = offset
+            matches.append(Match(self.patterns[index], offset, line))
+        return matches
+
+    def hits(self, text):
+        grouped = {}
+        for m in self.find_all(text):
+            grouped.setdefault(m.pattern, []).append(m)
+        return grouped
+
+
+# -----------------------------
+# Literal + regex pattern sets
+# -----------------------------
+
+class PatternSpec:
+    """One search pattern: kind is 'literal' or 'regex'; label is how it is reported."""
+
+    __slots__ = ('kind', 'pattern', 'case_sensitive', 'label')
+
+    def __init__(self, kind, pattern, case_sensitive=False, label=None):
+        if kind not in ('literal', 'regex'):
+            raise ValueError(f"Unknown pattern kind {kind!r} (expected 'literal' or 'regex')")
+        self.kind = kind
+        self.pattern = pattern
+        self.case_sensitive = case_sensitive
+        self.label = label or pattern
+
+    def regex(self):
+        body = re.escape(self.pattern) if self.kind == 'literal' else self.pattern
+        return body if self.case_sensitive else f'(?i:{body})'
+
+    def __repr__(self):
+        return f'PatternSpec({self.kind!r}, {self.pattern!r}, case_sensitive={self.case_sensitive})'
+
+
+_PREFIXES = {'lit': 'literal', 'literal': 'literal', 're': 'regex', 'regex': 'regex'}
+
+
+def parse_pattern_line(line, case_sensitive=False):
+    """
+    One line of a patterns file -> PatternSpec, or None for blanks and # comments.
+      insightglobal.com                  literal, default case sensitivity
+      lit:c InsightGlobal                literal, case-sensitive
+      re:i https?://[a-z0-9.-]*\\.co\\.uk  regex, case-insensitive
+    The prefix is lit|literal|re|regex, optionally followed by :i or :c.
+    """
+    text = line.rstrip('\n')
+    if not text.strip() or text.lstrip().startswith('#'):
+        return None
+    head, _, rest = text.partition(' ')
+    kind_name, _, flag = head.partition(':')
+    if rest and kind_name.lower() in _PREFIXES and flag.lower() in ('', 'i', 'c'):
+        kind = _PREFIXES[kind_name.lower()]
+        if flag:
+            case_sensitive = flag.lower() == 'c'
+        return PatternSpec(kind, rest.strip(), case_sensitive, label=text.strip())
+    return PatternSpec('literal', text.strip(), case_sensitive)
+
+
+def load_patterns(path, case_sensitive=False):
+    with open(path, encoding='utf-8') as f:
+        specs = [parse_pattern_line(line, case_sensitive) for line in f]
+    return [s for s in specs if s is not None]
+
+
+class PatternSetMatcher:
+    """
+    Mixed literal / regex PatternSpecs behind the same find_all / hits API as
+    MultiPatternMatcher, keyed by each spec's label.
+
+    Literals are grouped by case sensitivity into one MultiPatternMatcher
+    each, so any number of them still costs one pass per script and overlaps
+    are reported as before. Each regex is scanned with its own finditer
+    (non-overlapping matches, like grep); a single alternation of all of
+    them would lose re's literal-prefix fast path and report only one
+    pattern per offset. Patterns that can match the empty string are rejected.
+    """
+
+    def __init__(self, specs, backend=None):
+        self.specs = list(specs)
+        self.patterns = list(dict.fromkeys(s.label for s in self.specs))
+        self._literals = []
+        for case_sensitive in (False, True):
+            labels = {}
+            for spec in self.specs:
+                if spec.kind == 'literal' and spec.case_sensitive == case_sensitive and spec.pattern:
+                    labels.setdefault(spec.pattern, []).append(spec.label)
+            if labels:
+                matcher = MultiPatternMatcher(labels, case_sensitive=case_sensitive, backend=backend)
+                self._literals.append((matcher, labels))
+        self._regexes = []
+        for spec in self.specs:
+            if spec.kind != 'regex':
+                continue
+            try:
+                compiled = re.compile(spec.regex())
+            except re.error as e:
+                raise ValueError(f"Bad pattern {spec.label!r}: {e}") from None
+            if compiled.fullmatch(''):
+                raise ValueError(f"Pattern {spec.label!r} matches the empty string")
+            self._regexes.append((spec.label, compiled))
+        self.backend = '+'.join([m.backend for m, _ in self._literals] + (['regex'] if self._regexes else []))
+
+    def find_all(self, text):
+        if not text:
+            return []
+        found = []
+        for matcher, labels in self._literals:
+            hay = text if matcher.case_sensitive else text.lower()
+            for index, offset in matcher._occurrences(hay):
+                for label in labels[matcher.patterns[index]]:
+                    found.append((offset, label))
+        for label, compiled in self._regexes:
+            found.extend((m.start(), label) for m in compiled.finditer(text))
+        order = {label: i for i, label in enumerate(self.patterns)}
+        found.sort(key=lambda m: (m[0], order[m[1]]))
+        matches = []
+        line, counted = 1, 0
+        for offset, label in found:
+            line += text.count('\n', counted, offset)
+            counted = offset
+            matches.append(Match(label, offset, line))
+        return matches
+
+    def hits(self, text):
+        grouped = {}
+        for m in self.find_all(text):
+            grouped.setdefault(m.pattern, []).append(m)
+        return grouped
@@ -0,0 +1,132 @@
+"""
+  What: Local, content-addressed store of synthetic monitor scripts.
+  Why:  search_synthetic_code and synthetics.save_synthetic_scripts used to
+        download and base64-decode every script on every run, although most
+        scripts never change. The store remembers each monitor's script hash
+        and modifiedAt; a script is only downloaded again when the monitor's
+        modifiedAt differs from the one it was stored with.
+
+Layout under the store directory:
+  index.json             {monitor guid: {"hash", "modifiedAt", "name"}}
+  objects/<ab>/<hash>    decoded script text, named by its sha256 (shared by identical scripts)
+"""
+import hashlib
+import json
+import os
+import threading
+
+DEFAULT_DIR = '.nr-scripts'
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def object_path(root, digest):
+    return os.path.join(root, 'objects', digest[:2], digest)
+
+
+def read_object(root, digest):
+    """Script text stored under digest (lets worker processes read scripts without the index)."""
+    with open(object_path(root, digest), encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+class ScriptStore:
+    """
+    Usage:
+        store = ScriptStore()
+        text = store.load(guid, modified_at, lambda: fetch_and_decode(guid), name=...)
+        store.save()
+    refresh=True downloads every script again but still records it, so the
+    next run is served from the store.
+    """
+
+    def __init__(self, root=DEFAULT_DIR, refresh=False):
+        self.root = root
+        self.refresh = refresh
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self.index = self._load_index()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.downloads = 0
+
+    def _index_path(self):
+        return os.path.join(self.root, 'index.json')
+
+    def _object_path(self, digest):
+        return object_path(self.root, digest)
+
+    def _load_index(self):
+        path = self._index_path()
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def is_fresh(self, guid, modified_at):
+        """True when the stored script was saved for this modifiedAt (unknown modifiedAt is never fresh)."""
+        if self.refresh or modified_at is None:
+            return False
+        with self.lock:
+            entry = self.index.get(str(guid))
+        return (entry is not None and entry.get('modifiedAt') == modified_at
+                and os.path.exists(self._object_path(entry['hash'])))
+
+    def digest(self, guid):
+        """Content hash of the stored script, or None."""
+        with self.lock:
+            entry = self.index.get(str(guid))
+        return entry['hash'] if entry is not None else None
+
+    def get(self, guid):
+        with self.lock:
+            entry = self.index.get(str(guid))
+        if entry is None:
+            return None
+        path = self._object_path(entry['hash'])
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8', newline='') as f:
+            return f.read()
+
+    def put(self, guid, text, modified_at=None, name=None):
+        digest = content_hash(text)
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so an interrupted run never leaves a truncated script
+            tmp = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp, 'w', encoding='utf-8', newline='') as f:
+                f.write(text)
+            os.replace(tmp, path)
+        with self.lock:
+            self.index[str(guid)] = {'hash': digest, 'modifiedAt': modified_at, 'name': name}
+        return digest
+
+    def load(self, guid, modified_at, fetch, name=None):
+        """Stored script when still fresh, else fetch() it and store the result."""
+        if self.is_fresh(guid, modified_at):
+            text = self.get(guid)
+            if text is not None:
+                with self.lock:
+                    self.hits += 1
+                return text
+        text = fetch()
+        self.put(guid, text, modified_at, name)
+        with self.lock:
+            self.downloads += 1
+        return text
+
+    def entries(self):
+        """(guid, entry) pairs of every stored script."""
+        with self.lock:
+            return list(self.index.items())
+
+    def save(self):
+        path = self._index_path()
+        tmp = path + '.tmp'
+        with self.lock:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, default=str)
+        os.replace(tmp, path)
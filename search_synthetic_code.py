@@ -4,27 +4,47 @@ Find Synthetics monitors whose script contains any of a set of strings.
 
 What it does:
   1) Uses NerdGraph to enumerate all Synthetic monitors and their GUIDs.
-  2) Uses the Synthetics REST API to fetch each monitor's script text.
-  3) Searches for each target string (case-insensitive) within the script.
-  4) Writes results to CSV and prints a concise summary.
+  2) Uses the Synthetics REST API to fetch each monitor's script text
+     (only when it changed since the copy kept in the local script store).
+  3) Finds every target string (case-insensitive) in each script: in one pass with
+     pyahocorasick installed, else one str.find sweep per target (see script_matcher).
+  4) Writes results (with match offsets and line numbers) to CSV and prints a concise summary.
 
 Prereqs:
   pip install requests tqdm
 
+Usage:
+  python search_synthetic_code.py                       # one script at a time
+  python search_synthetic_code.py --workers 8 --rps 10  # 8 fetches in flight, at most 10 requests/s
+  python search_synthetic_code.py --refresh-scripts     # ignore the local script store for this run
+  python search_synthetic_code.py --patterns patterns.txt --processes 0   # literal/regex file, every core
+  python search_synthetic_code.py build-index           # (re)index changed scripts into .nr-script-index.sqlite
+  python search_synthetic_code.py query insightglobal.com          # substring
+  python search_synthetic_code.py query --host insightglobal.com   # hostname and subdomains
+  python search_synthetic_code.py query --regex 'https://[^/]*[.]co[.]uk'
+
 Env vars (or edit the CONFIG block below):
   NEW_RELIC_API_KEY   -> User/Personal API key (NRAK-...)
   NEW_RELIC_ACCOUNT_ID-> Your New Relic account ID (integer)
   NEW_RELIC_REGION    -> "US" (default) or "EU"
 """
 
+import argparse
 import csv
 import os
 import sys
 import time
 import requests
 import base64
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from dotenv import load_dotenv
+import request_scheduler
+from nerdgraph_client import DEFAULT_POOL_SIZE, NerdGraphClient
+import script_index
+import script_matcher
+from script_matcher import Match
+import script_store
 
 # ---------------------- CONFIG ----------------------
 TARGET_STRINGS = [
@@ -51,18 +71,19 @@ REGION       = os.getenv("NEW_RELIC_REGION", "US").strip().upper()  # "US" or "E
 
 OUTPUT_CSV   = "synthetics_string_hits.csv"
 CASE_SENSITIVE = False  # set True if you want case-sensitive matches
-
-# Throttle between script fetches to be polite (in seconds)
-SCRIPT_FETCH_DELAY = 0.05
+# Request pacing/backoff is handled by request_scheduler (see NR_RATE_SYNTHETICS)
 # ---------------------------------------------------
 
-if not API_KEY or not ACCOUNT_ID:
-    print("ERROR: Please set NEW_RELIC_API_KEY and NEW_RELIC_ACCOUNT_ID env vars (or edit the script).")
-    sys.exit(1)
 
-if REGION not in ("US", "EU"):
-    print('ERROR: NEW_RELIC_REGION must be "US" or "EU".')
-    sys.exit(1)
+def require_config():
+    """Commands that talk to New Relic need a key, an account and a valid region (query works offline)."""
+    if not API_KEY or not ACCOUNT_ID:
+        print("ERROR: Please set NEW_RELIC_API_KEY and NEW_RELIC_ACCOUNT_ID env vars (or edit the script).")
+        sys.exit(1)
+
+    if REGION not in ("US", "EU"):
+        print('ERROR: NEW_RELIC_REGION must be "US" or "EU".')
+        sys.exit(1)
 
 GRAPHQL_URL = "https://api.newrelic.com/graphql" if REGION == "US" else "https://api.eu.newrelic.com/graphql"
 SYNTHETICS_BASE = (
@@ -80,6 +101,9 @@ headers_synthetics = {
     "Api-Key": API_KEY,  # Synthetics v3 REST header (note the casing)
 }
 
+# One pooled, rate-limited client for both NerdGraph and Synthetics REST calls
+client = NerdGraphClient(api_key=API_KEY, url=GRAPHQL_URL)
+
 def nrql_escape(s: str) -> str:
     return s.replace("\\", "\\\\").replace('"', '\\"')
 
@@ -114,7 +138,7 @@ def fetch_all_synthetics():
     cursor = None
     while True:
         payload = {"query": query, "variables": {"cursor": cursor}}
-        resp = requests.post(GRAPHQL_URL, json=payload, headers=headers_graphql, timeout=60)
+        resp = client.request("POST", GRAPHQL_URL, json=payload, headers=headers_graphql, timeout=60)
         resp.raise_for_status()
         data = resp.json()
 
@@ -147,7 +171,7 @@ def fetch_script_for_monitor(guid: str) -> str:
     Returns script text or "" if not present (e.g., for non-scripted monitors).
     """
     url = f"{SYNTHETICS_BASE}/monitors/{guid}/script"
-    r = requests.get(url, headers=headers_synthetics, timeout=60)
+    r = client.request("GET", url, headers=headers_synthetics, timeout=60)
     if r.status_code == 404:
         # Not a scripted monitor or no script available
         return ""
@@ -157,63 +181,275 @@ def fetch_script_for_monitor(guid: str) -> str:
     return j.get("scriptText") or j.get("script") or ""
 
 
-def main():
+def fetch_monitor_versions():
+    """
+    GET /monitors from Synthetics v3, 100 at a time.
+    Returns {monitor id: modifiedAt}, used to tell which stored scripts are stale.
+    """
+    versions = {}
+    offset, limit = 0, 100
+    while True:
+        r = client.request("GET", f"{SYNTHETICS_BASE}/monitors", params={"offset": offset, "limit": limit},
+                           headers=headers_synthetics, timeout=60)
+        r.raise_for_status()
+        page = r.json().get("monitors", []) or []
+        for mon in page:
+            versions[mon.get("id")] = mon.get("modifiedAt")
+        if len(page) < limit:
+            return versions
+        offset += limit
+
+
+def load_script(m, store=None) -> str:
+    """
+    Fetch and decode one monitor's script; "" (with a warning) when the API refuses.
+    With a ScriptStore, the stored copy is used unless the monitor's modifiedAt changed.
+    """
+    guid = m["guid"]
+
+    def download():
+        return base64.b64decode(fetch_script_for_monitor(guid)).decode('utf-8')
+
+    try:
+        if store is None:
+            return download()
+        return store.load(guid, m.get("modifiedAt"), download, name=m.get("name"))
+    except requests.HTTPError as e:
+        # Continue on errors; log minimal info
+        sys.stderr.write(f"[WARN] Failed to fetch script for {m.get('name')} ({guid}): {e}\n")
+        return ""
+
+
+def fetch_scripts(monitors, workers=1, store=None):
+    """
+    Return {guid: script} for every monitor.
+    Scripts unchanged since they were stored are read from the store instead.
+    With workers > 1 scripts are fetched on a thread pool; pacing, the
+    requests/s cap and 429 retries are handled by request_scheduler, and the
+    progress bar advances as each fetch completes. The result is keyed by
+    guid, so it is identical to the serial path.
+    """
+    scripts = {}
+    with tqdm(total=len(monitors), unit="mon", smoothing=0.1) as bar:
+        if workers <= 1:
+            for m in monitors:
+                scripts[m["guid"]] = load_script(m, store)
+                bar.update(1)
+            return scripts
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(load_script, m, store): m["guid"] for m in monitors}
+            for future in as_completed(futures):
+                scripts[futures[future]] = future.result()
+                bar.update(1)
+    return scripts
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Find Synthetics monitors whose script contains any target string.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Scripts fetched in parallel (default: %(default)s, serial)')
+    parser.add_argument('--rps', type=float, default=request_scheduler.DEFAULT_RATES[request_scheduler.SYNTHETICS][0],
+                        help='Max Synthetics API requests per second (default: %(default)s, env NR_RATE_SYNTHETICS)')
+    parser.add_argument('--script-store', type=str, default=script_store.DEFAULT_DIR,
+                        help='Directory of locally stored scripts; only changed scripts are downloaded (default: %(default)s)')
+    parser.add_argument('--no-script-store', action='store_true', help='Download every script and keep nothing on disk')
+    parser.add_argument('--refresh-scripts', action='store_true',
+                        help='Download every script again (the store is still updated)')
+    parser.add_argument('--patterns', type=str, default=None,
+                        help='File of literal / regex patterns (one per line, e.g. "re:i https?://.*[.]co[.]uk") '
+                             'to search for instead of TARGET_STRINGS')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Scan stored scripts on N processes (0 = one per CPU; default: %(default)s)')
+
+    commands = parser.add_subparsers(dest='command', metavar='{search,build-index,query}')
+    commands.add_parser('search', help='Scan every script for TARGET_STRINGS and write the CSV (the default)')
+    build = commands.add_parser('build-index', help='Fetch changed scripts and update the local inverted index')
+    build.add_argument('--index-db', type=str, default=script_index.DEFAULT_PATH,
+                       help='SQLite file holding the index (default: %(default)s)')
+    query = commands.add_parser('query', help='Answer a search from the local index, without network calls')
+    query.add_argument('pattern', help='Substring (default), regular expression, hostname or exact term')
+    mode = query.add_mutually_exclusive_group()
+    mode.add_argument('--regex', action='store_true', help='Treat pattern as a Python regular expression')
+    mode.add_argument('--host', action='store_true', help='Hostname, matching its subdomains too')
+    mode.add_argument('--term', choices=script_index.KINDS, help='Exact token / url / selector / host')
+    query.add_argument('--case-sensitive', action='store_true', help='Substring and regex queries only')
+    query.add_argument('--limit', type=int, default=50, help='Hits to print (default: %(default)s, 0 = all)')
+    query.add_argument('--index-db', type=str, default=script_index.DEFAULT_PATH,
+                       help='SQLite file holding the index (default: %(default)s)')
+    return parser.parse_args()
+
+
+def load_all_scripts(args):
+    """Inventory the SCRIPT_BROWSER monitors and fetch their scripts; returns (monitors, {guid: script})."""
+    global client
+    require_config()
+    workers = max(1, args.workers)
+    # Cap the Synthetics bucket at --rps and let every worker hold a connection
+    request_scheduler.configure(
+        rates={request_scheduler.SYNTHETICS: (args.rps, max(1, int(args.rps)))},
+        max_in_flight=max(workers, request_scheduler.DEFAULT_MAX_IN_FLIGHT),
+    )
+    # Swap in a client sized for the workers; the module-level one would otherwise leak its pool
+    client.close()
+    client = NerdGraphClient(api_key=API_KEY, url=GRAPHQL_URL, pool_size=max(workers, DEFAULT_POOL_SIZE))
+
     print(f"Region: {REGION}")
     print("Fetching Synthetics monitor inventory via NerdGraph...")
     monitors = fetch_all_synthetics()
     if not monitors:
-        print("No Synthetics monitors found.")
-        return
+        return monitors, {}, None
+
+    store = None
+    if not args.no_script_store:
+        store = script_store.ScriptStore(args.script_store, refresh=args.refresh_scripts)
+        versions = fetch_monitor_versions()
+        for m in monitors:
+            m["modifiedAt"] = versions.get(m["guid"])
 
     # Prefetch scripts for all monitors once (to avoid re-fetch per string)
-    scripts = {}
-    print(f"Fetching scripts for {len(monitors)} monitors...")
-    for m in tqdm(monitors, unit="mon", smoothing=0.1):
-    # for m in monitors:
+    print(f"Fetching scripts for {len(monitors)} monitors ({workers} worker(s), <= {args.rps:g} req/s)...")
+    scripts = fetch_scripts(monitors, workers, store)
+    if store is not None:
+        store.save()
+        print(f"Script store: {store.hits} unchanged, {store.downloads} downloaded ({store.root})")
+    return monitors, scripts, store
+
+
+# Worker-process state for parallel scans (set once per process by _init_scan_worker)
+_scan_matcher = None
+_scan_root = None
+
+
+def _init_scan_worker(matcher, root):
+    global _scan_matcher, _scan_root
+    _scan_matcher, _scan_root = matcher, root
+
+
+def _scan_chunk(chunk):
+    """[(guid, digest)] -> [(guid, [(pattern, offset, line), ...])] for the scripts with a hit."""
+    results = []
+    for guid, digest in chunk:
+        found = _scan_matcher.find_all(script_store.read_object(_scan_root, digest))
+        if found:
+            # Plain tuples pickle far faster than Match objects
+            results.append((guid, [(m.pattern, m.offset, m.line) for m in found]))
+    return results
+
+
+def scan_scripts(monitors, scripts, matcher, store=None, processes=1):
+    """
+    {guid: {pattern: [Match, ...]}} for every monitor with a hit.
+    With processes > 1, scripts whose stored copy is exactly what this run
+    loaded are scanned on a process pool: workers get the matcher once and
+    read scripts from the store's files, so script text is never pickled
+    across processes. The rest (e.g. a failed download, scanned as "") are
+    scanned in this process, so results do not depend on --processes.
+    """
+    found = {}
+    digests, local = [], []
+    for m in monitors:
         guid = m["guid"]
-        try:
-            # script = fetch_script_for_monitor(guid)
-            script = base64.b64decode(fetch_script_for_monitor(guid)).decode('utf-8')
-        except requests.HTTPError as e:
-            # Continue on errors; log minimal info
-            script = ""
-            sys.stderr.write(f"[WARN] Failed to fetch script for {m.get('name')} ({guid}): {e}\n")
-        scripts[guid] = script
-        if SCRIPT_FETCH_DELAY:
-            time.sleep(SCRIPT_FETCH_DELAY)
-
-    # Prepare search
-    targets = TARGET_STRINGS[:]
-    if not CASE_SENSITIVE:
-        targets_norm = [t.lower() for t in targets]
+        text = scripts.get(guid, "") or ""
+        digest = store.digest(guid) if processes > 1 and store is not None and text else None
+        if digest is not None and digest == script_store.content_hash(text):
+            digests.append((guid, digest))
+        else:
+            local.append(guid)
+    for guid in local:
+        hits = matcher.hits(scripts.get(guid, "") or "")
+        if hits:
+            found[guid] = hits
+    if not digests:
+        return found
+    chunk_size = max(1, len(digests) // (processes * 8))
+    chunks = [digests[i:i + chunk_size] for i in range(0, len(digests), chunk_size)]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_scan_worker,
+                             initargs=(matcher, store.root)) as pool:
+        for results in pool.map(_scan_chunk, chunks):
+            for guid, matches in results:
+                hits = found[guid] = {}
+                for pattern, offset, line in matches:
+                    hits.setdefault(pattern, []).append(Match(pattern, offset, line))
+    # Same monitor order as the serial scan
+    return {m["guid"]: found[m["guid"]] for m in monitors if m["guid"] in found}
+
+
+def build_index(args):
+    monitors, scripts, _ = load_all_scripts(args)
+    index = script_index.ScriptIndex(args.index_db)
+    started = time.perf_counter()
+    changed = index.update((m["guid"], m.get("name"), scripts.get(m["guid"], "")) for m in monitors)
+    dropped = index.prune(m["guid"] for m in monitors)
+    stats = index.stats()
+    index.close()
+    print(f"Index {args.index_db}: {changed} script(s) (re)indexed, {dropped} dropped, "
+          f"{stats['scripts']} monitors / {stats['terms']} postings in {time.perf_counter() - started:.1f}s")
+
+
+def query_index(args):
+    if not os.path.exists(args.index_db):
+        print(f"ERROR: no index at {args.index_db}; run build-index first.")
+        sys.exit(1)
+    index = script_index.ScriptIndex(args.index_db)
+    started = time.perf_counter()
+    if args.regex:
+        hits = index.regex(args.pattern, case_sensitive=args.case_sensitive)
+    elif args.host:
+        hits = index.host(args.pattern)
+    elif args.term:
+        hits = index.term(args.pattern, kind=args.term)
+    else:
+        hits = index.substring(args.pattern, case_sensitive=args.case_sensitive)
+    elapsed = (time.perf_counter() - started) * 1000
+    index.close()
+
+    shown = hits if args.limit <= 0 else hits[:args.limit]
+    for h in shown:
+        print(f"{h.name} ({h.guid}) line {h.line}: {(h.text or '').strip()[:160]}")
+    if len(shown) < len(hits):
+        print(f"... +{len(hits) - len(shown)} more")
+    monitors = len({h.guid for h in hits})
+    print(f"\n{len(hits)} line(s) in {monitors} monitor(s), {elapsed:.1f} ms")
+
+
+def search(args):
+    if args.patterns:
+        specs = script_matcher.load_patterns(args.patterns, case_sensitive=CASE_SENSITIVE)
+        matcher = script_matcher.PatternSetMatcher(specs)
     else:
-        targets_norm = targets
+        matcher = script_matcher.MultiPatternMatcher(TARGET_STRINGS, case_sensitive=CASE_SENSITIVE)
+    monitors, scripts, store = load_all_scripts(args)
+    if not monitors:
+        print("No Synthetics monitors found.")
+        return
 
-    # Build index of matches: { target_string : [ monitor dicts... ] }
+    # Build index of matches: { target : [ (monitor dict, [Match...]) ... ] }
+    targets = matcher.patterns
     results = {t: [] for t in targets}
+    processes = args.processes if args.processes > 0 else (os.cpu_count() or 1)
 
-    print("Scanning scripts for target strings...")
+    print(f"Scanning scripts for {len(targets)} pattern(s) ({matcher.backend} matcher, {processes} process(es))...")
+    if 'find' in matcher.backend.split('+'):
+        print("  find matcher: one str.find sweep per pattern per script, not a single pass; "
+              "pip install pyahocorasick for the single-pass automaton")
+    hits_by_guid = scan_scripts(monitors, scripts, matcher, store, processes)
     for m in monitors:
-        guid = m["guid"]
-        script = scripts.get(guid, "") or ""
-        if not script:
-            continue
-
-        hay = script if CASE_SENSITIVE else script.lower()
-        for original, needle in zip(targets, targets_norm):
-            if needle in hay:
-                results[original].append(m)
+        for pattern, matches in hits_by_guid.get(m["guid"], {}).items():
+            results[pattern].append((m, matches))
 
     # Write CSV and show summary
     total_hits = 0
     with open(OUTPUT_CSV, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
-        w.writerow(["search_string", "monitor_name", "monitor_guid", "monitor_type"])
+        w.writerow(["search_string", "monitor_name", "monitor_guid", "monitor_type",
+                    "match_count", "offsets", "line_numbers"])
         for s in targets:
             hits = results[s]
             if hits:
-                for m in hits:
-                    w.writerow([s, m.get("name"), m.get("guid"), m.get("monitorType")])
+                for m, matches in hits:
+                    w.writerow([s, m.get("name"), m.get("guid"), m.get("monitorType"), len(matches),
+                                ";".join(str(x.offset) for x in matches),
+                                ";".join(str(x.line) for x in matches)])
                 total_hits += len(hits)
 
     print("\n=== Summary ===")
@@ -222,8 +458,9 @@ def main():
         if hits:
             print(f"'{s}': {len(hits)} monitor(s)")
             # show top few names
-            for m in hits[:5]:
-                print(f"  - {m.get('name')} ({m.get('guid')})")
+            for m, matches in hits[:5]:
+                lines = ", ".join(str(x.line) for x in matches[:3])
+                print(f"  - {m.get('name')} ({m.get('guid')}) line(s) {lines}")
             if len(hits) > 5:
                 print(f"  ... +{len(hits)-5} more")
         else:
@@ -232,5 +469,15 @@ def main():
     print(f"\nWrote detailed results to: {OUTPUT_CSV} (rows: {total_hits})")
     print("Done.")
 
+
+def main():
+    args = parse_args()
+    if args.command == 'build-index':
+        build_index(args)
+    elif args.command == 'query':
+        query_index(args)
+    else:
+        search(args)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,6 +6,8 @@ import base64
 from pathlib import Path
 from dotenv import load_dotenv
 
+from script_store import ScriptStore
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -115,22 +117,33 @@ def write_monitors_to_csv(monitors, filename='synthetic_monitors.csv'):
             writer.writerow(monitor)
 
 
-def save_synthetic_scripts(synthetics):
+def save_synthetic_scripts(synthetics, store=None):
+    """
+    Back up every SCRIPT_BROWSER script to a timestamped folder.
+    Scripts are read from the local ScriptStore and only downloaded when the
+    monitor's modifiedAt changed since they were stored.
+    """
     dir_path = f"{LOC_DIR_NAME}/backup-{TIMESTAMP}"
     loc_dir = Path(dir_path)
     loc_dir.mkdir(parents=True, exist_ok=True)
+    if store is None:
+        store = ScriptStore()
 
     for synthetic in synthetics:
         if synthetic['type'] == 'SCRIPT_BROWSER':
-            script_response = requests.get(f"{URL}/{synthetic['id']}/script", headers=HEADERS)
-            script_response.raise_for_status()
-            script = script_response.json()
-            script_text = base64.b64decode(script['scriptText'])
+            def download():
+                script_response = requests.get(f"{URL}/{synthetic['id']}/script", headers=HEADERS)
+                script_response.raise_for_status()
+                script = script_response.json()
+                return str(base64.b64decode(script['scriptText']), "utf-8")
+
+            script_text = store.load(synthetic['id'], synthetic.get('modifiedAt'), download, name=synthetic['name'])
             synthetic_name = synthetic['name'].replace(" ", "-")
             filename = loc_dir / f'{synthetic_name}.js'
-            # filename.write_text(str(script_text, "utf-8"))
+            # filename.write_text(script_text)
             with open(filename, 'w') as file:
-                file.write(str(script_text, "utf-8"))
+                file.write(script_text)
+    store.save()
 
 
 def find_alert_condition(monitors, monitor_name):
@@ -0,0 +1,112 @@
+"""
+  What: Constant-memory Excel workbook writer for the exporters.
+  Why:  Building a pandas DataFrame per sheet and saving through openpyxl's
+        normal mode kept the whole workbook in RAM. Here rows are appended to
+        openpyxl write-only worksheets as they are produced, and a sheet that
+        reaches Excel's row limit continues on a new "<name>_2" sheet.
+"""
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+# Excel's hard limit is 1,048,576 rows per sheet, header included
+EXCEL_MAX_ROWS = 1048576
+SHEET_NAME_MAX = 31
+
+
+def flatten_record(record, prefix=''):
+    """
+    Flatten nested dicts into dotted keys the way pandas.json_normalize does:
+    scalar (and list) values keep their position, flattened sub-dicts follow.
+    """
+    flat = {}
+    nested = []
+    for key, value in record.items():
+        if isinstance(value, dict):
+            nested.append((f'{prefix}{key}.', value))
+        else:
+            flat[f'{prefix}{key}'] = value
+    for sub_prefix, value in nested:
+        flat.update(flatten_record(value, prefix=sub_prefix))
+    return flat
+
+
+def columns_of(records):
+    """Union of flattened keys in first-seen order (json_normalize's column order)."""
+    columns = {}
+    for record in records:
+        for key in flatten_record(record):
+            columns.setdefault(key, None)
+    return list(columns)
+
+
+def cell_value(value):
+    # Write-only cells take scalars only; render lists/dicts the way pandas would (str())
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def sheet_title(name, part):
+    suffix = '' if part == 1 else f'_{part}'
+    return name[:SHEET_NAME_MAX - len(suffix)] + suffix
+
+
+class StreamingWorkbook:
+    """
+    Usage:
+        book = StreamingWorkbook('out.xlsx')
+        book.write_sheet('policies', rows)                    # rows: list of dicts
+        book.write_sheet('big_map', row_generator, columns)   # generators need declared columns
+        book.save()
+    """
+
+    def __init__(self, filename, max_rows=EXCEL_MAX_ROWS):
+        self.filename = filename
+        self.max_rows = max_rows
+        self.workbook = Workbook(write_only=True)
+        self.header_font = Font(bold=True)
+
+    def _new_sheet(self, name, part, columns):
+        sheet = self.workbook.create_sheet(sheet_title(name, part))
+        header = []
+        for col in columns:
+            cell = WriteOnlyCell(sheet, value=col)
+            cell.font = self.header_font
+            header.append(cell)
+        if header:
+            sheet.append(header)
+        return sheet
+
+    def write_sheet(self, name, records, columns=None, flatten=True):
+        """
+        Append records (dicts, or sequences already in `columns` order when
+        flatten=False) to sheet `name`, splitting into name_2, name_3, ... when
+        a sheet fills up. Without `columns` the records must be a list so the
+        header can be computed before streaming. Returns the number of rows written.
+        """
+        if columns is None:
+            records = list(records)
+            columns = columns_of(records)
+        part = 1
+        sheet = self._new_sheet(name, part, columns)
+        rows_in_sheet = 1
+        written = 0
+        for record in records:
+            if rows_in_sheet >= self.max_rows:
+                part += 1
+                sheet = self._new_sheet(name, part, columns)
+                rows_in_sheet = 1
+            if flatten:
+                flat = flatten_record(record)
+                sheet.append([cell_value(flat.get(col)) for col in columns])
+            else:
+                sheet.append([cell_value(v) for v in record])
+            rows_in_sheet += 1
+            written += 1
+        if part > 1:
+            print(f"Sheet '{name}' split across {part} sheets ({written} rows)")
+        return written
+
+    def save(self):
+        self.workbook.save(self.filename)
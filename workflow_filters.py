@@ -0,0 +1,156 @@
+"""
+  What: One-time parsing of workflow issuesFilter predicates.
+  Why:  Every correlation (workflow sheet, policy map, inventory) asked
+        for the policy IDs a workflow routes, and each call re-ran
+        re.findall over every predicate value of every workflow.
+        Workflows are now parsed once into a WorkflowRecord and the derived
+        policy-ID set is cached per (accountId, workflowId) for the run.
+
+Operators (NerdGraph AiWorkflowsOperator, plus IN):
+  DOES_NOT_EXACTLY_MATCH, DOES_NOT_EQUAL, NOT_EQUAL, IS_NOT, NOT_IN, DOES_NOT_CONTAIN
+      -> the policy IDs in the values are excluded from the workflow
+  GREATER_*, LESS_*
+      -> ignored (no finite set of IDs)
+  EXACTLY_MATCHES, EQUAL, IS, IN, CONTAINS, STARTS_WITH, ENDS_WITH,
+  a missing/empty operator and anything else
+      -> the policy IDs in the values are routed to the workflow
+A workflow whose policy predicates only exclude (e.g. labels.policyIds
+DOES_NOT_EQUAL 123) routes every policy but those; it has no finite
+policy_ids, so it is flagged with excludes_only instead.
+
+Run check_workflow_filters.py after changing the operator rules.
+"""
+import re
+import threading
+
+POLICY_ID_PATTERN = re.compile(r'\d+')
+
+INCLUDE_OPERATORS = frozenset({
+    'EXACTLY_MATCHES', 'EQUAL', 'IS', 'IN', 'CONTAINS', 'STARTS_WITH', 'ENDS_WITH',
+})
+EXCLUDE_OPERATORS = frozenset({
+    'DOES_NOT_EXACTLY_MATCH', 'DOES_NOT_EQUAL', 'NOT_EQUAL', 'IS_NOT', 'NOT_IN', 'DOES_NOT_CONTAIN',
+})
+RANGE_OPERATOR_PREFIXES = ('GREATER_', 'LESS_')
+
+
+def is_policy_attribute(attribute):
+    # matches labels.policyIds, labels.policyId, accumulations.policyIds, etc.
+    return 'policyid' in (attribute or '').lower()
+
+
+def policy_ids_in(values):
+    """Every run of digits in the values, normalised ('007' -> '7')."""
+    ids = set()
+    for v in values or []:
+        for tok in POLICY_ID_PATTERN.findall(str(v)):
+            ids.add(str(int(tok)))
+    return ids
+
+
+class Predicate:
+    __slots__ = ('attribute', 'operator', 'values')
+
+    def __init__(self, attribute, operator, values):
+        self.attribute = attribute
+        self.operator = (operator or '').upper()
+        self.values = tuple(values or ())
+
+    @classmethod
+    def parse(cls, raw):
+        return cls(raw.get('attribute'), raw.get('operator'), raw.get('values'))
+
+    @property
+    def targets_policy(self):
+        return is_policy_attribute(self.attribute)
+
+    @property
+    def excludes(self):
+        return self.operator in EXCLUDE_OPERATORS
+
+    @property
+    def includes(self):
+        # No operator at all is an include, as the exporter always treated it
+        return not self.excludes and not self.operator.startswith(RANGE_OPERATOR_PREFIXES)
+
+    def __repr__(self):
+        return f'Predicate({self.attribute!r}, {self.operator!r}, {list(self.values)!r})'
+
+
+class WorkflowRecord:
+    """
+    A workflow with its issuesFilter parsed once. policy_ids and excluded_ids
+    are frozensets of ID strings; excludes_only is True when the policy
+    predicates only exclude, i.e. the workflow routes all other policies.
+    """
+
+    __slots__ = ('account_id', 'workflow_id', 'updated_at', 'predicates', 'policy_ids', 'excluded_ids',
+                 'excludes_only')
+
+    def __init__(self, account_id, workflow_id, updated_at, predicates):
+        self.account_id = account_id
+        self.workflow_id = workflow_id
+        self.updated_at = updated_at
+        self.predicates = predicates
+        included, excluded = set(), set()
+        has_include = has_exclude = False
+        for pred in predicates:
+            if not pred.targets_policy:
+                continue
+            if pred.excludes:
+                has_exclude = True
+                excluded |= policy_ids_in(pred.values)
+            elif pred.includes:
+                has_include = True
+                included |= policy_ids_in(pred.values)
+        self.policy_ids = frozenset(included - excluded)
+        self.excluded_ids = frozenset(excluded)
+        self.excludes_only = has_exclude and not has_include
+
+    @classmethod
+    def from_workflow(cls, workflow):
+        raw = (workflow.get('issuesFilter') or {}).get('predicates') or []
+        if isinstance(raw, dict):
+            raw = [raw]
+        predicates = tuple(Predicate.parse(p) for p in raw if isinstance(p, dict))
+        return cls(str(workflow.get('accountId')), workflow.get('id'), workflow.get('updatedAt'), predicates)
+
+
+class WorkflowIndex:
+    """
+    Per-run cache of WorkflowRecords keyed by (accountId, workflowId).
+    A workflow whose updatedAt changed is parsed again; workflows without an
+    id are parsed every time rather than risk sharing a key.
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+        self.parsed = 0
+
+    def record(self, workflow):
+        workflow_id = workflow.get('id')
+        if workflow_id is None:
+            return WorkflowRecord.from_workflow(workflow)
+        key = (str(workflow.get('accountId')), str(workflow_id))
+        with self._lock:
+            cached = self._records.get(key)
+        if cached is not None and cached.updated_at == workflow.get('updatedAt'):
+            return cached
+        record = WorkflowRecord.from_workflow(workflow)
+        with self._lock:
+            self._records[key] = record
+            self.parsed += 1
+        return record
+
+    def add_all(self, workflows):
+        """Parse a batch of workflows up front (the one-time preprocessing pass)."""
+        for wf in workflows:
+            self.record(wf)
+
+    def policy_ids(self, workflow):
+        return self.record(workflow).policy_ids
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()